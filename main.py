@@ -1,12 +1,55 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, g, jsonify, request, stream_with_context
 from flask_cors import CORS
 import openai
 import json
 import os
+import ast
+import asyncio
+import atexit
+import bisect
+import glob
+import gzip
+import hashlib
+import heapq
+import itertools
+import math
+import queue
+import re
+import shutil
+import signal
+import socket
+import sqlite3
+import subprocess
+import tempfile
 import time
 import random
-from typing import List, Dict, Any
+import sys
+import threading
+import uuid
+import zlib
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import List, Dict, Any, Iterable, Iterator
 from dotenv import load_dotenv
+from sandbox_runner import grade_output
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 # Load environment variables
 load_dotenv()
@@ -18,10 +61,990 @@ CORS(app)
 class Config:
     OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
     OPENAI_MODEL = os.getenv('OPENAI_MODEL', 'gpt-3.5-turbo')
+    OPENAI_PROBE_INTERVAL = int(os.getenv('OPENAI_PROBE_INTERVAL', '60'))
+    OPENAI_PROBE_TIMEOUT = int(os.getenv('OPENAI_PROBE_TIMEOUT', '10'))
+    OPENAI_API_BASE = os.getenv('OPENAI_API_BASE')
+    OPENAI_ASYNC = os.getenv('OPENAI_ASYNC', 'true').lower() == 'true'
+    OPENAI_HTTP_POOL_SIZE = int(os.getenv('OPENAI_HTTP_POOL_SIZE', '100'))
+    OPENAI_CALL_TIMEOUT = float(os.getenv('OPENAI_CALL_TIMEOUT', '30'))
+    OPENAI_LATENCY_BUDGET = float(os.getenv('OPENAI_LATENCY_BUDGET', '45'))
+    OPENAI_MAX_RETRIES = int(os.getenv('OPENAI_MAX_RETRIES', '2'))
+    OPENAI_RETRY_BASE_DELAY = float(os.getenv('OPENAI_RETRY_BASE_DELAY', '0.5'))
+    OPENAI_RETRY_MAX_DELAY = float(os.getenv('OPENAI_RETRY_MAX_DELAY', '4'))
+    OPENAI_BREAKER_FAILURES = int(os.getenv('OPENAI_BREAKER_FAILURES', '5'))
+    OPENAI_BREAKER_RESET_SECONDS = float(os.getenv('OPENAI_BREAKER_RESET_SECONDS', '30'))
+    OPENAI_BREAKER_HALF_OPEN_CALLS = int(os.getenv('OPENAI_BREAKER_HALF_OPEN_CALLS', '1'))
     SUPPORTED_LANGUAGES = ['python', 'java', 'javascript', 'cpp', 'csharp']
+    DEFAULT_LANGUAGE = 'python'
+    MAX_QUESTION_LEVEL = 10
+    CACHE_DEFAULT_TIMEOUT = int(os.getenv('CACHE_DEFAULT_TIMEOUT', '300'))
+    CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', '2000'))
+    CACHE_MAX_BYTES = int(os.getenv('CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+    CACHE_L1_TIMEOUT = int(os.getenv('CACHE_L1_TIMEOUT', '60'))
+    # Stale-while-revalidate applies to concepts only: a stale concept is served while it is regenerated
+    # in the background. Questions are never refreshed (learners are graded against what they were shown);
+    # they are only kept, and served, for up to CACHE_DEFAULT_TIMEOUT + CACHE_MAX_STALE seconds.
+    CACHE_MAX_STALE = int(os.getenv('CACHE_MAX_STALE', str(7 * 24 * 3600)))
+    FALLBACK_CACHE_TTL = int(os.getenv('FALLBACK_CACHE_TTL', '60'))
+    RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', '2000'))
+    RESPONSE_CACHE_MAX_BYTES = int(os.getenv('RESPONSE_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+    RESPONSE_COMPRESS_MIN_BYTES = int(os.getenv('RESPONSE_COMPRESS_MIN_BYTES', '1024'))
+    RESPONSE_GZIP_LEVEL = int(os.getenv('RESPONSE_GZIP_LEVEL', '6'))
+    RESPONSE_BROTLI_QUALITY = int(os.getenv('RESPONSE_BROTLI_QUALITY', '5'))
+    REFRESH_MAX_WORKERS = int(os.getenv('REFRESH_MAX_WORKERS', '2'))
+    PREFETCH_ENABLED = os.getenv('PREFETCH_ENABLED', 'true').lower() == 'true'
+    PREFETCH_DEPTH = int(os.getenv('PREFETCH_DEPTH', '2'))
+    PREFETCH_QUEUE_SIZE = int(os.getenv('PREFETCH_QUEUE_SIZE', '100'))
+    PREFETCH_WORKERS = int(os.getenv('PREFETCH_WORKERS', '1'))
+    QUESTION_BATCH_SIZE = int(os.getenv('QUESTION_BATCH_SIZE', '3'))
+    QUESTION_POOL_SIZE = int(os.getenv('QUESTION_POOL_SIZE', '5'))
+    QUESTION_POOL_MAX_SIZE = int(os.getenv('QUESTION_POOL_MAX_SIZE', '20'))
+    QUESTION_POOL_LOW_WATER = int(os.getenv('QUESTION_POOL_LOW_WATER', '2'))
+    QUESTION_POOL_WORKERS = int(os.getenv('QUESTION_POOL_WORKERS', '1'))
+    QUESTION_POOL_TRACKED_USERS = int(os.getenv('QUESTION_POOL_TRACKED_USERS', '100000'))
+    QUESTION_POOL_DUPLICATE_THRESHOLD = float(os.getenv('QUESTION_POOL_DUPLICATE_THRESHOLD', '0.6'))
+    QUESTION_POOL_RETRY_SECONDS = int(os.getenv('QUESTION_POOL_RETRY_SECONDS', '300'))
+    EXECUTION_POOL_SIZE = int(os.getenv('EXECUTION_POOL_SIZE', '2'))
+    EXECUTION_MAX_CONCURRENCY = int(os.getenv('EXECUTION_MAX_CONCURRENCY', '4'))
+    EXECUTION_CPU_SECONDS = int(os.getenv('EXECUTION_CPU_SECONDS', '10'))
+    EXECUTION_MEMORY_MB = int(os.getenv('EXECUTION_MEMORY_MB', '256'))
+    EXECUTION_TEST_SECONDS = float(os.getenv('EXECUTION_TEST_SECONDS', '2'))
+    EXECUTION_WALL_SECONDS = float(os.getenv('EXECUTION_WALL_SECONDS', '20'))
+    # Threads count as processes; the process cap is per user, so it is only set for isolated sandboxes
+    EXECUTION_MAX_PROCESSES = int(os.getenv('EXECUTION_MAX_PROCESSES', '64'))
+    EXECUTION_MAX_OPEN_FILES = int(os.getenv('EXECUTION_MAX_OPEN_FILES', '256'))
+    # Without namespaces the server's files stay readable and a program's setsid() children outlive
+    # the timeout kill until their own CPU limit ends them
+    SANDBOX_NAMESPACES = os.getenv('SANDBOX_NAMESPACES', 'true').lower() == 'true'
+    # Only used when the server runs as root: sandboxes switch to this uid (and the same gid)
+    SANDBOX_UID = int(os.getenv('SANDBOX_UID', '65534'))
+    SANDBOX_HIDDEN_PATHS = [os.path.dirname(os.path.abspath(__file__))] + \
+        [path for path in os.getenv('SANDBOX_HIDDEN_PATHS', '').split(os.pathsep) if path]
+    PROFILE_ENABLED = os.getenv('PROFILE_ENABLED', 'true').lower() == 'true'
+    PROFILE_BUDGET_SECONDS = float(os.getenv('PROFILE_BUDGET_SECONDS', '3'))
+    PROFILE_MAX_SIZE = int(os.getenv('PROFILE_MAX_SIZE', '100000'))
+    SUBMISSION_CACHE_MAX_ENTRIES = int(os.getenv('SUBMISSION_CACHE_MAX_ENTRIES', '5000'))
+    SUBMISSION_CACHE_MAX_BYTES = int(os.getenv('SUBMISSION_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+    SUBMISSION_CACHE_TTL = int(os.getenv('SUBMISSION_CACHE_TTL', '3600'))
+    # Analyses with a measured complexity depend on timings, so they are re-measured sooner
+    SUBMISSION_PROFILED_CACHE_TTL = int(os.getenv('SUBMISSION_PROFILED_CACHE_TTL', '300'))
+    BULK_GRADE_WORKERS = int(os.getenv('BULK_GRADE_WORKERS', os.getenv('EXECUTION_MAX_CONCURRENCY', '4')))
+    BULK_GRADE_MAX_IN_FLIGHT = int(os.getenv('BULK_GRADE_MAX_IN_FLIGHT', '0'))
+    BULK_GRADE_MAX_LINE_BYTES = int(os.getenv('BULK_GRADE_MAX_LINE_BYTES', str(256 * 1024)))
+    COMPILE_CACHE_DIR = os.getenv('COMPILE_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'algolearn-compile-cache'))
+    COMPILE_CACHE_MAX_ENTRIES = int(os.getenv('COMPILE_CACHE_MAX_ENTRIES', '500'))
+    COMPILE_TIMEOUT = int(os.getenv('COMPILE_TIMEOUT', '30'))
+    GENERATION_MAX_CONCURRENCY = int(os.getenv('GENERATION_MAX_CONCURRENCY', '4'))
+    GENERATION_REQUESTS_PER_MINUTE = int(os.getenv('GENERATION_REQUESTS_PER_MINUTE', '60'))
+    GENERATION_TOKENS_PER_MINUTE = int(os.getenv('GENERATION_TOKENS_PER_MINUTE', '90000'))
+    GENERATION_BACKGROUND_SHARE = float(os.getenv('GENERATION_BACKGROUND_SHARE', '0.75'))
+    GENERATION_LEASE_TTL = int(os.getenv('GENERATION_LEASE_TTL', '120'))
+    GENERATION_WAIT_TIMEOUT = int(os.getenv('GENERATION_WAIT_TIMEOUT', '90'))
+    GENERATION_POLL_INTERVAL = float(os.getenv('GENERATION_POLL_INTERVAL', '0.25'))
+    PRELOAD_MAX_WORKERS = int(os.getenv('PRELOAD_MAX_WORKERS', '4'))
+    PRELOAD_RATE_PER_MINUTE = int(os.getenv('PRELOAD_RATE_PER_MINUTE', '60'))
+    PRELOAD_JOB_TTL = int(os.getenv('PRELOAD_JOB_TTL', '3600'))
+    CONTENT_STORE_PATH = os.getenv('CONTENT_STORE_PATH', 'content_store.db')
+    CONTENT_STORE_WARM_START = os.getenv('CONTENT_STORE_WARM_START', 'true').lower() == 'true'
+    CONTENT_SNAPSHOT_PATH = os.getenv('CONTENT_SNAPSHOT_PATH')
+    ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
+    REDIS_URL = os.getenv('REDIS_URL')
+    REDIS_KEY_PREFIX = os.getenv('REDIS_KEY_PREFIX', 'algolearn:')
+
+
+class PhaseTimer:
+    """Context manager timing one phase; a plain class because phases wrap microsecond cache hits"""
+
+    __slots__ = ('metrics', 'labels', 'started')
+
+    def __init__(self, metrics: 'Metrics', labels: tuple):
+        self.metrics = metrics
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe('phase_duration_seconds', time.perf_counter() - self.started, self.labels)
+        return False
+
+
+class Metrics:
+    """In-process counters and latency histograms, rendered in the Prometheus text format
+
+    Values are per process: under gunicorn each worker reports its own series, so scrape every
+    worker (or aggregate them) for the full picture. Collectors registered with add_collector are
+    called at scrape time to export counters that other components already keep.
+    """
+
+    PREFIX = 'algolearn_'
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+    DESCRIPTIONS = {
+        'http_request_duration_seconds': 'Time to produce a response (through the last byte for streams)',
+        'phase_duration_seconds': 'Time spent in each phase of serving content',
+        'llm_requests_total': 'LLM request attempts by outcome',
+        'llm_errors_total': 'Failed LLM request attempts by error type',
+        'llm_tokens_total': 'LLM tokens used (estimated for streamed completions)'
+    }
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.collectors = []
+
+    def inc(self, name: str, labels: tuple = (), value: float = 1):
+        with self.lock:
+            self.counters[(name, labels)] = self.counters.get((name, labels), 0) + value
+
+    def observe(self, name: str, seconds: float, labels: tuple = ()):
+        index = bisect.bisect_left(self.BUCKETS, seconds)
+        with self.lock:
+            series = self.histograms.get((name, labels))
+            if series is None:
+                # One count per bucket plus +Inf, then the running sum
+                series = self.histograms[(name, labels)] = [0] * (len(self.BUCKETS) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += seconds
+
+    def phase(self, name: str) -> 'PhaseTimer':
+        return PhaseTimer(self, (('phase', name),))
+
+    def add_collector(self, collect):
+        """Register collect() -> iterable of (name, type, labels, value) samples read at scrape time"""
+        self.collectors.append(collect)
+
+    @staticmethod
+    def _labels(labels: tuple, extra: str = '') -> str:
+        parts = ['{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+                 for key, value in labels]
+        if extra:
+            parts.append(extra)
+        return '{' + ','.join(parts) + '}' if parts else ''
+
+    def _header(self, lines: List[str], name: str, kind: str):
+        if name in self.DESCRIPTIONS:
+            lines.append(f"# HELP {self.PREFIX}{name} {self.DESCRIPTIONS[name]}")
+        lines.append(f"# TYPE {self.PREFIX}{name} {kind}")
+
+    def render(self) -> str:
+        with self.lock:
+            counters = dict(self.counters)
+            histograms = {key: list(series) for key, series in self.histograms.items()}
+
+        samples = {}
+        for (name, labels), value in counters.items():
+            samples.setdefault((name, 'counter'), []).append((labels, value))
+        for collect in self.collectors:
+            try:
+                for name, kind, labels, value in collect():
+                    samples.setdefault((name, kind), []).append((labels, value))
+            except Exception as e:
+                print(f"❌ Metrics collector failed: {e}")
+
+        lines = []
+        for (name, kind), series in sorted(samples.items()):
+            self._header(lines, name, kind)
+            lines.extend(f"{self.PREFIX}{name}{self._labels(labels)} {value}" for labels, value in sorted(series))
+
+        by_name = {}
+        for (name, labels), series in histograms.items():
+            by_name.setdefault(name, []).append((labels, series))
+        for name, all_series in sorted(by_name.items()):
+            self._header(lines, name, 'histogram')
+            for labels, series in sorted(all_series):
+                cumulative = 0
+                for bound, count in zip(self.BUCKETS + ('+Inf',), series):
+                    cumulative += count
+                    bucket_labels = self._labels(labels, 'le="{}"'.format(bound))
+                    lines.append(f"{self.PREFIX}{name}_bucket{bucket_labels} {cumulative}")
+                lines.append(f"{self.PREFIX}{name}_sum{self._labels(labels)} {round(series[-1], 6)}")
+                lines.append(f"{self.PREFIX}{name}_count{self._labels(labels)} {cumulative}")
+        return '\n'.join(lines) + '\n'
+
+
+class ConnectionMonitor:
+    """Periodically probes the LLM provider in the background and publishes a cached status"""
+
+    def __init__(self, probe, interval: int, enabled: bool = True):
+        self.probe = probe
+        self.interval = max(interval, 1)
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+        # Optimistic until the first probe completes, so cold starts do not fall back needlessly
+        self._status = {
+            'connected': enabled,
+            'last_checked': None,
+            'latency_ms': None,
+            'last_error': None,
+            'source': 'initial'
+        }
+
+    def start(self):
+        """Start the probe thread (restarted after a fork, e.g. in gunicorn workers)"""
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='openai-connection-monitor', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            if not self._recently_confirmed():
+                self.refresh()
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+
+    def _recently_confirmed(self) -> bool:
+        """A successful real API call within the interval already proves the provider is up"""
+        with self._lock:
+            status = self._status
+            return (status['source'] == 'request' and status['connected']
+                    and status['last_checked'] is not None and time.time() - status['last_checked'] < self.interval)
+
+    def refresh(self) -> bool:
+        """Run one probe synchronously and publish the result"""
+        if not self.enabled:
+            self.record(False, None, 'not configured', source='probe')
+            return False
+        started = time.perf_counter()
+        try:
+            ok = bool(self.probe())
+            error = None if ok else 'probe failed'
+        except Exception as e:
+            ok, error = False, str(e)
+        self.record(ok, (time.perf_counter() - started) * 1000, error, source='probe')
+        return ok
+
+    def record(self, connected: bool, latency_ms=None, error=None, source: str = 'request'):
+        """Publish an observed outcome, either from a probe or from a real API call"""
+        with self._lock:
+            self._status = {
+                'connected': connected,
+                'last_checked': time.time(),
+                'latency_ms': round(latency_ms, 1) if latency_ms is not None else None,
+                'last_error': error,
+                'source': source
+            }
+
+    def request_refresh(self):
+        """Ask the background thread to probe again without waiting for the interval"""
+        self.start()
+        self._wakeup.set()
+
+    def is_connected(self) -> bool:
+        self.start()
+        return self._status['connected']
+
+    def get_status(self) -> Dict[str, Any]:
+        self.start()
+        with self._lock:
+            status = dict(self._status)
+        status['probe_interval'] = self.interval
+        return status
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency while its circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """Stops calling a failing dependency, then lets a few half-open trial calls decide when to resume"""
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, name: str, failure_threshold: int = None, reset_timeout: float = None,
+                 half_open_calls: int = None):
+        self.name = name
+        self.failure_threshold = failure_threshold or Config.OPENAI_BREAKER_FAILURES
+        self.reset_timeout = reset_timeout if reset_timeout is not None else Config.OPENAI_BREAKER_RESET_SECONDS
+        self.half_open_calls = half_open_calls or Config.OPENAI_BREAKER_HALF_OPEN_CALLS
+        self.lock = threading.Lock()
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.trials = 0
+        self.transitions = deque(maxlen=20)
+        self.stats = {'successes': 0, 'failures': 0, 'rejected': 0, 'opened': 0}
+
+    def _transition(self, state: str, reason: str):
+        print(f"🔌 {self.name} circuit {self.state} → {state}: {reason}")
+        self.transitions.append({'from': self.state, 'to': state, 'at': time.time(), 'reason': reason})
+        self.state = state
+        self.trials = 0
+        if state == self.OPEN:
+            self.opened_at = time.time()
+            self.stats['opened'] += 1
+        elif state == self.CLOSED:
+            self.consecutive_failures = 0
+
+    def _current_state(self) -> str:
+        if self.state == self.OPEN and time.time() - self.opened_at >= self.reset_timeout:
+            self._transition(self.HALF_OPEN, f"{self.reset_timeout:g}s cool-down elapsed")
+        return self.state
+
+    def allow(self) -> bool:
+        """Whether a call may go out now; half-open admits only a limited number of trial calls"""
+        with self.lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and self.trials < self.half_open_calls:
+                self.trials += 1
+                return True
+            self.stats['rejected'] += 1
+            return False
+
+    def is_open(self) -> bool:
+        with self.lock:
+            return self._current_state() == self.OPEN
+
+    def cancel_trial(self):
+        """Hand back a slot taken by allow() for a call that was never made"""
+        with self.lock:
+            if self.state == self.HALF_OPEN and self.trials > 0:
+                self.trials -= 1
+
+    def record_success(self):
+        with self.lock:
+            self.stats['successes'] += 1
+            self.consecutive_failures = 0
+            if self.state == self.HALF_OPEN:
+                self._transition(self.CLOSED, 'trial call succeeded')
+
+    def record_failure(self, error: str):
+        with self.lock:
+            self.stats['failures'] += 1
+            self.consecutive_failures += 1
+            if self.state == self.HALF_OPEN:
+                self._transition(self.OPEN, f"trial call failed: {error}")
+            elif self.state == self.CLOSED and self.consecutive_failures >= self.failure_threshold:
+                self._transition(self.OPEN, f"{self.consecutive_failures} consecutive failures, last: {error}")
+
+    def get_status(self) -> Dict[str, Any]:
+        with self.lock:
+            state = self._current_state()
+            return {
+                'state': state,
+                'consecutive_failures': self.consecutive_failures,
+                'failure_threshold': self.failure_threshold,
+                'retry_in': round(max(0.0, self.opened_at + self.reset_timeout - time.time()), 1)
+                if state == self.OPEN else None,
+                **self.stats,
+                'transitions': list(self.transitions)
+            }
+
+
+class GenerationQueueTimeout(Exception):
+    """Raised when an LLM call waits longer than its deadline for scheduler capacity"""
+
+
+class GenerationScheduler:
+    """Admits LLM calls under a global concurrency cap and requests/tokens-per-minute budgets
+
+    Waiting calls are served strictly by priority class (interactive > prefetch > preload), FIFO
+    within a class. Background classes may only use a share of the capacity, so an interactive
+    request always finds headroom. The class of a call comes from the calling thread (see priority()).
+    """
+
+    INTERACTIVE, PREFETCH, PRELOAD = 'interactive', 'prefetch', 'preload'
+    RANKS = {INTERACTIVE: 0, PREFETCH: 1, PRELOAD: 2}
+    WINDOW_SECONDS = 60.0
+
+    class _Ticket:
+        __slots__ = ('rank', 'seq', 'tokens', 'entry', 'thread', 'cancelled')
+
+        def __init__(self, rank: int, seq: int, tokens: int):
+            self.rank = rank
+            self.seq = seq
+            self.tokens = tokens
+            self.entry = None
+            self.thread = threading.get_ident()
+            self.cancelled = False
+
+    def __init__(self, max_concurrency: int = None, requests_per_minute: int = None, tokens_per_minute: int = None,
+                 background_share: float = None):
+        self.max_concurrency = max_concurrency or Config.GENERATION_MAX_CONCURRENCY
+        self.requests_per_minute = requests_per_minute if requests_per_minute is not None \
+            else Config.GENERATION_REQUESTS_PER_MINUTE
+        self.tokens_per_minute = tokens_per_minute if tokens_per_minute is not None \
+            else Config.GENERATION_TOKENS_PER_MINUTE
+        self.background_share = background_share if background_share is not None \
+            else Config.GENERATION_BACKGROUND_SHARE
+        self.condition = threading.Condition()
+        self.heap = []
+        self.seq = itertools.count()
+        self.running = {rank: 0 for rank in self.RANKS.values()}
+        self.waiting = {}
+        # Admitted calls in the last minute as [started_at, tokens]; tokens are corrected on release
+        self.window = deque()
+        self.local = threading.local()
+        self.stats = {name: {'admitted': 0, 'timed_out': 0, 'wait_ms': 0.0} for name in self.RANKS}
+        self.stats['boosted'] = 0
+
+    @contextmanager
+    def priority(self, name: str):
+        """Run the enclosed LLM calls of this thread in the given priority class"""
+        previous = getattr(self.local, 'priority', self.INTERACTIVE)
+        self.local.priority = name
+        try:
+            yield
+        finally:
+            self.local.priority = previous
+
+    def current_priority(self) -> str:
+        return getattr(self.local, 'priority', self.INTERACTIVE)
+
+    def _limits(self, rank: int) -> tuple:
+        share = 1.0 if rank == self.RANKS[self.INTERACTIVE] else self.background_share
+        concurrency = self.max_concurrency if share >= 1 else max(1, int(self.max_concurrency * share))
+        return concurrency, self.requests_per_minute * share, self.tokens_per_minute * share
+
+    def _trim_window(self, now: float):
+        while self.window and now - self.window[0][0] >= self.WINDOW_SECONDS:
+            self.window.popleft()
+
+    def _admissible(self, ticket: '_Ticket', now: float) -> bool:
+        concurrency, rpm, tpm = self._limits(ticket.rank)
+        if sum(self.running.values()) >= self.max_concurrency:
+            return False
+        # Background classes together stay within their share of the slots
+        if ticket.rank > 0 and sum(count for rank, count in self.running.items() if rank > 0) >= concurrency:
+            return False
+        if rpm > 0 and len(self.window) + 1 > rpm:
+            return False
+        # A single call larger than the whole budget is admitted alone rather than never
+        if tpm > 0 and self.window and sum(entry[1] for entry in self.window) + ticket.tokens > tpm:
+            return False
+        return True
+
+    def _head(self):
+        while self.heap:
+            rank, seq, ticket = self.heap[0]
+            if ticket.cancelled or rank != ticket.rank:
+                heapq.heappop(self.heap)
+                continue
+            return ticket
+        return None
+
+    def acquire(self, tokens: int, timeout: float = None) -> '_Ticket':
+        """Block until this call may start; raises GenerationQueueTimeout after timeout seconds"""
+        name = self.current_priority()
+        ticket = self._Ticket(self.RANKS[name], next(self.seq), tokens)
+        started = time.monotonic()
+        deadline = started + timeout if timeout is not None else None
+        with self.condition:
+            heapq.heappush(self.heap, (ticket.rank, ticket.seq, ticket))
+            self.waiting[ticket.thread] = ticket
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._trim_window(now)
+                    if self._head() is ticket and self._admissible(ticket, now):
+                        heapq.heappop(self.heap)
+                        break
+                    if deadline is not None and now >= deadline:
+                        ticket.cancelled = True
+                        self.stats[name]['timed_out'] += 1
+                        self.condition.notify_all()
+                        raise GenerationQueueTimeout(f'No generation capacity within {timeout:.1f}s')
+                    # Budget frees up as the oldest call leaves the window; releases notify earlier
+                    wake = self.window[0][0] + self.WINDOW_SECONDS - now if self.window else None
+                    if deadline is not None:
+                        wake = min(wake, deadline - now) if wake is not None else deadline - now
+                    self.condition.wait(wake)
+            finally:
+                self.waiting.pop(ticket.thread, None)
+            ticket.entry = [now, tokens]
+            self.window.append(ticket.entry)
+            self.running[ticket.rank] += 1
+            name = next(key for key, rank in self.RANKS.items() if rank == ticket.rank)
+            self.stats[name]['admitted'] += 1
+            self.stats[name]['wait_ms'] += (time.monotonic() - started) * 1000
+            # The next ticket in line may be admissible too
+            self.condition.notify_all()
+        return ticket
+
+    def release(self, ticket: '_Ticket', tokens_used: int = None):
+        """Finish a call, replacing its token estimate with the actual usage when known"""
+        with self.condition:
+            self.running[ticket.rank] -= 1
+            if tokens_used is not None:
+                ticket.entry[1] = tokens_used
+            self.condition.notify_all()
+
+    def boost(self, thread_id: int):
+        """Raise a queued call to the current thread's priority (a waiter on its result is more urgent)"""
+        rank = self.RANKS[self.current_priority()]
+        with self.condition:
+            ticket = self.waiting.get(thread_id)
+            if ticket is None or ticket.rank <= rank:
+                return
+            ticket.rank = rank
+            heapq.heappush(self.heap, (ticket.rank, ticket.seq, ticket))
+            self.stats['boosted'] += 1
+            self.condition.notify_all()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self.condition:
+            self._trim_window(time.monotonic())
+            names = {rank: name for name, rank in self.RANKS.items()}
+            return {
+                'max_concurrency': self.max_concurrency,
+                'running': {names[rank]: count for rank, count in self.running.items()},
+                'queued': sum(1 for _, _, ticket in self.heap if not ticket.cancelled),
+                'requests_last_minute': len(self.window),
+                'tokens_last_minute': sum(entry[1] for entry in self.window),
+                'requests_per_minute': self.requests_per_minute,
+                'tokens_per_minute': self.tokens_per_minute,
+                **{name: dict(self.stats[name]) for name in self.RANKS},
+                'boosted': self.stats['boosted']
+            }
+
+
+class AsyncLLMClient:
+    """Runs OpenAI's async client on one background event loop with a pooled aiohttp session
+
+    Calls from any thread are multiplexed over the loop and a bounded keep-alive connection pool,
+    instead of each blocking request opening its own connection. Deadlines are hard: a call that
+    overruns is cancelled on the loop, not left reading from a slow socket.
+    """
+
+    def __init__(self, pool_size: int = None):
+        self.pool_size = pool_size or Config.OPENAI_HTTP_POOL_SIZE
+        self.lock = threading.Lock()
+        self.loop = None
+        self.session = None
+        self.thread = None
+        self.pid = None
+        self.stats = {'calls': 0, 'streams': 0, 'timeouts': 0, 'in_flight': 0}
+
+    @staticmethod
+    def available() -> bool:
+        return aiohttp is not None and hasattr(openai.ChatCompletion, 'acreate')
+
+    def _ensure_loop(self):
+        """Start the loop thread (restarted after a fork, e.g. in gunicorn workers)"""
+        with self.lock:
+            if self.thread is not None and self.thread.is_alive() and self.pid == os.getpid():
+                return self.loop
+            self.pid = os.getpid()
+            self.loop = asyncio.new_event_loop()
+            ready = threading.Event()
+            self.thread = threading.Thread(target=self._run, args=(self.loop, ready), name='openai-async-loop',
+                                           daemon=True)
+            self.thread.start()
+            ready.wait()
+            atexit.register(self.close)
+            return self.loop
+
+    def close(self):
+        """Close the pooled session so connections are not left half-open at exit"""
+        if self.session is not None and self.pid == os.getpid() and self.loop.is_running():
+            try:
+                asyncio.run_coroutine_threadsafe(self.session.close(), self.loop).result(2)
+            except Exception:
+                pass
+
+    def _run(self, loop, ready: threading.Event):
+        asyncio.set_event_loop(loop)
+        self.session = loop.run_until_complete(self._open_session())
+        ready.set()
+        loop.run_forever()
+
+    async def _open_session(self):
+        return aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.pool_size))
+
+    async def _in_session(self, make):
+        # openai 0.28 reads the session from a context variable; otherwise it opens one per call
+        openai.aiosession.set(self.session)
+        return await make()
+
+    def _wait(self, coroutine, timeout: float):
+        future = asyncio.run_coroutine_threadsafe(asyncio.wait_for(coroutine, timeout), self._ensure_loop())
+        with self.lock:
+            self.stats['in_flight'] += 1
+        try:
+            return future.result(timeout + 1)
+        except (asyncio.TimeoutError, FutureTimeoutError):
+            future.cancel()
+            with self.lock:
+                self.stats['timeouts'] += 1
+            raise TimeoutError(f'OpenAI call exceeded {timeout:.1f}s')
+        finally:
+            with self.lock:
+                self.stats['in_flight'] -= 1
+
+    def call(self, make, timeout: float):
+        """Run the coroutine returned by make() on the loop, waiting at most timeout seconds"""
+        self._ensure_loop()
+        with self.lock:
+            self.stats['calls'] += 1
+        return self._wait(self._in_session(make), timeout)
+
+    def stream(self, make, timeout: float, idle_timeout: float):
+        """Iterate an async stream made by make(): timeout covers opening it, idle_timeout each chunk"""
+        self._ensure_loop()
+        with self.lock:
+            self.stats['streams'] += 1
+        chunks = self._wait(self._in_session(make), timeout)
+        try:
+            while True:
+                try:
+                    yield self._wait(chunks.__anext__(), idle_timeout)
+                except StopAsyncIteration:
+                    return
+        finally:
+            asyncio.run_coroutine_threadsafe(chunks.aclose(), self.loop)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {**self.stats, 'pool_size': self.pool_size}
+
+
+class StreamingJSONFieldParser:
+    """Picks completed top-level string fields out of a JSON object while its text is still streaming"""
+
+    def __init__(self, fields: List[str]):
+        self.fields = set(fields)
+        self.buffer = ''
+        self.pos = 0
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.string_start = 0
+        self.key = None
+        self.expect_value = False
+
+    def feed(self, text: str) -> List[tuple]:
+        """Consume more text, returning (field, value) pairs that became complete"""
+        self.buffer += text
+        found = []
+        while self.pos < len(self.buffer):
+            ch = self.buffer[self.pos]
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == '\\':
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+                    if self.depth == 1:
+                        value = json.loads(self.buffer[self.string_start:self.pos + 1])
+                        if self.expect_value:
+                            if self.key in self.fields:
+                                self.fields.discard(self.key)
+                                found.append((self.key, value))
+                            self.expect_value = False
+                        else:
+                            self.key = value
+            elif ch == '"':
+                self.in_string = True
+                self.string_start = self.pos
+            elif ch in '{[':
+                self.depth += 1
+                if self.depth > 1:
+                    self.expect_value = False
+            elif ch in '}]':
+                self.depth -= 1
+            elif ch == ':' and self.depth == 1:
+                self.expect_value = True
+            elif ch == ',' and self.depth == 1:
+                self.expect_value = False
+            self.pos += 1
+        return found
+
+
+class JSONSchema:
+    """Required fields and their types, compiled once into plain checks
+
+    A spec is a type (or tuple of types), a dict of field name to spec for an object with those
+    required fields, or a one-item list [spec] for a non-empty list whose items match spec.
+    """
+
+    def __init__(self, fields: Dict[str, Any]):
+        self.fields = list(fields)
+        self.field_checks = [(name, self._compile(spec)) for name, spec in fields.items()]
+        self.item_checks = {name: self._compile(spec[0]) for name, spec in fields.items() if isinstance(spec, list)}
+
+    @classmethod
+    def _compile(cls, spec):
+        if isinstance(spec, dict):
+            checks = [(name, cls._compile(sub)) for name, sub in spec.items()]
+
+            def check_object(value, path):
+                if not isinstance(value, dict):
+                    return [f"{path} is not an object"]
+                errors = []
+                for name, check in checks:
+                    if name not in value:
+                        errors.append(f"{path}.{name} is missing")
+                    else:
+                        errors.extend(check(value[name], f"{path}.{name}"))
+                return errors
+
+            return check_object
+        if isinstance(spec, list):
+            check_item = cls._compile(spec[0])
+
+            def check_list(value, path):
+                if not isinstance(value, list) or not value:
+                    return [f"{path} is not a non-empty list"]
+                return [error for index, item in enumerate(value) for error in check_item(item, f"{path}[{index}]")]
+
+            return check_list
+
+        def check_type(value, path):
+            return [] if isinstance(value, spec) else [f"{path} has type {type(value).__name__}"]
+
+        return check_type
+
+    def drop_incomplete_items(self, value: Dict[str, Any]):
+        """Remove a malformed last item (typically cut off by truncation) from list fields with valid items left"""
+        for name, check_item in self.item_checks.items():
+            items = value.get(name)
+            if isinstance(items, list) and len(items) > 1 and check_item(items[-1], name):
+                items.pop()
+
+    def invalid_fields(self, value: Dict[str, Any]) -> List[str]:
+        """Top-level fields that are missing or malformed"""
+        return [name for name, check in self.field_checks if name not in value or check(value[name], name)]
+
+    def errors(self, value: Any) -> List[str]:
+        if not isinstance(value, dict):
+            return ['response is not an object']
+        with metrics.phase('validation'):
+            return [error for name, check in self.field_checks
+                    for error in (check(value[name], name) if name in value else [f"{name} is missing"])]
+
+
+class JSONExtractionError(ValueError):
+    pass
+
+
+class JSONExtractor:
+    """Recovers the JSON object in an LLM response that is fenced, wrapped in prose or cut off at max_tokens
+
+    Each response is tried as-is, then inside a markdown fence, then as the first balanced object in
+    the text. A truncated object is cut back to its last complete member and its open brackets are
+    closed, so a response that ran out of tokens keeps everything it finished saying.
+    """
+
+    FENCE_PATTERN = re.compile(r"```[a-zA-Z]*[ \t]*\n?(.*?)(?:```|$)", re.DOTALL)
+    TRAILING_COMMA_PATTERN = re.compile(r",\s*([}\]])")
+    CLOSERS = {'{': '}', '[': ']'}
+    # Cutting further back than this loses too much of the response to be worth keeping
+    MAX_REPAIR_ATTEMPTS = 16
+    MAX_START_ATTEMPTS = 8
+    RECOVERED = ('fenced', 'embedded', 'repaired')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stats = {'direct': 0, 'fenced': 0, 'embedded': 0, 'repaired': 0, 'unrecoverable': 0,
+                      'schema_invalid': 0, 'field_retries': 0, 'full_retries': 0, 'retry_recovered': 0}
+
+    def record(self, outcome: str):
+        with self.lock:
+            self.stats[outcome] += 1
+
+    def extract(self, text: str) -> Any:
+        """Return the first JSON value in text, recording how it had to be recovered"""
+        try:
+            with metrics.phase('json_parse'):
+                value, method = self.parse(text)
+        except JSONExtractionError:
+            self.record('unrecoverable')
+            raise
+        self.record(method)
+        return value
+
+    @classmethod
+    def parse(cls, text: str) -> tuple:
+        """Return (value, method), method being 'direct', 'fenced', 'embedded' or 'repaired'"""
+        text = (text or '').strip()
+        try:
+            return json.loads(text), 'direct'
+        except ValueError:
+            pass
+        fence = cls.FENCE_PATTERN.search(text)
+        if fence:
+            try:
+                return json.loads(fence.group(1).strip()), 'fenced'
+            except ValueError:
+                # The fence may have ended early at a ``` inside a string value; scan the whole text
+                pass
+
+        opener = '{' if '{' in text else '['
+        start = text.find(opener)
+        if start < 0:
+            raise JSONExtractionError('no JSON object in response')
+        # Prose before the object may contain braces of its own; skip balanced spans that are not JSON
+        for _ in range(cls.MAX_START_ATTEMPTS):
+            end, in_string, stack, cuts = cls._scan(text, start)
+            if end is None:
+                break
+            candidate = text[start:end]
+            try:
+                return json.loads(candidate), 'embedded'
+            except ValueError:
+                try:
+                    return json.loads(cls.TRAILING_COMMA_PATTERN.sub(r'\1', candidate)), 'repaired'
+                except ValueError:
+                    start = text.find(opener, start + 1)
+                    if start < 0:
+                        raise JSONExtractionError('no well-formed JSON object in response')
+        else:
+            raise JSONExtractionError('no well-formed JSON object in response')
+
+        # Truncated: first assume it stopped right after a complete value, then back off member by member
+        candidates = [] if in_string else [text[start:].rstrip().rstrip(',') + stack]
+        candidates += [text[start:cut] + closers for cut, closers in reversed(cuts[-cls.MAX_REPAIR_ATTEMPTS:])]
+        for candidate in candidates:
+            try:
+                return json.loads(candidate), 'repaired'
+            except ValueError:
+                continue
+        raise JSONExtractionError('truncated JSON object could not be repaired')
+
+    @classmethod
+    def _scan(cls, text: str, start: int) -> tuple:
+        """Find where the object opened at start ends
+
+        Returns (end, in_string, closers, cuts). end is None when the text stops first; closers then
+        closes every open bracket and cuts lists (position, closers) pairs for each earlier point
+        where the object could be cut and closed after a complete member.
+        """
+        stack, cuts = [], []
+        in_string = escape = False
+        for pos in range(start, len(text)):
+            ch = text[pos]
+            if in_string:
+                if escape:
+                    escape = False
+                elif ch == '\\':
+                    escape = True
+                elif ch == '"':
+                    in_string = False
+            elif ch == '"':
+                in_string = True
+            elif ch in '{[':
+                stack.append(cls.CLOSERS[ch])
+                cuts.append((pos + 1, ''.join(reversed(stack))))
+            elif ch in '}]':
+                stack.pop()
+                if not stack:
+                    return pos + 1, False, '', cuts
+            elif ch == ',':
+                cuts.append((pos, ''.join(reversed(stack))))
+        return None, in_string, ''.join(reversed(stack)), cuts
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self.lock:
+            stats = dict(self.stats)
+        recovered = sum(stats[method] for method in self.RECOVERED)
+        malformed = recovered + stats['unrecoverable']
+        return {**stats,
+                'recovery_rate': round(recovered / malformed, 3) if malformed else None,
+                'retry_success_rate': round(stats['retry_recovered'] / (stats['field_retries'] + stats['full_retries']), 3)
+                if stats['field_retries'] + stats['full_retries'] else None}
+
+
+class FallbackCatalog:
+    """Template content for every chapter, language and level, rendered once and then served by lookup
+
+    Entries are shared by every caller and must not be modified. Chapters outside the catalog are
+    rendered on demand. Everything served from here carries an is_fallback marker so caches can keep
+    it out of the shared and persistent tiers.
+    """
+
+    def __init__(self, render_concept, render_question, chapters: List[Dict], languages: List[str],
+                 levels: Iterable[int]):
+        started = time.perf_counter()
+        self.render_concept = lambda *args: self._mark(render_concept(*args))
+        self.render_question = lambda *args: self._mark(render_question(*args))
+        self.concepts = {(chapter['name'], language):
+                         self.render_concept(chapter['name'], chapter['topics'], language)
+                         for chapter in chapters for language in languages}
+        self.questions = {(chapter['name'], language, level):
+                          self.render_question(chapter['name'], chapter['topics'], language, level)
+                          for chapter in chapters for language in languages for level in levels}
+        self.build_ms = round((time.perf_counter() - started) * 1000, 1)
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'rendered': 0}
+
+    @staticmethod
+    def _mark(content: Dict[str, Any]) -> Dict[str, Any]:
+        content['is_fallback'] = True
+        return content
+
+    @staticmethod
+    def is_fallback(value: Any) -> bool:
+        """True for template content; questions stored before the marker existed are known by their id"""
+        return isinstance(value, dict) and (value.get('is_fallback') is True
+                                            or str(value.get('problem_id', '')).endswith('_fallback'))
+
+    def _count(self, hit: bool):
+        with self.lock:
+            self.stats['hits' if hit else 'rendered'] += 1
+
+    def concept(self, chapter_name: str, topics: List[str], language: str) -> Dict[str, Any]:
+        concept = self.concepts.get((chapter_name, language))
+        self._count(concept is not None)
+        if concept is not None:
+            return concept
+        # Served fallbacks are exported from these stats (fallbacks_served_total), not timed as a phase
+        return self.render_concept(chapter_name, topics, language)
+
+    def question(self, chapter_name: str, topics: List[str], language: str, level: int) -> Dict[str, Any]:
+        question = self.questions.get((chapter_name, language, level))
+        self._count(question is not None)
+        if question is not None:
+            return question
+        return self.render_question(chapter_name, topics, language, level)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {**self.stats, 'concepts': len(self.concepts), 'questions': len(self.questions),
+                    'build_ms': self.build_ms}
 
 
 class OpenAIService:
+    CONCEPT_SYSTEM_PROMPT = "You are an expert computer science educator creating comprehensive learning materials for data structures and algorithms."
+    QUESTION_SYSTEM_PROMPT = "You are an expert computer science educator creating coding problems for data structures and algorithms."
+
+    CONCEPT_SCHEMA = JSONSchema({
+        'title': str,
+        'overview': str,
+        'theory_content': str,
+        'learning_objectives': [str],
+        'code_examples': [{'code': str}],
+        'key_takeaways': [str]
+    })
+    QUESTION_SCHEMA = JSONSchema({
+        'level': int,
+        'problem_id': (str, int),
+        'title': str,
+        'description': str,
+        'examples': [{'input': object, 'output': object}],
+        'hints': [str],
+        'function_signature': str,
+        'test_cases': [{'input': object, 'expected_output': object}],
+        'solution': str,
+        'solution_explanation': str,
+        'time_complexity': str,
+        'space_complexity': str
+    })
+    JSON_ONLY_REMINDER = ("\n\n        Respond with the raw JSON object only: no markdown fences and no commentary. "
+                          "Keep every string concise so the complete object fits in the response.")
+    FIELD_COMPLETION_MAX_TOKENS = 800
+
     def __init__(self):
         self.api_key = Config.OPENAI_API_KEY
         self.model = Config.OPENAI_MODEL
@@ -30,6 +1053,8 @@ class OpenAIService:
         if self.api_key:
             try:
                 openai.api_key = self.api_key
+                if Config.OPENAI_API_BASE:
+                    openai.api_base = Config.OPENAI_API_BASE
                 self.connected = True
                 print("✅ OpenAI API configured successfully")
             except Exception as e:
@@ -39,67 +1064,310 @@ class OpenAIService:
             print("❌ OpenAI API key not found")
             self.connected = False
 
+        self.monitor = ConnectionMonitor(self.check_connection, Config.OPENAI_PROBE_INTERVAL, self.connected)
+        self.breaker = CircuitBreaker('OpenAI')
+        self.scheduler = GenerationScheduler()
+        self.async_client = AsyncLLMClient() if Config.OPENAI_ASYNC and AsyncLLMClient.available() else None
+        self.json_extractor = JSONExtractor()
+        self.fallbacks = FallbackCatalog(self._create_enhanced_concept, self._create_enhanced_question,
+                                         ChapterManager().get_all_chapters(), Config.SUPPORTED_LANGUAGES,
+                                         range(1, Config.MAX_QUESTION_LEVEL + 1))
+        print(f"📚 Rendered fallback catalog in {self.fallbacks.build_ms} ms")
+
     def check_connection(self):
+        """Probe OpenAI by looking up the configured model (blocking, but uses no tokens)"""
         if not self.connected:
             return False
         try:
-            response = openai.ChatCompletion.create(
-                model=self.model,
-                messages=[{"role": "user", "content": "Say 'connected'"}],
-                max_tokens=5
-            )
+            openai.Model.retrieve(self.model, request_timeout=Config.OPENAI_PROBE_TIMEOUT)
             return True
         except Exception as e:
             print(f"OpenAI connection test failed: {e}")
             return False
 
+    def is_available(self) -> bool:
+        """Non-blocking availability check based on the background monitor and the circuit breaker"""
+        return self.connected and not self.breaker.is_open() and self.monitor.is_connected()
+
+    # Transient provider errors worth another attempt; anything else fails the call immediately
+    RETRYABLE_ERRORS = ('Timeout', 'APIConnectionError', 'RateLimitError', 'ServiceUnavailableError', 'APIError',
+                        'TryAgain')
+    MIN_ATTEMPT_SECONDS = 1.0
+
+    @classmethod
+    def _is_retryable(cls, error: Exception) -> bool:
+        errors = tuple(getattr(openai.error, name) for name in cls.RETRYABLE_ERRORS if hasattr(openai.error, name))
+        return isinstance(error, errors + (TimeoutError, ConnectionError))
+
+    @staticmethod
+    def _is_provider_failure(error: Exception) -> bool:
+        """A rejected request (bad prompt, too many tokens) means the provider is up, not failing"""
+        invalid_request = getattr(openai.error, 'InvalidRequestError', None)
+        return not (invalid_request and isinstance(error, invalid_request))
+
+    @staticmethod
+    def _estimate_tokens(system_prompt: str, prompt: str, max_tokens: int) -> int:
+        """Rough prompt size (about four characters per token) plus the completion allowance"""
+        return (len(system_prompt) + len(prompt)) // 4 + max_tokens
+
+    def _with_retries(self, call, tokens: int):
+        """Run call(timeout) behind the scheduler and circuit breaker with deadlines and jittered retries
+
+        Every attempt gets at most OPENAI_CALL_TIMEOUT, and all attempts together (including time
+        queued in the scheduler) stay within OPENAI_LATENCY_BUDGET for interactive calls. Returns
+        (result, ticket); the caller releases the scheduler ticket when the call is fully done.
+        """
+        deadline = time.monotonic() + Config.OPENAI_LATENCY_BUDGET
+        interactive = self.scheduler.current_priority() == GenerationScheduler.INTERACTIVE
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                metrics.inc('llm_requests_total', (('outcome', 'rejected'),))
+                raise CircuitOpenError('OpenAI circuit breaker is open')
+            # Background work may queue as long as it needs; users only as long as their budget allows
+            try:
+                ticket = self.scheduler.acquire(tokens, max(deadline - time.monotonic(), 0) if interactive else None)
+            except GenerationQueueTimeout:
+                # The call never went out, so it must not use up a half-open trial
+                self.breaker.cancel_trial()
+                raise
+            started = time.perf_counter()
+            try:
+                result = call(max(min(Config.OPENAI_CALL_TIMEOUT, deadline - time.monotonic()),
+                                  self.MIN_ATTEMPT_SECONDS))
+            except Exception as e:
+                self.scheduler.release(ticket)
+                metrics.inc('llm_requests_total', (('outcome', 'error'),))
+                metrics.inc('llm_errors_total', (('error', type(e).__name__),))
+                if not self._is_provider_failure(e):
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_failure(str(e))
+                self.monitor.record(False, None, str(e))
+                # Full jitter keeps workers that failed together from retrying together
+                delay = random.uniform(0, min(Config.OPENAI_RETRY_MAX_DELAY,
+                                              Config.OPENAI_RETRY_BASE_DELAY * 2 ** attempt))
+                if attempt >= Config.OPENAI_MAX_RETRIES or not self._is_retryable(e) or self.breaker.is_open() or \
+                        time.monotonic() + delay + self.MIN_ATTEMPT_SECONDS > deadline:
+                    self.monitor.request_refresh()
+                    raise
+                attempt += 1
+                print(f"🔁 Retrying OpenAI call ({attempt}/{Config.OPENAI_MAX_RETRIES}) in {delay:.2f}s: {e}")
+                time.sleep(delay)
+                continue
+            self.breaker.record_success()
+            self.monitor.record(True, (time.perf_counter() - started) * 1000)
+            metrics.inc('llm_requests_total', (('outcome', 'success'),))
+            return result, ticket
+
+    def _chat_request(self, system_prompt: str, prompt: str, max_tokens: int, timeout: float) -> Dict[str, Any]:
+        return {
+            'model': self.model,
+            'messages': [
+                {
+                    "role": "system",
+                    "content": system_prompt
+                },
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ],
+            'temperature': 0.7,
+            'max_tokens': max_tokens,
+            'request_timeout': timeout
+        }
+
+    def _chat(self, system_prompt: str, prompt: str, max_tokens: int) -> str:
+        """Run one chat completion and return the stripped message content"""
+
+        def create(timeout):
+            request = self._chat_request(system_prompt, prompt, max_tokens, timeout)
+            if self.async_client is not None:
+                return self.async_client.call(lambda: openai.ChatCompletion.acreate(**request), timeout)
+            return openai.ChatCompletion.create(**request)
+
+        with metrics.phase('llm_call'):
+            response, ticket = self._with_retries(create, self._estimate_tokens(system_prompt, prompt, max_tokens))
+        usage = getattr(response, 'usage', None)
+        self.scheduler.release(ticket, getattr(usage, 'total_tokens', None))
+        if usage is not None:
+            metrics.inc('llm_tokens_total', (('kind', 'prompt'),), getattr(usage, 'prompt_tokens', 0) or 0)
+            metrics.inc('llm_tokens_total', (('kind', 'completion'),), getattr(usage, 'completion_tokens', 0) or 0)
+        return response.choices[0].message.content.strip()
+
+    def _chat_stream(self, system_prompt: str, prompt: str, max_tokens: int):
+        """Run one streamed chat completion, yielding content chunks as they arrive
+
+        Attempts are retried only until the first chunk arrives; after that a failure ends the stream.
+        """
+
+        def open_stream(timeout):
+            request = self._chat_request(system_prompt, prompt, max_tokens, timeout)
+            if self.async_client is not None:
+                # aiohttp treats request_timeout as a total deadline; streams are bounded per chunk instead
+                request['request_timeout'] = (timeout, None)
+                chunks = self.async_client.stream(lambda: openai.ChatCompletion.acreate(stream=True, **request),
+                                                  timeout, Config.OPENAI_CALL_TIMEOUT)
+            else:
+                chunks = iter(openai.ChatCompletion.create(stream=True, **request))
+            # Time to first token is what the monitor should report for streams
+            return next(chunks, None), chunks
+
+        estimate = self._estimate_tokens(system_prompt, prompt, max_tokens)
+        started = time.perf_counter()
+        (first, chunks), ticket = self._with_retries(open_stream, estimate)
+        # Streams report no usage; count the prompt estimate plus what was actually received
+        received = 0
+        try:
+            for chunk in itertools.chain([first] if first is not None else [], chunks):
+                text = chunk.choices[0].delta.get('content')
+                if text:
+                    received += len(text)
+                    yield text
+        except Exception as e:
+            self.breaker.record_failure(str(e))
+            self.monitor.record(False, None, str(e))
+            self.monitor.request_refresh()
+            metrics.inc('llm_errors_total', (('error', type(e).__name__),))
+            raise
+        finally:
+            self.scheduler.release(ticket, estimate - max_tokens + received // 4)
+            metrics.observe('phase_duration_seconds', time.perf_counter() - started, (('phase', 'llm_call'),))
+            metrics.inc('llm_tokens_total', (('kind', 'prompt'),), estimate - max_tokens)
+            metrics.inc('llm_tokens_total', (('kind', 'completion'),), received // 4)
+
+    def _chat_json(self, system_prompt: str, prompt: str, max_tokens: int, schema: JSONSchema, label: str,
+                   content: str = None, full_retry: bool = True) -> Dict[str, Any]:
+        """Parse a chat response into an object matching schema, or return None
+
+        Fenced, wrapped and truncated responses are recovered locally. A response missing only some
+        fields is completed by asking for just those fields; only one that cannot be recovered at all
+        is requested again in full. Pass content to parse a response that was already received.
+        """
+        if content is None:
+            content = self._chat(system_prompt, prompt, max_tokens)
+        try:
+            result = self.json_extractor.extract(content)
+        except JSONExtractionError as e:
+            print(f"❌ Unrecoverable JSON for {label}: {e}")
+            result = None
+
+        if isinstance(result, dict):
+            schema.drop_incomplete_items(result)
+            if not schema.errors(result):
+                return result
+            self.json_extractor.record('schema_invalid')
+            invalid = schema.invalid_fields(result)
+            # Completing more than half of the object costs about as much as asking for all of it
+            if len(invalid) <= len(schema.fields) // 2:
+                print(f"🩹 Requesting missing fields {invalid} for {label}")
+                self.json_extractor.record('field_retries')
+                try:
+                    patch = self.json_extractor.extract(self._chat(
+                        system_prompt, self._build_field_completion_prompt(result, invalid),
+                        self.FIELD_COMPLETION_MAX_TOKENS))
+                except JSONExtractionError:
+                    patch = None
+                if isinstance(patch, dict):
+                    merged = {**result, **{field: patch[field] for field in invalid if field in patch}}
+                    if not schema.errors(merged):
+                        self.json_extractor.record('retry_recovered')
+                        return merged
+                print(f"❌ Field completion failed for {label}")
+                return None
+
+        if not full_retry:
+            return None
+        print(f"🔁 Requesting {label} again as plain JSON")
+        self.json_extractor.record('full_retries')
+        try:
+            result = self.json_extractor.extract(self._chat(system_prompt, prompt + self.JSON_ONLY_REMINDER, max_tokens))
+        except JSONExtractionError as e:
+            print(f"❌ Unrecoverable JSON for {label} on retry: {e}")
+            return None
+        if schema.errors(result):
+            return None
+        self.json_extractor.record('retry_recovered')
+        return result
+
+    @staticmethod
+    def _build_field_completion_prompt(partial: Dict[str, Any], fields: List[str]) -> str:
+        """Build prompt asking only for the fields a partial response is missing"""
+        return f"""
+        This JSON object was cut off before it was complete:
+        {json.dumps({key: value for key, value in partial.items() if key not in fields}, ensure_ascii=False)}
+
+        Return a JSON object containing only these fields, consistent with the object above: {', '.join(fields)}.
+        Respond with the raw JSON object only: no markdown fences and no commentary.
+        """
+
     def generate_concept_content(self, chapter_name: str, topics: List[str], language: str) -> Dict[str, Any]:
         """Generate concept explanation for a chapter"""
 
-        if not self.connected or not self.check_connection():
+        if not self.is_available():
             print(f"OpenAI not available, using enhanced fallback concept for {chapter_name}")
-            return self._create_enhanced_concept(chapter_name, topics, language)
+            return self.fallbacks.concept(chapter_name, topics, language)
 
         print(f"🚀 Generating concept content for {chapter_name} in {language}...")
 
         prompt = self._build_concept_prompt(chapter_name, topics, language)
 
         try:
-            response = openai.ChatCompletion.create(
-                model=self.model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are an expert computer science educator creating comprehensive learning materials for data structures and algorithms."
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                temperature=0.7,
-                max_tokens=2000
-            )
+            result = self._chat_json(self.CONCEPT_SYSTEM_PROMPT, prompt, 2000, self.CONCEPT_SCHEMA,
+                                     f"concept {chapter_name}")
+            if result is not None:
+                print(f"✅ Successfully generated concept for {chapter_name}")
+                return result
+            print(f"❌ Invalid concept structure for {chapter_name}, using fallback")
+            return self.fallbacks.concept(chapter_name, topics, language)
+
+        except Exception as e:
+            print(f"❌ OpenAI API error for concept: {e}")
+            return self.fallbacks.concept(chapter_name, topics, language)
 
-            content = response.choices[0].message.content.strip()
-            print(f"✅ Received OpenAI concept response for {chapter_name}")
+    def stream_concept_content(self, chapter_name: str, topics: List[str], language: str):
+        """Generate concept content as a stream of events
 
-            try:
-                result = json.loads(content)
-                if self._validate_concept_content(result):
-                    print(f"✅ Successfully generated concept for {chapter_name}")
-                    return result
-                else:
-                    print(f"❌ Invalid concept structure for {chapter_name}, using fallback")
-                    return self._create_enhanced_concept(chapter_name, topics, language)
+        Yields ('delta', text) for each token chunk, ('field', (name, value)) as soon as the title or
+        overview is complete, and finally ('concept', result).
+        """
+
+        if not self.is_available():
+            print(f"OpenAI not available, using enhanced fallback concept for {chapter_name}")
+            yield 'concept', self.fallbacks.concept(chapter_name, topics, language)
+            return
 
-            except json.JSONDecodeError as e:
-                print(f"❌ JSON decode error for concept: {e}")
-                return self._create_enhanced_concept(chapter_name, topics, language)
+        print(f"🚀 Streaming concept content for {chapter_name} in {language}...")
 
+        prompt = self._build_concept_prompt(chapter_name, topics, language)
+        parser = StreamingJSONFieldParser(['title', 'overview'])
+        parts = []
+
+        try:
+            for text in self._chat_stream(self.CONCEPT_SYSTEM_PROMPT, prompt, max_tokens=2000):
+                parts.append(text)
+                yield 'delta', text
+                for field in parser.feed(text):
+                    yield 'field', field
         except Exception as e:
-            print(f"❌ OpenAI API error for concept: {e}")
-            return self._create_enhanced_concept(chapter_name, topics, language)
+            print(f"❌ OpenAI API error for streamed concept: {e}")
+            yield 'concept', self.fallbacks.concept(chapter_name, topics, language)
+            return
+
+        print(f"✅ Received streamed OpenAI concept response for {chapter_name}")
+        try:
+            # The client already watched this response stream in; only missing fields are worth another wait
+            result = self._chat_json(self.CONCEPT_SYSTEM_PROMPT, prompt, 2000, self.CONCEPT_SCHEMA,
+                                     f"streamed concept {chapter_name}", content=''.join(parts), full_retry=False)
+        except Exception as e:
+            print(f"❌ OpenAI API error completing streamed concept: {e}")
+            result = None
+        if result is not None:
+            yield 'concept', result
+            return
+        print(f"❌ Invalid concept structure for {chapter_name}, using fallback")
+        yield 'concept', self.fallbacks.concept(chapter_name, topics, language)
 
     def _build_concept_prompt(self, chapter_name: str, topics: List[str], language: str) -> str:
         """Build prompt for concept content"""
@@ -136,19 +1404,7 @@ class OpenAIService:
 
     def _validate_concept_content(self, concept: Dict) -> bool:
         """Validate concept content structure"""
-        try:
-            required_fields = [
-                'title', 'overview', 'theory_content', 'learning_objectives',
-                'code_examples', 'key_takeaways'
-            ]
-
-            for field in required_fields:
-                if field not in concept:
-                    return False
-
-            return True
-        except:
-            return False
+        return not self.CONCEPT_SCHEMA.errors(concept)
 
     def _create_enhanced_concept(self, chapter_name: str, topics: List[str], language: str) -> Dict[str, Any]:
         """Create enhanced fallback concept content"""
@@ -347,68 +1603,41 @@ class OpenAIService:
         str, Any]:
         """Generate a single question for a specific level"""
 
-        if not self.connected or not self.check_connection():
+        if not self.is_available():
             print(f"OpenAI not available, using enhanced fallback for level {level}")
-            return self._create_enhanced_question(chapter_name, topics, language, level)
-
-        print(f"🚀 Generating question for {chapter_name} - Level {level} in {language}...")
+            return self.fallbacks.question(chapter_name, topics, language, level)
 
-        prompt = self._build_single_question_prompt(chapter_name, topics, language, level)
-
-        try:
-            response = openai.ChatCompletion.create(
-                model=self.model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are an expert computer science educator creating coding problems for data structures and algorithms."
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                temperature=0.7,
-                max_tokens=1500
-            )
+        result = self.generate_question_variant(chapter_name, topics, language, level)
+        if result is None:
+            print(f"❌ Using fallback question for level {level}")
+            return self.fallbacks.question(chapter_name, topics, language, level)
+        return result
 
-            content = response.choices[0].message.content.strip()
-            print(f"✅ Received OpenAI response for level {level}")
+    def generate_question_variant(self, chapter_name: str, topics: List[str], language: str, level: int,
+                                  avoid: List[str] = None) -> Dict[str, Any]:
+        """Generate a question that differs from the titles in avoid, or return None on failure"""
 
-            try:
-                result = json.loads(content)
-                if self._validate_question(result, level):
-                    print(f"✅ Successfully generated question for level {level}")
-                    return result
-                else:
-                    print(f"❌ Invalid question structure for level {level}, using fallback")
-                    return self._create_enhanced_question(chapter_name, topics, language, level)
+        print(f"🚀 Generating question for {chapter_name} - Level {level} in {language}...")
 
-            except json.JSONDecodeError as e:
-                print(f"❌ JSON decode error for level {level}: {e}")
-                return self._create_enhanced_question(chapter_name, topics, language, level)
+        prompt = self._build_single_question_prompt(chapter_name, topics, language, level, avoid)
 
+        try:
+            result = self._chat_json(self.QUESTION_SYSTEM_PROMPT, prompt, 1500, self.QUESTION_SCHEMA,
+                                     f"level {level}")
+            if result is not None and self._validate_question(result, level):
+                print(f"✅ Successfully generated question for level {level}")
+                return result
+            print(f"❌ Invalid question structure for level {level}")
         except Exception as e:
             print(f"❌ OpenAI API error for level {level}: {e}")
-            return self._create_enhanced_question(chapter_name, topics, language, level)
+        return None
 
-    def _build_single_question_prompt(self, chapter_name: str, topics: List[str], language: str, level: int) -> str:
+    def _build_single_question_prompt(self, chapter_name: str, topics: List[str], language: str, level: int,
+                                      avoid: List[str] = None) -> str:
         """Build prompt for a single question"""
 
-        difficulty_descriptions = {
-            1: "very basic beginner level focusing on fundamental syntax and simple operations",
-            2: "basic beginner level with simple multi-step problems",
-            3: "easy level requiring basic algorithmic thinking",
-            4: "easy-intermediate level with multiple conditions",
-            5: "intermediate level with common algorithms",
-            6: "intermediate-advanced level requiring optimization",
-            7: "advanced level with complex data structures",
-            8: "very advanced level with multiple constraints",
-            9: "expert level with complex real-world scenarios",
-            10: "master level requiring optimal solutions"
-        }
-
-        difficulty = difficulty_descriptions.get(level, "appropriate difficulty")
+        difficulty = self._get_level_difficulty(level)
+        avoid_note = f"\n        It must be a different problem from these existing ones: {'; '.join(avoid)}" if avoid else ""
 
         return f"""
         Create a SINGLE coding problem about {chapter_name} for {language} programmers.
@@ -447,9 +1676,117 @@ class OpenAIService:
             "space_complexity": "space complexity"
         }}
 
-        Make sure the problem is distinct and focuses on {chapter_name} concepts.
+        Make sure the problem is distinct and focuses on {chapter_name} concepts.{avoid_note}
         """
 
+    def generate_question_batch(self, chapter_name: str, topics: List[str], language: str,
+                                levels: List[int]) -> Dict[int, Dict[str, Any]]:
+        """Generate questions for several levels in one request, retrying invalid items individually"""
+
+        if len(levels) == 1:
+            return {levels[0]: self.generate_single_question(chapter_name, topics, language, levels[0])}
+
+        if not self.is_available():
+            print(f"OpenAI not available, using enhanced fallback for levels {levels}")
+            return {level: self.fallbacks.question(chapter_name, topics, language, level) for level in levels}
+
+        print(f"🚀 Generating questions for {chapter_name} - Levels {levels} in {language}...")
+
+        prompt = self._build_question_batch_prompt(chapter_name, topics, language, levels)
+        questions = {}
+
+        try:
+            content = self._chat(self.QUESTION_SYSTEM_PROMPT, prompt, max_tokens=min(1200 * len(levels), 6000))
+            print(f"✅ Received OpenAI batch response for levels {levels}")
+
+            # Invalid or missing items are already retried one level at a time below
+            try:
+                result = self.json_extractor.extract(content)
+                items = result.get('questions', []) if isinstance(result, dict) else result
+                for item in items if isinstance(items, list) else []:
+                    level = item.get('level') if isinstance(item, dict) else None
+                    if level in levels and level not in questions and self._validate_question(item, level):
+                        questions[level] = item
+            except JSONExtractionError as e:
+                print(f"❌ Unrecoverable JSON for batch {levels}: {e}")
+
+        except Exception as e:
+            print(f"❌ OpenAI API error for batch {levels}: {e}")
+
+        for level in levels:
+            if level not in questions:
+                print(f"🔁 Retrying level {level} individually")
+                questions[level] = self.generate_single_question(chapter_name, topics, language, level)
+        return questions
+
+    def _build_question_batch_prompt(self, chapter_name: str, topics: List[str], language: str,
+                                     levels: List[int]) -> str:
+        """Build prompt asking for one question per level in a single response"""
+
+        level_lines = "\n".join(
+            f"        - Level {level}/10: {self._get_level_difficulty(level)}; focus on {self._get_level_focus(level)}"
+            for level in levels
+        )
+
+        return f"""
+        Create {len(levels)} distinct coding problems about {chapter_name} for {language} programmers,
+        exactly one for each of these difficulty levels:
+{level_lines}
+
+        Programming Language: {language}
+        Topics: {', '.join(topics)}
+
+        Requirements for every problem:
+        - Make it appropriate for its level's difficulty
+        - Include clear problem statement
+        - Provide 2-3 examples with explanations
+        - Include 3 helpful hints
+        - Provide 3-5 test cases
+        - Include a complete solution with explanation
+        - Specify time and space complexity
+
+        Return as JSON with this exact shape, one object per level in the "questions" list:
+        {{
+            "questions": [
+                {{
+                    "level": <level number>,
+                    "problem_id": "unique_string",
+                    "title": "descriptive title",
+                    "description": "detailed problem statement",
+                    "examples": [
+                        {{"input": "example input", "output": "example output", "explanation": "explanation"}}
+                    ],
+                    "hints": ["hint1", "hint2", "hint3"],
+                    "function_signature": "function signature in {language}",
+                    "test_cases": [
+                        {{"input": "test input", "expected_output": "expected output"}}
+                    ],
+                    "solution": "complete solution code",
+                    "solution_explanation": "detailed explanation",
+                    "time_complexity": "time complexity",
+                    "space_complexity": "space complexity"
+                }}
+            ]
+        }}
+
+        Make sure the problems are distinct from each other and focus on {chapter_name} concepts.
+        """
+
+    def _get_level_difficulty(self, level: int) -> str:
+        difficulty_descriptions = {
+            1: "very basic beginner level focusing on fundamental syntax and simple operations",
+            2: "basic beginner level with simple multi-step problems",
+            3: "easy level requiring basic algorithmic thinking",
+            4: "easy-intermediate level with multiple conditions",
+            5: "intermediate level with common algorithms",
+            6: "intermediate-advanced level requiring optimization",
+            7: "advanced level with complex data structures",
+            8: "very advanced level with multiple constraints",
+            9: "expert level with complex real-world scenarios",
+            10: "master level requiring optimal solutions"
+        }
+        return difficulty_descriptions.get(level, "appropriate difficulty")
+
     def _get_level_focus(self, level: int) -> str:
         focuses = {
             1: "basic syntax and single-step operations",
@@ -467,20 +1804,7 @@ class OpenAIService:
 
     def _validate_question(self, question: Dict, expected_level: int) -> bool:
         """Validate a single question structure"""
-        try:
-            required_fields = [
-                'level', 'problem_id', 'title', 'description', 'examples',
-                'hints', 'function_signature', 'test_cases', 'solution',
-                'solution_explanation', 'time_complexity', 'space_complexity'
-            ]
-
-            for field in required_fields:
-                if field not in question:
-                    return False
-
-            return question.get('level') == expected_level
-        except:
-            return False
+        return not self.QUESTION_SCHEMA.errors(question) and question.get('level') == expected_level
 
     def _create_enhanced_question(self, chapter_name: str, topics: List[str], language: str, level: int) -> Dict[
         str, Any]:
@@ -530,7 +1854,7 @@ class OpenAIService:
 
         return {
             "level": level,
-            "problem_id": f"{chapter_name.lower().replace(' ', '_')}_level_{level}_{random.randint(1000, 9999)}",
+            "problem_id": f"{chapter_name.lower().replace(' ', '_')}_{language}_level_{level}_fallback",
             "title": f"{template['title']} - Level {level}",
             "description": f"{template['description']} This is a level {level}/10 problem focusing on {template['focus']}.",
             "examples": self._generate_examples(chapter_name, level),
@@ -679,22 +2003,81 @@ class OpenAIService:
         else:
             return "O(n^2)" if complexity_type == "time" else "O(n)"
 
-    def analyze_user_code(self, user_code: str, question_data: Dict, language: str) -> Dict[str, Any]:
-        """Analyze user's code"""
+    def analyze_user_code(self, user_code: str, question_data: Dict, language: str,
+                          execution: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Analyze user's code from the results of running it against the test cases"""
+        execution = execution or {'supported': False, 'test_results': [], 'passed': 0,
+                                  'total': len(question_data.get('test_cases', []))}
+        results = execution.get('test_results', [])
+        passed, total = execution.get('passed', 0), execution.get('total', 0)
+
+        if not execution.get('supported'):
+            feedback = execution.get('error') or f"Automatic test execution is not available for {language} yet."
+        elif execution.get('status') != 'ok':
+            feedback = f"Your code could not be run: {execution.get('error', execution.get('status'))}"
+        elif passed == total:
+            feedback = f"All {total} test cases passed."
+        else:
+            feedback = f"{passed} of {total} test cases passed. Check the failing cases below."
+
+        bugs = [
+            f"Test {result['index'] + 1}: {result.get('error') or 'expected ' + str(result.get('expected')) + ', got ' + str(result.get('actual'))}"
+            for result in results if not result.get('passed')
+        ]
+        if execution.get('status') not in (None, 'ok', 'unsupported'):
+            bugs.insert(0, execution.get('error', execution['status']))
+
         return {
-            "correctness_score": random.randint(60, 95),
-            "is_correct": random.choice([True, False]),
-            "feedback": "This is a simulated analysis. With OpenAI integration, you would get detailed feedback on your code implementation, logic, and efficiency.",
-            "strengths": ["Good code structure", "Clear variable names", "Proper function organization"],
-            "improvements": ["Add more comments", "Handle edge cases", "Consider optimization opportunities"],
-            "efficiency_analysis": f"Time complexity appears to be {question_data.get('time_complexity', 'O(n)')}, which is appropriate for this level.",
-            "bugs": [],
-            "passed_test_cases": random.randint(1, 3),
-            "total_test_cases": 3,
-            "hints": ["Review the problem requirements", "Test with different inputs", "Consider time complexity"],
+            "correctness_score": round(100 * passed / total) if execution.get('supported') and total else None,
+            "is_correct": bool(execution.get('supported')) and execution.get('status') == 'ok' and passed == total > 0,
+            "graded": bool(execution.get('supported')),
+            "feedback": feedback,
+            "strengths": ["Passes all provided test cases"] if execution.get('supported') and total and passed == total
+            else [],
+            "improvements": ["Handle the failing test cases"] if execution.get('supported') and passed < total else [],
+            "efficiency_analysis": self._describe_efficiency(question_data, execution),
+            "complexity": execution.get('complexity'),
+            "bugs": bugs,
+            "passed_test_cases": passed,
+            "total_test_cases": total,
+            "test_results": results,
+            "runtime_ms": execution.get('runtime_ms'),
+            "peak_memory_kb": execution.get('peak_memory_kb'),
+            "hints": question_data.get('hints', [])[:3],
             "analyzed_at": time.time()
         }
 
+    @staticmethod
+    def _describe_efficiency(question_data: Dict, execution: Dict[str, Any]) -> str:
+        """Summarize measured complexity against the question's stated complexity"""
+        measured = f"Measured runtime across tests: {execution.get('runtime_ms', 0)} ms, " \
+                   f"peak memory: {execution.get('peak_memory_kb', 0)} KB."
+        complexity = execution.get('complexity')
+        if not complexity or not any(complexity[name].get('class') or complexity[name].get('candidates')
+                                     for name in ('time', 'space')):
+            reason = (complexity or {}).get('error') or (complexity or {}).get('time', {}).get('reason')
+            return f"Expected time complexity is {question_data.get('time_complexity', 'O(n)')}. {measured}" + \
+                (f" Growth could not be profiled: {reason}." if reason else '')
+
+        parts = []
+        for name in ('time', 'space'):
+            fit = complexity[name]
+            if fit.get('class'):
+                text = f"{name} grows like {fit['class']}"
+            elif fit.get('candidates'):
+                text = f"{name} grows like {' or '.join(fit['candidates'])}, too close to tell which"
+            else:
+                continue
+            if fit['verdict'] == 'matches':
+                text += f", matching the expected {fit['expected']}"
+            elif fit['verdict'] == 'worse':
+                text += f", worse than the expected {fit['expected']}"
+            elif fit['verdict'] == 'better':
+                text += f", better than the expected {fit['expected']}"
+            parts.append(text)
+        largest = complexity['samples'][-1]
+        return f"Profiled on inputs up to n={largest['n']}: {'; '.join(parts)}. {measured}"
+
 
 class ChapterManager:
     def __init__(self):
@@ -715,49 +2098,2799 @@ class ChapterManager:
         return self.chapters
 
 
-class ContentCache:
-    def __init__(self):
-        self.cache = {}
+class CacheEntry:
+    __slots__ = ('value', 'size', 'stored_at', 'expires_at', 'generated_at')
+
+    def __init__(self, value: Any, size: int, ttl: int, generated_at: float = None):
+        self.value = value
+        self.size = size
+        self.stored_at = time.time()
+        self.expires_at = self.stored_at + ttl if ttl and ttl > 0 else None
+        self.generated_at = generated_at if generated_at is not None else self.stored_at
+
+    def is_expired(self, now: float) -> bool:
+        return self.expires_at is not None and now >= self.expires_at
+
+
+def estimate_size(value: Any, _seen=None) -> int:
+    """Approximate in-memory footprint of a cached value in bytes"""
+    if _seen is None:
+        _seen = set()
+    if id(value) in _seen:
+        return 0
+    _seen.add(id(value))
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(estimate_size(k, _seen) + estimate_size(v, _seen) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set)):
+        size += sum(estimate_size(item, _seen) for item in value)
+    return size
+
+
+class RedisContentStore:
+    """Shared L2 content store in Redis, values stored with their generation time as compressed compact JSON"""
+
+    RELEASE_LEASE_SCRIPT = (
+        "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) else return 0 end"
+    )
+
+    def __init__(self, client, prefix: str = None, default_ttl: int = None):
+        self.client = client
+        self.prefix = prefix if prefix is not None else Config.REDIS_KEY_PREFIX
+        self.default_ttl = default_ttl if default_ttl is not None else Config.CACHE_DEFAULT_TIMEOUT
+        self.stats = {'hits': 0, 'misses': 0, 'errors': 0}
+
+    @classmethod
+    def from_url(cls, url: str):
+        """Connect to Redis, returning None when it is not configured or unreachable"""
+        if not url:
+            return None
+        if redis is None:
+            print("❌ REDIS_URL is set but the redis package is not installed, using in-process cache only")
+            return None
+        try:
+            client = redis.Redis.from_url(url, socket_timeout=2, socket_connect_timeout=2)
+            client.ping()
+            print("✅ Redis content cache connected")
+            return cls(client)
+        except Exception as e:
+            print(f"❌ Redis connection error: {e}, using in-process cache only")
+            return None
+
+    @staticmethod
+    def encode(value: Any) -> bytes:
+        return zlib.compress(json.dumps(value, separators=(',', ':')).encode('utf-8'))
+
+    @staticmethod
+    def decode(raw: bytes) -> Any:
+        return json.loads(zlib.decompress(raw).decode('utf-8'))
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}{key}"
 
     def get(self, key: str):
-        return self.cache.get(key)
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys: List[str]) -> Dict[str, Any]:
+        return {key: value for key, (value, _) in self.get_entries(keys).items()}
+
+    def get_entries(self, keys: List[str]) -> Dict[str, tuple]:
+        """Fetch several keys in a single round trip as (value, generated_at) pairs"""
+        if not keys:
+            return {}
+        try:
+            raw_values = self.client.mget([self._key(k) for k in keys])
+        except Exception as e:
+            print(f"❌ Redis read error: {e}")
+            self.stats['errors'] += 1
+            return {}
+        found = {}
+        for key, raw in zip(keys, raw_values):
+            if raw is None:
+                self.stats['misses'] += 1
+                continue
+            try:
+                generated_at, value = self.decode(raw)
+                found[key] = (value, generated_at)
+                self.stats['hits'] += 1
+            except (zlib.error, ValueError, TypeError) as e:
+                print(f"❌ Corrupt Redis entry {key}: {e}")
+                self.stats['errors'] += 1
+        return found
+
+    def set(self, key: str, value: Any, ttl: int = None):
+        return self.set_many({key: value}, ttl)
+
+    def set_many(self, items: Dict[str, Any], ttl: int = None):
+        now = time.time()
+        return self.set_entries({key: (value, now) for key, value in items.items()}, ttl)
+
+    def set_entries(self, entries: Dict[str, tuple], ttl: int = None):
+        """Write several (value, generated_at) pairs in one pipelined round trip"""
+        ttl = self.default_ttl if ttl is None else ttl
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for key, (value, generated_at) in entries.items():
+                pipe.set(self._key(key), self.encode([generated_at, value]), ex=ttl if ttl and ttl > 0 else None)
+            pipe.execute()
+            return True
+        except Exception as e:
+            print(f"❌ Redis write error: {e}")
+            self.stats['errors'] += 1
+            return False
+
+    def delete(self, key: str):
+        try:
+            return bool(self.client.delete(self._key(key)))
+        except Exception as e:
+            print(f"❌ Redis delete error: {e}")
+            self.stats['errors'] += 1
+            return False
+
+    def acquire_lease(self, key: str, token: str, ttl: int) -> bool:
+        """Try to become the single generator of a key across workers"""
+        try:
+            return bool(self.client.set(self._key(f"lease:{key}"), token, nx=True, px=ttl * 1000))
+        except Exception as e:
+            print(f"❌ Redis lease error: {e}")
+            self.stats['errors'] += 1
+            # Without a working lease, let this worker generate rather than block
+            return True
+
+    def release_lease(self, key: str, token: str):
+        lease_key = self._key(f"lease:{key}")
+        try:
+            self.client.eval(self.RELEASE_LEASE_SCRIPT, 1, lease_key, token)
+        except Exception:
+            # Scripting unavailable (e.g. some test doubles): fall back to a non-atomic check
+            try:
+                current = self.client.get(lease_key)
+                if current in (token, token.encode('utf-8')):
+                    self.client.delete(lease_key)
+            except Exception as e:
+                print(f"❌ Redis lease release error: {e}")
+                self.stats['errors'] += 1
+
+    def lease_held(self, key: str) -> bool:
+        try:
+            return bool(self.client.exists(self._key(f"lease:{key}")))
+        except Exception:
+            return False
+
+    def get_stats(self) -> Dict[str, Any]:
+        return dict(self.stats)
+
+
+class PersistentContentStore:
+    """Durable SQLite copy of generated content, written behind from the cache"""
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS content ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self.conn.commit()
+        self.lock = threading.Lock()
+        self.queue = queue.Queue()
+        self.stats = {'reads': 0, 'hits': 0, 'writes': 0, 'errors': 0}
+        self.writer = threading.Thread(target=self._write_loop, name='content-store-writer', daemon=True)
+        self.writer.start()
+        atexit.register(self.flush)
+
+    @classmethod
+    def from_path(cls, path: str):
+        if not path:
+            return None
+        try:
+            store = cls(path)
+            print(f"✅ Content store opened at {path} ({store.count()} items)")
+            return store
+        except Exception as e:
+            print(f"❌ Content store error: {e}, running without persistence")
+            return None
+
+    def enqueue(self, key: str, value: Any, generated_at: float = None):
+        """Schedule a write without blocking the caller"""
+        self.queue.put((key, RedisContentStore.encode(value), generated_at or time.time()))
+
+    def _write_loop(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < 100:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._write(batch)
+            for _ in batch:
+                self.queue.task_done()
+
+    def _write(self, rows: List[tuple]):
+        try:
+            with self.lock:
+                self.conn.executemany(
+                    "INSERT INTO content (key, value, updated_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at",
+                    rows
+                )
+                self.conn.commit()
+            self.stats['writes'] += len(rows)
+        except sqlite3.Error as e:
+            print(f"❌ Content store write error: {e}")
+            self.stats['errors'] += 1
+
+    def flush(self):
+        """Wait until all queued writes are on disk"""
+        self.queue.join()
+
+    def get_entries(self, keys: List[str]) -> Dict[str, tuple]:
+        """Look up several keys as (value, generated_at) pairs"""
+        if not keys:
+            return {}
+        self.stats['reads'] += len(keys)
+        try:
+            with self.lock:
+                rows = self.conn.execute(
+                    f"SELECT key, value, updated_at FROM content WHERE key IN ({','.join('?' * len(keys))})", keys
+                ).fetchall()
+        except sqlite3.Error as e:
+            print(f"❌ Content store read error: {e}")
+            self.stats['errors'] += 1
+            return {}
+        self.stats['hits'] += len(rows)
+        return {key: (RedisContentStore.decode(value), updated_at) for key, value, updated_at in rows}
+
+    def load_recent(self, limit: int) -> List[tuple]:
+        """Most recently written (key, value, generated_at) items, used to warm the cache at boot"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT key, value, updated_at FROM content ORDER BY updated_at DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [(key, RedisContentStore.decode(value), updated_at) for key, value, updated_at in reversed(rows)]
+
+    def count(self) -> int:
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM content").fetchone()[0]
+
+    def export_bundle(self) -> Dict[str, Any]:
+        """Snapshot of every stored item, suitable for shipping with a release"""
+        self.flush()
+        with self.lock:
+            rows = self.conn.execute("SELECT key, value, updated_at FROM content ORDER BY key").fetchall()
+        items = [{'key': key, 'value': RedisContentStore.decode(value), 'updated_at': updated_at}
+                 for key, value, updated_at in rows]
+        return {
+            'version': 1,
+            'exported_at': time.time(),
+            # Stores written before fallbacks were kept out may still hold template content
+            'items': [item for item in items if not FallbackCatalog.is_fallback(item['value'])]
+        }
+
+    def import_bundle(self, bundle: Dict[str, Any], overwrite: bool = False) -> int:
+        """Load a snapshot bundle, keeping existing items unless overwrite is set"""
+        if bundle.get('version') != 1:
+            raise ValueError(f"Unsupported bundle version: {bundle.get('version')}")
+        rows = [
+            (item['key'], RedisContentStore.encode(item['value']), item.get('updated_at', time.time()))
+            for item in bundle.get('items', [])
+            if item.get('key', '').startswith(('concept_', 'question_'))
+            and not FallbackCatalog.is_fallback(item.get('value'))
+        ]
+        verb = "INSERT OR REPLACE" if overwrite else "INSERT OR IGNORE"
+        with self.lock:
+            before = self.conn.total_changes
+            self.conn.executemany(f"{verb} INTO content (key, value, updated_at) VALUES (?, ?, ?)", rows)
+            self.conn.commit()
+            return self.conn.total_changes - before
 
-    def set(self, key: str, value: Any):
-        self.cache[key] = value
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, 'pending_writes': self.queue.qsize(), 'path': self.path}
+
+
+class ContentCache:
+    """Bounded LRU cache with per-entry TTL and byte accounting, optionally in front of a shared L2
+
+    Entries older than default_ttl are stale: they are still returned (and flagged) for up to
+    max_stale more seconds so callers can serve them while refreshing in the background. Stale
+    counters only cover keys starting with refresh_prefixes (all keys when None), since only those
+    are refreshed.
+    """
+
+    def __init__(self, max_entries: int = None, max_bytes: int = None, default_ttl: int = None, l2=None,
+                 store=None, max_stale: int = None, refresh_prefixes: tuple = None):
+        self.max_entries = max_entries if max_entries is not None else Config.CACHE_MAX_ENTRIES
+        self.max_bytes = max_bytes if max_bytes is not None else Config.CACHE_MAX_BYTES
+        self.default_ttl = default_ttl if default_ttl is not None else Config.CACHE_DEFAULT_TIMEOUT
+        self.max_stale = max_stale if max_stale is not None else Config.CACHE_MAX_STALE
+        self.cache = OrderedDict()
+        self.total_bytes = 0
+        self.lock = threading.RLock()
+        self.stats = {'hits': 0, 'misses': 0, 'stale_hits': 0, 'evictions': 0, 'expirations': 0, 'rejected': 0,
+                      'fallbacks': 0}
+        self.l2 = l2
+        self.store = store
+        self.refresh_prefixes = refresh_prefixes
+        # Entries are kept until they are too stale to serve; 0 keeps them until evicted
+        self.retention_ttl = self.default_ttl + self.max_stale if self.default_ttl > 0 and self.max_stale > 0 else 0
+        # With a shared L2 the local copy is kept briefly so workers pick up each other's writes
+        self.l1_ttl = self.retention_ttl
+        if l2 is not None:
+            self.l1_ttl = min(self.retention_ttl, Config.CACHE_L1_TIMEOUT) if self.retention_ttl > 0 \
+                else Config.CACHE_L1_TIMEOUT
+
+    def _get_local(self, key: str):
+        with self.lock:
+            entry = self.cache.get(key)
+            if entry is None:
+                return None
+            if entry.is_expired(time.time()):
+                self._remove(key)
+                self.stats['expirations'] += 1
+                return None
+            self.cache.move_to_end(key)
+            return entry
+
+    def _refreshed(self, key: str) -> bool:
+        return self.refresh_prefixes is None or key.startswith(self.refresh_prefixes)
+
+    def is_stale(self, generated_at: float) -> bool:
+        return self.default_ttl > 0 and time.time() - generated_at > self.default_ttl
+
+    def _is_servable(self, generated_at: float) -> bool:
+        return self.retention_ttl <= 0 or time.time() - generated_at <= self.retention_ttl
+
+    def get(self, key: str):
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys: List[str]) -> Dict[str, Any]:
+        return {key: value for key, (value, _) in self.get_entries(keys).items()}
+
+    def get_entry(self, key: str):
+        """Return (value, generated_at) for a key, or None"""
+        return self.get_entries([key]).get(key)
+
+    def get_entries(self, keys: List[str]) -> Dict[str, tuple]:
+        """Look up several keys as (value, generated_at), filling L1 misses from L2 and then the store"""
+        with metrics.phase('cache_lookup'):
+            return self._lookup(keys)
+
+    def _lookup(self, keys: List[str]) -> Dict[str, tuple]:
+        found = {}
+        missing = []
+        for key in keys:
+            entry = self._get_local(key)
+            if entry is None:
+                missing.append(key)
+            else:
+                found[key] = (entry.value, entry.generated_at)
+        if missing and self.l2 is not None:
+            for key, (value, generated_at) in self.l2.get_entries(missing).items():
+                self._set_local(key, value, self.l1_ttl, generated_at)
+                found[key] = (value, generated_at)
+            missing = [key for key in missing if key not in found]
+        if missing and self.store is not None:
+            restored = {key: entry for key, entry in self.store.get_entries(missing).items()
+                        if self._is_servable(entry[1]) and not FallbackCatalog.is_fallback(entry[0])}
+            if restored and self.l2 is not None:
+                self.l2.set_entries(restored, self.retention_ttl)
+            for key, (value, generated_at) in restored.items():
+                self._set_local(key, value, self.l1_ttl, generated_at)
+                found[key] = (value, generated_at)
+        stale = sum(1 for key, (_, generated_at) in found.items()
+                    if self._refreshed(key) and self.is_stale(generated_at))
+        with self.lock:
+            self.stats['hits'] += len(found)
+            self.stats['stale_hits'] += stale
+            self.stats['misses'] += len(keys) - len(found)
+        return found
+
+    def set(self, key: str, value: Any, ttl: int = None, generated_at: float = None):
+        generated_at = generated_at or time.time()
+        if FallbackCatalog.is_fallback(value):
+            return self._set_fallback(key, value, generated_at)
+        ttl = self.retention_ttl if ttl is None else ttl
+        if self.store is not None:
+            self.store.enqueue(key, value, generated_at)
+        if self.l2 is not None:
+            self.l2.set_entries({key: (value, generated_at)}, ttl)
+            ttl = min(ttl, self.l1_ttl) if ttl and ttl > 0 else self.l1_ttl
+        return self._set_local(key, value, ttl, generated_at)
+
+    def _set_fallback(self, key: str, value: Any, generated_at: float):
+        """Keep template content briefly and only in L1, and never in place of generated content
+
+        Fallbacks stand in while the provider is unavailable; sharing or persisting them would keep
+        serving templates long after it recovers.
+        """
+        with self.lock:
+            current = self.cache.get(key)
+            if current is not None and not FallbackCatalog.is_fallback(current.value):
+                return False
+            self.stats['fallbacks'] += 1
+        return self._set_local(key, value, Config.FALLBACK_CACHE_TTL, generated_at)
+
+    def _set_local(self, key: str, value: Any, ttl: int, generated_at: float = None):
+        entry = CacheEntry(value, estimate_size(value), ttl, generated_at)
+        with self.lock:
+            if entry.size > self.max_bytes:
+                self.stats['rejected'] += 1
+                return False
+            if key in self.cache:
+                self._remove(key)
+            self.cache[key] = entry
+            self.total_bytes += entry.size
+            self._evict()
         return True
 
+    def delete(self, key: str):
+        if self.l2 is not None:
+            self.l2.delete(key)
+        with self.lock:
+            return self._remove(key) is not None
+
+    def drop_local(self, key: str):
+        """Forget the L1 copy so the next read goes to the shared tiers"""
+        with self.lock:
+            self._remove(key)
+
+    def _remove(self, key: str):
+        entry = self.cache.pop(key, None)
+        if entry is not None:
+            self.total_bytes -= entry.size
+        return entry
+
+    def _evict(self):
+        """Drop expired entries first, then least recently used ones until within limits"""
+        if len(self.cache) <= self.max_entries and self.total_bytes <= self.max_bytes:
+            return
+        now = time.time()
+        for key in [k for k, e in self.cache.items() if e.is_expired(now)]:
+            self._remove(key)
+            self.stats['expirations'] += 1
+        while self.cache and (len(self.cache) > self.max_entries or self.total_bytes > self.max_bytes):
+            _, entry = self.cache.popitem(last=False)
+            self.total_bytes -= entry.size
+            self.stats['evictions'] += 1
+
+    def warm_from_store(self) -> int:
+        """Bulk-load the most recent persisted items into L1 at boot"""
+        if self.store is None:
+            return 0
+        items = [item for item in self.store.load_recent(self.max_entries)
+                 if self._is_servable(item[2]) and not FallbackCatalog.is_fallback(item[1])]
+        for key, value, generated_at in items:
+            self._set_local(key, value, self.l1_ttl, generated_at)
+        return len(items)
+
+    def keys(self) -> List[str]:
+        with self.lock:
+            return list(self.cache.keys())
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self.lock:
+            lookups = self.stats['hits'] + self.stats['misses']
+            return {
+                **self.stats,
+                'entries': len(self.cache),
+                'bytes': self.total_bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'default_ttl': self.default_ttl,
+                'hit_ratio': round(self.stats['hits'] / lookups, 4) if lookups else 0.0,
+                'stale_entries': sum(1 for key, e in self.cache.items()
+                                     if self._refreshed(key) and self.is_stale(e.generated_at)),
+                'max_stale': self.max_stale,
+                'refreshed_keys': list(self.refresh_prefixes) if self.refresh_prefixes is not None else 'all',
+                'l2': self.l2.get_stats() if self.l2 is not None else None,
+                'store': self.store.get_stats() if self.store is not None else None
+            }
+
+    @staticmethod
+    def concept_key(chapter_id: int, language: str) -> str:
+        return f"concept_{chapter_id}_{language}"
+
+    @staticmethod
+    def question_key(chapter_id: int, language: str, level: int) -> str:
+        return f"question_{chapter_id}_{language}_{level}"
+
     def get_concept(self, chapter_id: int, language: str):
-        concept_key = f"concept_{chapter_id}_{language}"
-        return self.get(concept_key)
+        return self.get(self.concept_key(chapter_id, language))
 
     def set_concept(self, chapter_id: int, language: str, concept: Dict):
-        concept_key = f"concept_{chapter_id}_{language}"
-        return self.set(concept_key, concept)
+        return self.set(self.concept_key(chapter_id, language), concept)
 
     def get_question(self, chapter_id: int, language: str, level: int):
-        question_key = f"question_{chapter_id}_{language}_{level}"
-        return self.get(question_key)
+        return self.get(self.question_key(chapter_id, language, level))
 
     def set_question(self, chapter_id: int, language: str, level: int, question: Dict):
-        question_key = f"question_{chapter_id}_{language}_{level}"
-        return self.set(question_key, question)
+        return self.set(self.question_key(chapter_id, language, level), question)
 
     def get_solution(self, chapter_id: int, language: str, level: int):
         question = self.get_question(chapter_id, language, level)
         return question.get('solution') if question else None
 
 
+class ResponseCache:
+    """LRU of pre-serialized JSON response bodies with strong ETags and lazily compressed encodings
+
+    An entry is reused only while the content object it was built from is still the one being served,
+    so replacing a cached value invalidates its serialized forms without any bookkeeping. A payload
+    built from several objects passes them as a tuple, and each must be unchanged.
+    """
+
+    def __init__(self, max_entries: int = None, max_bytes: int = None):
+        self.max_entries = max_entries if max_entries is not None else Config.RESPONSE_CACHE_MAX_ENTRIES
+        self.max_bytes = max_bytes if max_bytes is not None else Config.RESPONSE_CACHE_MAX_BYTES
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+        self.stats = {'hits': 0, 'builds': 0, 'not_modified': 0, 'identity': 0, 'gzip': 0, 'br': 0, 'evictions': 0}
+
+    def get(self, key: str, source: Any, build) -> Dict[str, Any]:
+        """Return the serialized entry for key, calling build() and encoding its result only when source has changed"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and self._same_source(entry['source'], source):
+                self.entries.move_to_end(key)
+                self.stats['hits'] += 1
+                return entry
+        body = json.dumps(build(), separators=(',', ':')).encode('utf-8')
+        entry = {'key': key, 'source': source, 'etag': hashlib.blake2b(body, digest_size=16).hexdigest(),
+                 'bodies': {'identity': body}, 'size': len(body)}
+        with self.lock:
+            self.stats['builds'] += 1
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.total_bytes -= previous['size']
+            if entry['size'] <= self.max_bytes:
+                self.entries[key] = entry
+                self.total_bytes += entry['size']
+                self._evict()
+        return entry
+
+    @staticmethod
+    def _same_source(cached: Any, source: Any) -> bool:
+        if isinstance(cached, tuple) and isinstance(source, tuple):
+            return len(cached) == len(source) and all(a is b for a, b in zip(cached, source))
+        return cached is source
+
+    def body(self, entry: Dict[str, Any], encoding: str) -> bytes:
+        """Return the body in the given content coding, compressing it the first time it is asked for"""
+        body = entry['bodies'].get(encoding)
+        if body is None:
+            raw = entry['bodies']['identity']
+            body = brotli.compress(raw, quality=Config.RESPONSE_BROTLI_QUALITY) if encoding == 'br' \
+                else gzip.compress(raw, Config.RESPONSE_GZIP_LEVEL)
+            with self.lock:
+                if encoding not in entry['bodies']:
+                    entry['bodies'][encoding] = body
+                    entry['size'] += len(body)
+                    if self.entries.get(entry['key']) is entry:
+                        self.total_bytes += len(body)
+                        self._evict()
+        with self.lock:
+            self.stats[encoding] += 1
+        return body
+
+    def _evict(self):
+        while self.entries and (len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes):
+            _, entry = self.entries.popitem(last=False)
+            self.total_bytes -= entry['size']
+            self.stats['evictions'] += 1
+
+    @staticmethod
+    def choose_encoding(accept_encoding: str, size: int) -> str:
+        """Pick brotli, then gzip, from an Accept-Encoding header; small bodies are sent as they are"""
+        if size < Config.RESPONSE_COMPRESS_MIN_BYTES:
+            return 'identity'
+        accepted = set()
+        for part in accept_encoding.lower().split(','):
+            coding, _, params = part.strip().partition(';')
+            quality = params.strip()[2:] if params.strip().startswith('q=') else '1'
+            try:
+                if float(quality) > 0:
+                    accepted.add(coding.strip())
+            except ValueError:
+                continue
+        if brotli is not None and ('br' in accepted or '*' in accepted):
+            return 'br'
+        if 'gzip' in accepted or '*' in accepted:
+            return 'gzip'
+        return 'identity'
+
+    @staticmethod
+    def etag(entry: Dict[str, Any], encoding: str) -> str:
+        # Each content coding is its own representation, so it gets its own strong validator
+        return f'"{entry["etag"]}"' if encoding == 'identity' else f'"{entry["etag"]}-{encoding}"'
+
+    @staticmethod
+    def matches(if_none_match: str, entry: Dict[str, Any]) -> bool:
+        """True when an If-None-Match header names any representation of this entry"""
+        if not if_none_match:
+            return False
+        for tag in if_none_match.split(','):
+            tag = tag.strip()
+            if tag == '*':
+                return True
+            tag = tag[2:] if tag.startswith('W/') else tag
+            if tag.strip('"').split('-')[0] == entry['etag']:
+                return True
+        return False
+
+    def record_not_modified(self):
+        with self.lock:
+            self.stats['not_modified'] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {**self.stats, 'entries': len(self.entries), 'bytes': self.total_bytes,
+                    'max_entries': self.max_entries, 'max_bytes': self.max_bytes,
+                    'brotli_available': brotli is not None}
+
+
+class SingleFlight:
+    """Coalesces concurrent generations of the same cache key into a single call"""
+
+    class _Call:
+        __slots__ = ('event', 'result', 'error', 'thread')
+
+        def __init__(self):
+            self.event = threading.Event()
+            self.result = None
+            self.error = None
+            self.thread = threading.get_ident()
+
+    def __init__(self, cache: 'ContentCache', lease_ttl: int = None, wait_timeout: int = None,
+                 scheduler: GenerationScheduler = None):
+        self.cache = cache
+        self.scheduler = scheduler
+        self.lease_ttl = lease_ttl if lease_ttl is not None else Config.GENERATION_LEASE_TTL
+        self.wait_timeout = wait_timeout if wait_timeout is not None else Config.GENERATION_WAIT_TIMEOUT
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.stats = {'leaders': 0, 'followers': 0, 'remote_waits': 0, 'remote_hits': 0}
+
+    def begin(self, key: str):
+        """Claim a key for generation; returns the call to finish() or None if it is already in flight"""
+        with self.lock:
+            if key in self.calls:
+                return None
+            call = self.calls[key] = self._Call()
+            self.stats['leaders'] += 1
+            return call
+
+    def finish(self, key: str, call: '_Call', result: Any = None, error: Exception = None):
+        """Publish the outcome of a begin()-claimed generation to waiting callers"""
+        call.result = result
+        call.error = error
+        with self.lock:
+            self.calls.pop(key, None)
+        call.event.set()
+
+    def do(self, key: str, generate, refresh: bool = False):
+        """Run generate() once per key; concurrent callers wait for and share its result
+
+        With refresh=True a cached but stale value does not count as a hit, and the call returns
+        None instead of waiting when another worker is already regenerating the key.
+        """
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = self._Call()
+                self.stats['leaders'] += 1
+            else:
+                self.stats['followers'] += 1
+
+        if not leader:
+            if self.scheduler is not None:
+                # Waiting on a background generation makes it as urgent as this caller
+                self.scheduler.boost(call.thread)
+            if call.event.wait(self.wait_timeout):
+                if call.error is not None:
+                    raise call.error
+                if call.result is not None:
+                    return call.result
+                # The leader gave this key up (e.g. a batch that lost the lease); load it ourselves
+                return self._load(key, generate, refresh)
+            print(f"⏳ Timed out waiting for in-flight generation of {key}, generating directly")
+            return generate()
+
+        result, error = None, None
+        try:
+            result = self._load(key, generate, refresh)
+            return result
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self.finish(key, call, result, error)
+
+    def do_many(self, keys: List[str], generate_many) -> Dict[str, Any]:
+        """Generate several keys with one generate_many(keys) call
+
+        Only keys that no other caller (or, with Redis, no other worker) is generating are claimed;
+        the rest are left to their current owner and omitted from the result.
+        """
+        claimed = {}
+        with self.lock:
+            for key in keys:
+                if key not in self.calls:
+                    claimed[key] = self.calls[key] = self._Call()
+                    self.stats['leaders'] += 1
+
+        l2 = self.cache.l2
+        token = f"{os.getpid()}:{threading.get_ident()}:{time.time()}"
+        leased = []
+        results = {}
+        try:
+            todo = []
+            for key in claimed:
+                value = self._cached(key, False)
+                if value is not None:
+                    results[key] = value
+                elif l2 is None:
+                    todo.append(key)
+                elif l2.acquire_lease(key, token, self.lease_ttl):
+                    leased.append(key)
+                    todo.append(key)
+            if todo:
+                results.update(generate_many(todo))
+            for key, call in claimed.items():
+                call.result = results.get(key)
+            return results
+        except Exception as e:
+            for call in claimed.values():
+                call.error = e
+            raise
+        finally:
+            for key in leased:
+                l2.release_lease(key, token)
+            with self.lock:
+                for key in claimed:
+                    self.calls.pop(key, None)
+            for call in claimed.values():
+                call.event.set()
+
+    def _cached(self, key: str, refresh: bool):
+        entry = self.cache.get_entry(key)
+        if entry is None or (refresh and self.cache.is_stale(entry[1])):
+            return None
+        return entry[0]
+
+    def _load(self, key: str, generate, refresh: bool = False):
+        # Another caller may have filled the cache between our miss and becoming leader
+        value = self._cached(key, refresh)
+        if value is not None:
+            return value
+
+        l2 = self.cache.l2
+        if l2 is None:
+            return generate()
+
+        token = f"{os.getpid()}:{threading.get_ident()}:{time.time()}"
+        if l2.acquire_lease(key, token, self.lease_ttl):
+            try:
+                value = self._cached(key, refresh)
+                return value if value is not None else generate()
+            finally:
+                l2.release_lease(key, token)
+
+        if refresh:
+            return None
+
+        # Another worker holds the lease: wait for its result to land in the shared cache
+        self.stats['remote_waits'] += 1
+        deadline = time.time() + self.wait_timeout
+        while time.time() < deadline:
+            time.sleep(Config.GENERATION_POLL_INTERVAL)
+            value = self.cache.get(key)
+            if value is not None:
+                self.stats['remote_hits'] += 1
+                return value
+            if not l2.lease_held(key):
+                break
+        return generate()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {**self.stats, 'in_flight': len(self.calls)}
+
+
+class StaleRefresher:
+    """Regenerates stale cache entries in the background while the stale copy keeps being served"""
+
+    def __init__(self, flight: SingleFlight, available, max_workers: int = None):
+        self.flight = flight
+        self.available = available
+        self.executor = ThreadPoolExecutor(max_workers=max_workers or Config.REFRESH_MAX_WORKERS,
+                                           thread_name_prefix='refresh')
+        self.pending = set()
+        self.lock = threading.Lock()
+        self.stats = {'scheduled': 0, 'refreshed': 0, 'skipped': 0, 'failed': 0}
+
+    def schedule(self, key: str, generate) -> bool:
+        with self.lock:
+            if key in self.pending:
+                return False
+            self.pending.add(key)
+            self.stats['scheduled'] += 1
+        self.executor.submit(self._refresh, key, generate)
+        return True
+
+    def _refresh(self, key: str, generate):
+        outcome = 'skipped'
+        try:
+            # Keep serving the stale copy rather than replacing it with fallback content
+            if self.available():
+                # Another worker may already have refreshed the shared copy
+                if self.flight.cache.l2 is not None:
+                    self.flight.cache.drop_local(key)
+                with openai_service.scheduler.priority(GenerationScheduler.PREFETCH):
+                    if self.flight.do(key, generate, refresh=True) is not None:
+                        outcome = 'refreshed'
+        except Exception as e:
+            print(f"❌ Background refresh failed for {key}: {e}")
+            outcome = 'failed'
+        finally:
+            with self.lock:
+                self.pending.discard(key)
+                self.stats[outcome] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {**self.stats, 'in_flight': len(self.pending)}
+
+
+class Prefetcher:
+    """Generates the content a learner is likely to request next on a bounded low-priority queue"""
+
+    def __init__(self, workers: int = None, queue_size: int = None, depth: int = None, tracked: int = 5000):
+        self.depth = depth if depth is not None else Config.PREFETCH_DEPTH
+        self.queue = queue.Queue(maxsize=queue_size or Config.PREFETCH_QUEUE_SIZE)
+        self.queued = set()
+        # Keys generated by prefetch that have not been requested yet, oldest first
+        self.prefetched = OrderedDict()
+        self.tracked = tracked
+        self.lock = threading.Lock()
+        self.stats = {'enqueued': 0, 'dropped': 0, 'already_cached': 0, 'generated': 0, 'skipped': 0,
+                      'errors': 0, 'hits': 0, 'wasted': 0}
+        for i in range(workers or Config.PREFETCH_WORKERS):
+            threading.Thread(target=self._run, name=f'prefetch-{i}', daemon=True).start()
+
+    def after_question(self, chapter: Dict, language: str, level: int):
+        """Queue the next levels of this chapter (as one batch) and the next chapter's concept"""
+        next_levels = list(range(level + 1, min(level + self.depth, Config.MAX_QUESTION_LEVEL) + 1))
+        if next_levels:
+            self._enqueue({ContentCache.question_key(chapter['id'], language, next_level): next_level
+                           for next_level in next_levels}, ('questions', chapter['id'], language))
+        next_chapter = chapter_manager.get_chapter(chapter['id'] + 1)
+        if next_chapter:
+            self._enqueue({ContentCache.concept_key(next_chapter['id'], language): None},
+                          ('concept', next_chapter['id'], language))
+
+    def _enqueue(self, keys: Dict[str, Any], task: tuple):
+        with self.lock:
+            keys = {key: level for key, level in keys.items() if key not in self.queued and key not in self.prefetched}
+            if not keys:
+                return
+            try:
+                self.queue.put_nowait((keys, task))
+            except queue.Full:
+                self.stats['dropped'] += len(keys)
+                return
+            self.queued.update(keys)
+            self.stats['enqueued'] += len(keys)
+
+    def _run(self):
+        while True:
+            keys, (kind, chapter_id, language) = self.queue.get()
+            outcomes = dict.fromkeys(keys, 'generated')
+            try:
+                for key in cache.get_entries(list(keys)):
+                    outcomes[key] = 'already_cached'
+                remaining = [key for key, outcome in outcomes.items() if outcome == 'generated']
+                if remaining and not openai_service.is_available():
+                    # Fallback content is cheap to build on demand, no point prefetching it
+                    outcomes.update(dict.fromkeys(remaining, 'skipped'))
+                elif remaining:
+                    chapter = chapter_manager.get_chapter(chapter_id)
+                    with openai_service.scheduler.priority(GenerationScheduler.PREFETCH):
+                        if kind == 'concept':
+                            load_concept(chapter, language)
+                        else:
+                            load_questions(chapter, language, [keys[key] for key in remaining])
+            except Exception as e:
+                print(f"❌ Prefetch error for {list(keys)}: {e}")
+                outcomes.update({key: 'errors' for key, outcome in outcomes.items() if outcome == 'generated'})
+            with self.lock:
+                for key, outcome in outcomes.items():
+                    self.queued.discard(key)
+                    self.stats[outcome] += 1
+                    if outcome == 'generated':
+                        self.prefetched[key] = time.time()
+                while len(self.prefetched) > self.tracked:
+                    self.prefetched.popitem(last=False)
+                    self.stats['wasted'] += 1
+
+    def record_hit(self, key: str):
+        """Called when a cached key is served, to measure how many prefetches paid off"""
+        with self.lock:
+            if self.prefetched.pop(key, None) is not None:
+                self.stats['hits'] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                **self.stats,
+                'queue_depth': self.queue.qsize(),
+                'pending_unused': len(self.prefetched),
+                'hit_rate': round(self.stats['hits'] / self.stats['generated'], 4) if self.stats['generated'] else 0.0
+            }
+
+
+def minhash_permutations(count: int, prime: int, seed: int = 0x5EED) -> List[tuple]:
+    """Fixed (a, b) pairs for MinHash; a fixed seed keeps signatures comparable across workers and restarts"""
+    rng = random.Random(seed)
+    return [(rng.randrange(1, prime), rng.randrange(prime)) for _ in range(count)]
+
+
+class NearDuplicateIndex:
+    """MinHash signatures over character shingles, bucketed by LSH bands to find near-identical texts"""
+
+    PRIME = (1 << 61) - 1
+    # Two-row bands make pairs near the default threshold candidates almost surely; checks are cheap
+    BANDS, ROWS = 16, 2
+    SHINGLE_CHARS = 5
+    PERMUTATIONS = minhash_permutations(BANDS * ROWS, PRIME)
+
+    def __init__(self, threshold: float = None):
+        self.threshold = threshold if threshold is not None else Config.QUESTION_POOL_DUPLICATE_THRESHOLD
+        self.buckets = {}
+        self.signatures = {}
+
+    @classmethod
+    def signature(cls, text: str) -> tuple:
+        normalized = ' '.join(re.findall(r'[a-z0-9]+', text.lower()))
+        shingles = {normalized[i:i + cls.SHINGLE_CHARS]
+                    for i in range(max(len(normalized) - cls.SHINGLE_CHARS + 1, 1))}
+        hashes = [int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'big')
+                  for shingle in shingles]
+        return tuple(min((a * h + b) % cls.PRIME for h in hashes) for a, b in cls.PERMUTATIONS)
+
+    def _bands(self, signature: tuple):
+        for band in range(self.BANDS):
+            yield band, signature[band * self.ROWS:(band + 1) * self.ROWS]
+
+    def find(self, signature: tuple):
+        """Return (item_id, estimated Jaccard similarity) of the closest indexed text above threshold, or None"""
+        candidates = {item_id for band in self._bands(signature) for item_id in self.buckets.get(band, ())}
+        best = None
+        for item_id in candidates:
+            other = self.signatures[item_id]
+            similarity = sum(1 for a, b in zip(signature, other) if a == b) / len(signature)
+            if similarity >= self.threshold and (best is None or similarity > best[1]):
+                best = (item_id, similarity)
+        return best
+
+    def add(self, item_id: str, signature: tuple):
+        self.signatures[item_id] = signature
+        for band in self._bands(signature):
+            self.buckets.setdefault(band, []).append(item_id)
+
+
+class QuestionVariantPools:
+    """Keeps several generated variants of each question so learners do not all get the same problem
+
+    Each (chapter, language, level) pool is append-only: the cached question plus extra variants
+    persisted under their own cache key. A user walks the pool in a rotation starting at a position
+    derived from their id, so picking the next unseen variant is O(1) and never repeats until the
+    pool is exhausted. A background worker tops a pool up when a user nears its end.
+    """
+
+    def __init__(self, size: int = None, max_size: int = None, low_water: int = None, workers: int = None,
+                 tracked_users: int = None):
+        self.size = size if size is not None else Config.QUESTION_POOL_SIZE
+        self.max_size = max(max_size if max_size is not None else Config.QUESTION_POOL_MAX_SIZE, self.size)
+        self.low_water = low_water if low_water is not None else Config.QUESTION_POOL_LOW_WATER
+        self.tracked_users = tracked_users or Config.QUESTION_POOL_TRACKED_USERS
+        self.pools = {}
+        # (user, key) -> [rotation start, pool size at first visit, variants served], least recent first
+        self.cursors = OrderedDict()
+        self.lock = threading.Lock()
+        self.queue = queue.Queue(maxsize=Config.PREFETCH_QUEUE_SIZE)
+        self.queued = set()
+        self.stats = {'served': 0, 'advanced': 0, 'exhausted': 0, 'generated': 0, 'duplicates': 0,
+                      'failed': 0, 'dropped': 0}
+        for i in range(workers if workers is not None else Config.QUESTION_POOL_WORKERS):
+            threading.Thread(target=self._run, name=f'question-pool-{i}', daemon=True).start()
+
+    @staticmethod
+    def pool_key(chapter_id: int, language: str, level: int) -> str:
+        return f"question_variants_{chapter_id}_{language}_{level}"
+
+    def _pool(self, chapter_id: int, language: str, level: int, primary: Dict = None) -> Dict[str, Any]:
+        """Return the local pool for a key, loading stored variants on first use"""
+        key = self.pool_key(chapter_id, language, level)
+        with self.lock:
+            pool = self.pools.get(key)
+        if pool is None or time.time() - pool['loaded_at'] > Config.CACHE_L1_TIMEOUT:
+            primary = primary or cache.get_question(chapter_id, language, level)
+            self._merge(key, ([primary] if primary else []) + (cache.get(key) or []))
+        elif primary is not None and str(primary.get('problem_id')) not in pool['by_id']:
+            # The cached question was regenerated; the new one joins the pool, the old stays servable
+            self._merge(key, [primary])
+        with self.lock:
+            return self.pools[key]
+
+    def _merge(self, key: str, questions: List[Dict]) -> List[Dict]:
+        """Append questions not already in the pool, returning the ones that were added"""
+        added = []
+        with self.lock:
+            pool = self.pools.setdefault(key, {'variants': [], 'by_id': {}, 'index': NearDuplicateIndex(),
+                                               'max_served': 0, 'loaded_at': 0, 'retry_after': 0})
+            pool['loaded_at'] = time.time()
+            for question in questions:
+                problem_id = str(question.get('problem_id'))
+                # Template questions are served while the provider is down, never kept as variants
+                if problem_id in pool['by_id'] or FallbackCatalog.is_fallback(question):
+                    continue
+                pool['variants'].append(question)
+                pool['by_id'][problem_id] = question
+                pool['index'].add(problem_id, self._signature(question))
+                added.append(question)
+        return added
+
+    @staticmethod
+    def _signature(question: Dict) -> tuple:
+        return NearDuplicateIndex.signature(f"{question.get('title', '')} {question.get('description', '')}")
+
+    @staticmethod
+    def _variant_index(start: int, initial: int, served: int, size: int) -> int:
+        """Position of a user's served-th variant: a rotation of the first-visit pool, then later additions"""
+        if served < initial - start:
+            return start + served
+        if served < initial:
+            return served - (initial - start)
+        return served if served < size else served % size
+
+    def serve(self, chapter: Dict, language: str, level: int, user: str, advance: bool = False) -> Dict[str, Any]:
+        """Return the user's current variant, or the next one they have not seen when advance is set"""
+        primary = load_question(chapter, language, level)
+        key = self.pool_key(chapter['id'], language, level)
+        pool = self._pool(chapter['id'], language, level, primary)
+        with self.lock:
+            size = len(pool['variants'])
+            if not size:
+                return primary
+            cursor = self.cursors.pop((user, key), None)
+            if cursor is None:
+                cursor = [zlib.crc32(f"{user}:{key}".encode('utf-8')) % size, size, 1]
+            elif advance:
+                cursor[2] += 1
+                self.stats['advanced'] += 1
+            self.cursors[(user, key)] = cursor
+            while len(self.cursors) > self.tracked_users:
+                self.cursors.popitem(last=False)
+            start, initial, served = cursor
+            if served > size:
+                self.stats['exhausted'] += 1
+            pool['max_served'] = max(pool['max_served'], served)
+            target = min(self.max_size, max(self.size, pool['max_served'] + self.low_water))
+            self.stats['served'] += 1
+            question = pool['variants'][self._variant_index(start, initial, served - 1, size)]
+        if size < target and time.time() >= pool['retry_after']:
+            self._enqueue(key, chapter, language, level, target)
+        return question
+
+    def find(self, chapter_id: int, language: str, level: int, problem_id: str):
+        """Look up a served variant by problem id (for solutions and grading)
+
+        A miss never creates a pool: the ids come from clients, and the variants another worker
+        added are read from the stored list instead.
+        """
+        key = self.pool_key(chapter_id, language, level)
+        with self.lock:
+            pool = self.pools.get(key)
+            question = pool['by_id'].get(str(problem_id)) if pool is not None else None
+        if question is None:
+            question = next((variant for variant in cache.get(key) or []
+                             if str(variant.get('problem_id')) == str(problem_id)), None)
+        return question
+
+    def _enqueue(self, key: str, chapter: Dict, language: str, level: int, target: int):
+        with self.lock:
+            if key in self.queued:
+                return
+            try:
+                self.queue.put_nowait((key, chapter, language, level, target))
+            except queue.Full:
+                self.stats['dropped'] += 1
+                return
+            self.queued.add(key)
+
+    def _run(self):
+        while True:
+            key, chapter, language, level, target = self.queue.get()
+            try:
+                if openai_service.is_available():
+                    with openai_service.scheduler.priority(GenerationScheduler.PREFETCH):
+                        self._replenish(key, chapter, language, level, target)
+            except Exception as e:
+                print(f"❌ Question pool replenish error for {key}: {e}")
+            finally:
+                with self.lock:
+                    self.queued.discard(key)
+
+    def _replenish(self, key: str, chapter: Dict, language: str, level: int, target: int):
+        # Near-duplicates still cost a generation, so give up on a key that keeps producing them
+        attempts = 2 * (target - len(self.pools[key]['variants']))
+        added = 0
+        while attempts > 0 and len(self.pools[key]['variants']) < target:
+            attempts -= 1
+            with self.lock:
+                avoid = [question.get('title', '') for question in self.pools[key]['variants']]
+            question = openai_service.generate_question_variant(chapter['name'], chapter['topics'], language,
+                                                                level, avoid)
+            if question is None:
+                with self.lock:
+                    self.stats['failed'] += 1
+                break
+            with self.lock:
+                duplicate = self.pools[key]['index'].find(self._signature(question))
+                if duplicate is not None:
+                    self.stats['duplicates'] += 1
+                    print(f"♻️ Dropped variant of {key} too similar to {duplicate[0]} ({duplicate[1]:.2f})")
+                    continue
+                if str(question.get('problem_id')) in self.pools[key]['by_id']:
+                    question['problem_id'] = f"{question.get('problem_id')}_v{len(self.pools[key]['variants'])}"
+            self._merge(key, [question])
+            self._persist(key, chapter['id'], language, level)
+            added += 1
+            with self.lock:
+                self.stats['generated'] += 1
+            print(f"✅ Added variant {len(self.pools[key]['variants'])} to {key}")
+        if len(self.pools[key]['variants']) < target and not added:
+            self.pools[key]['retry_after'] = time.time() + Config.QUESTION_POOL_RETRY_SECONDS
+
+    def _persist(self, key: str, chapter_id: int, language: str, level: int):
+        """Store the extra variants, keeping any another worker added meanwhile"""
+        if cache.l2 is not None:
+            cache.drop_local(key)
+        self._merge(key, cache.get(key) or [])
+        primary_id = str((cache.get_question(chapter_id, language, level) or {}).get('problem_id'))
+        with self.lock:
+            extras = [question for question in self.pools[key]['variants']
+                      if str(question.get('problem_id')) != primary_id and not FallbackCatalog.is_fallback(question)]
+        cache.set(key, extras)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self.lock:
+            sizes = [len(pool['variants']) for pool in self.pools.values()]
+            return {
+                **self.stats,
+                'pools': len(sizes),
+                'variants': sum(sizes),
+                'tracked_users': len(self.cursors),
+                'queue_depth': self.queue.qsize(),
+                'target_size': self.size,
+                'max_size': self.max_size,
+                'low_water': self.low_water
+            }
+
+
+class RateLimiter:
+    """Token bucket limiting how many operations may start per minute"""
+
+    def __init__(self, per_minute: int, burst: int = 1):
+        self.rate = per_minute / 60.0
+        self.capacity = max(burst, 1)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available"""
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class PreloadJob:
+    def __init__(self, items: List[Dict], groups: List[List[Dict]] = ()):
+        self.job_id = uuid.uuid4().hex[:12]
+        self.items = items
+        # Units of work for the pool: one concept, or one batch of question levels
+        self.groups = list(groups)
+        self.total = len(items)
+        self.status = 'queued' if items else 'completed'
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None if items else self.created_at
+        self.counts = {'loaded': 0, 'cached': 0, 'error': 0}
+        self.lock = threading.Lock()
+
+    def finish_item(self, item: Dict, status: str, duration: float, error: str = None):
+        with self.lock:
+            item['status'] = status
+            item['duration_ms'] = round(duration * 1000, 1)
+            if error:
+                item['error'] = error
+            self.counts[status] += 1
+            if sum(self.counts.values()) == self.total:
+                self.status = 'completed'
+                self.finished_at = time.time()
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self.lock:
+            done = sum(self.counts.values())
+            elapsed = ((self.finished_at or time.time()) - self.started_at) if self.started_at else 0
+            return {
+                'job_id': self.job_id,
+                'status': self.status,
+                'total': self.total,
+                'done': done,
+                'progress': round(done / self.total, 4) if self.total else 1.0,
+                **self.counts,
+                'created_at': self.created_at,
+                'started_at': self.started_at,
+                'finished_at': self.finished_at,
+                'elapsed_seconds': round(elapsed, 2),
+                'items_per_second': round(done / elapsed, 3) if elapsed else 0.0,
+                'errors': [item for item in self.items if item['status'] == 'error'],
+                'items': [dict(item) for item in self.items]
+            }
+
+
+class PreloadManager:
+    """Runs one preload job at a time in the background on a bounded, rate-limited worker pool
+
+    Workers are daemon threads, so a shutdown does not wait for the rest of a job to drain.
+    """
+
+    def __init__(self, max_workers: int = None, rate_per_minute: int = None, max_jobs: int = 20):
+        self.rate_limiter = RateLimiter(rate_per_minute if rate_per_minute is not None
+                                        else Config.PRELOAD_RATE_PER_MINUTE)
+        self.max_jobs = max_jobs
+        self.jobs = OrderedDict()
+        self.active = None
+        self.lock = threading.Lock()
+        self.queue = queue.Queue()
+        for i in range(max_workers or Config.PRELOAD_MAX_WORKERS):
+            threading.Thread(target=self._run, name=f'preload-{i}', daemon=True).start()
+
+    def _run(self):
+        while True:
+            job, group = self.queue.get()
+            self._run_group(job, group)
+
+    def submit(self, languages: List[str], levels: List[int]) -> tuple:
+        """Start a job, returning (job, True); while one is still running, returns (that job, False)"""
+        with self.lock:
+            if self.active is not None and self.active.status in ('queued', 'running'):
+                return self.active, False
+            self.active = self._create(languages, levels)
+            job = self.active
+        for group in job.groups:
+            self.queue.put((job, group))
+        self._publish(job)
+        print(f"🚀 Preload job {job.job_id} queued with {job.total} items")
+        return job, True
+
+    def _create(self, languages: List[str], levels: List[int]) -> PreloadJob:
+        items = []
+        groups = []
+        for language in languages:
+            for chapter in chapter_manager.get_all_chapters():
+                concept_item = {'type': 'concept', 'chapter': chapter['name'], 'chapter_id': chapter['id'],
+                                'language': language, 'status': 'pending'}
+                question_items = [{'type': 'question', 'chapter': chapter['name'], 'chapter_id': chapter['id'],
+                                   'language': language, 'level': level, 'status': 'pending'} for level in levels]
+                items.append(concept_item)
+                items.extend(question_items)
+                # Questions are generated several levels per request
+                groups.append([concept_item])
+                for i in range(0, len(question_items), Config.QUESTION_BATCH_SIZE):
+                    groups.append(question_items[i:i + Config.QUESTION_BATCH_SIZE])
+
+        job = PreloadJob(items, groups)
+        self.jobs[job.job_id] = job
+        while len(self.jobs) > self.max_jobs:
+            self.jobs.popitem(last=False)
+        return job
+
+    def _run_group(self, job: PreloadJob, group: List[Dict]):
+        """Load one concept, or one batch of question levels, for a chapter and language"""
+        with job.lock:
+            if job.started_at is None:
+                job.started_at = time.time()
+                job.status = 'running'
+            for item in group:
+                item['status'] = 'running'
+
+        first = group[0]
+        chapter = chapter_manager.get_chapter(first['chapter_id'])
+        language = first['language']
+        started = time.perf_counter()
+        pending = list(group)
+        try:
+            if first['type'] == 'concept':
+                keys = [ContentCache.concept_key(chapter['id'], language)]
+            else:
+                keys = [ContentCache.question_key(chapter['id'], language, item['level']) for item in group]
+
+            cached = cache.get_many(keys)
+            for key, item in zip(keys, group):
+                if key in cached:
+                    job.finish_item(item, 'cached', time.perf_counter() - started)
+                    pending.remove(item)
+
+            if pending:
+                self.rate_limiter.acquire()
+                with openai_service.scheduler.priority(GenerationScheduler.PRELOAD):
+                    if first['type'] == 'concept':
+                        load_concept(chapter, language)
+                    else:
+                        load_questions(chapter, language, [item['level'] for item in pending])
+                for item in pending:
+                    job.finish_item(item, 'loaded', time.perf_counter() - started)
+        except Exception as e:
+            print(f"❌ Preload error for {chapter['name']} in {language}: {e}")
+            for item in pending:
+                if item['status'] == 'running':
+                    job.finish_item(item, 'error', time.perf_counter() - started, str(e))
+        self._publish(job)
+
+    def _publish(self, job: PreloadJob):
+        """Share job progress through the L2 cache so any worker can answer status requests"""
+        if cache.l2 is not None:
+            summary = job.to_dict()
+            cache.l2.set(f"preload_job_{job.job_id}", summary, ttl=Config.PRELOAD_JOB_TTL)
+
+    def get_status(self, job_id: str):
+        with self.lock:
+            job = self.jobs.get(job_id)
+        if job is not None:
+            return job.to_dict()
+        if cache.l2 is not None:
+            return cache.l2.get(f"preload_job_{job_id}")
+        return None
+
+
+SANDBOX_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sandbox_runner.py')
+
+
+def sandbox_options(hide: List[str] = (), binds: List[tuple] = ()) -> Dict[str, Any]:
+    """Isolation settings handed to sandbox_runner.py; binds are (source, target) shown read-only"""
+    return {
+        'uid': Config.SANDBOX_UID if os.geteuid() == 0 else None,
+        'namespaces': Config.SANDBOX_NAMESPACES,
+        'hide': Config.SANDBOX_HIDDEN_PATHS + list(hide),
+        'binds': [list(bind) for bind in binds]
+    }
+
+
+def sandbox_isolated() -> bool:
+    """Whether sandboxes get a user of their own, so per-user limits such as RLIMIT_NPROC are safe"""
+    return Config.SANDBOX_NAMESPACES or os.geteuid() == 0
+
+
+def sandbox_env() -> Dict[str, str]:
+    """The whole environment a sandboxed process gets; nothing from the server's own leaks through"""
+    return {'PATH': os.environ.get('PATH', '/usr/bin:/bin'), 'PYTHONIOENCODING': 'utf-8'}
+
+
+def sandbox_workdir() -> str:
+    """A private scratch directory the sandbox uid can write to"""
+    workdir = tempfile.mkdtemp(prefix='sandbox-')
+    if os.geteuid() == 0:
+        os.chown(workdir, Config.SANDBOX_UID, Config.SANDBOX_UID)
+    return workdir
+
+
+def chown_tree(path: str, uid: int):
+    for root, dirs, files in os.walk(path):
+        os.chown(root, uid, uid)
+        for name in files:
+            os.lchown(os.path.join(root, name), uid, uid)
+
+
+class WarmProcessPool:
+    """Keeps one-shot sandbox processes started and idle so a submission only pays for the hand-off
+
+    Each process gets a private socket (proc.channel) for its job and result, and a file (proc.output)
+    for its stdout and stderr, so nothing a submission prints can be mistaken for the result.
+    """
+
+    def __init__(self, command: List[str], size: int):
+        self.command = command
+        self.size = size
+        self.idle = queue.Queue()
+        self.lock = threading.Lock()
+        self.pid = None
+        self.stats = {'warm_hits': 0, 'cold_starts': 0}
+
+    def _spawn(self):
+        workdir = sandbox_workdir()
+        channel, child_channel = socket.socketpair()
+        output = tempfile.TemporaryFile()
+        try:
+            proc = subprocess.Popen(
+                self.command + ['--channel', str(child_channel.fileno()), '--sandbox', json.dumps(sandbox_options())],
+                stdin=subprocess.DEVNULL,
+                stdout=output,
+                stderr=subprocess.STDOUT,
+                pass_fds=(child_channel.fileno(),),
+                cwd=workdir,
+                env=sandbox_env(),
+                start_new_session=True
+            )
+        except OSError:
+            channel.close()
+            output.close()
+            shutil.rmtree(workdir, ignore_errors=True)
+            raise
+        finally:
+            child_channel.close()
+        proc.workdir, proc.channel, proc.output = workdir, channel, output
+        return proc
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, 'idle': self.idle.qsize()}
+
+    def _fill(self):
+        while self.idle.qsize() < self.size:
+            try:
+                self.idle.put(self._spawn())
+            except OSError as e:
+                print(f"❌ Could not start sandbox process: {e}")
+                return
+
+    def acquire(self) -> subprocess.Popen:
+        """Take a warm process (or start one) and top the pool back up in the background"""
+        with self.lock:
+            if self.pid != os.getpid():
+                # Processes inherited across a fork belong to the parent
+                self.pid = os.getpid()
+                self.idle = queue.Queue()
+        proc = None
+        while proc is None:
+            try:
+                candidate = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            if candidate.poll() is None:
+                proc = candidate
+            else:
+                self.release(candidate)
+        if proc is None:
+            self.stats['cold_starts'] += 1
+            proc = self._spawn()
+        else:
+            self.stats['warm_hits'] += 1
+        threading.Thread(target=self._fill, daemon=True).start()
+        return proc
+
+    @staticmethod
+    def release(proc: subprocess.Popen) -> str:
+        """Kill the process and clean up after it, returning the tail of what it printed"""
+        if proc.poll() is None:
+            try:
+                os.killpg(proc.pid, signal.SIGKILL)
+            except OSError:
+                pass
+            proc.wait()
+        proc.channel.close()
+        proc.output.seek(0, os.SEEK_END)
+        proc.output.seek(max(proc.output.tell() - 2000, 0))
+        printed = proc.output.read().decode('utf-8', errors='replace')
+        proc.output.close()
+        shutil.rmtree(proc.workdir, ignore_errors=True)
+        return printed
+
+
+class PythonRunner:
+    """Runs Python submissions through sandbox_runner.py in warm, resource-limited processes
+
+    The sandbox only reports what the submission returned for each input; expected outputs stay
+    here and grading happens in this process.
+    """
+
+    SCRIPT = SANDBOX_SCRIPT
+    MAX_REPLY_BYTES = 8 * 1024 * 1024
+    REPORTED_STATUSES = ('timeout', 'cpu_limit', 'memory_limit', 'error', 'skipped')
+
+    def __init__(self, pool_size: int = None):
+        self.pool = WarmProcessPool([sys.executable, '-I', self.SCRIPT],
+                                    pool_size if pool_size is not None else Config.EXECUTION_POOL_SIZE)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return self.pool.get_stats()
+
+    @staticmethod
+    def entry_point(question: Dict) -> str:
+        match = re.search(r'def\s+(\w+)', question.get('function_signature', ''))
+        return match.group(1) if match else None
+
+    def _receive(self, proc: subprocess.Popen, reader, deadline: float) -> Dict[str, Any]:
+        """Read one JSON line from the sandbox; raises TimeoutError or EOFError"""
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError()
+        proc.channel.settimeout(remaining)
+        try:
+            line = reader.readline(self.MAX_REPLY_BYTES)
+        except socket.timeout:
+            raise TimeoutError()
+        if not line.endswith(b'\n'):
+            raise EOFError('Result too large') if line else EOFError()
+        reply = json.loads(line)
+        if not isinstance(reply, dict):
+            raise EOFError('Malformed result')
+        return reply
+
+    @classmethod
+    def grade(cls, reported: Any, cases: List[Dict]) -> List[Dict[str, Any]]:
+        """Turn the values the sandbox reported into test results by comparing them with expected outputs"""
+        reported = reported if isinstance(reported, list) else []
+        results = []
+        for index, case in enumerate(cases):
+            item = reported[index] if index < len(reported) and isinstance(reported[index], dict) else {}
+            result = {'index': index, 'input': case.get('input'), 'expected': case.get('expected_output')}
+            if item.get('status') == 'returned':
+                shown = item.get('value') if isinstance(item.get('value'), str) else str(item.get('text', ''))
+                result['actual'] = shown if len(shown) <= 500 else shown[:500] + '...'
+                result['passed'] = grade_output(item, case.get('expected_output'))
+                result['status'] = 'passed' if result['passed'] else 'failed'
+            else:
+                status = item.get('status') if item.get('status') in cls.REPORTED_STATUSES else 'error'
+                result.update(passed=False, status=status, error=str(item.get('error') or 'No result reported')[:500])
+            for field in ('runtime_ms', 'peak_memory_kb'):
+                if isinstance(item.get(field), (int, float)):
+                    result[field] = item[field]
+            results.append(result)
+        return results
+
+    def run(self, code: str, question: Dict) -> Dict[str, Any]:
+        cases = question.get('test_cases', [])
+        job = {
+            'code': code,
+            'entry': self.entry_point(question),
+            'inputs': [case.get('input') for case in cases],
+            'limits': {
+                'cpu_seconds': Config.EXECUTION_CPU_SECONDS,
+                'memory_mb': Config.EXECUTION_MEMORY_MB,
+                'test_seconds': Config.EXECUTION_TEST_SECONDS
+            }
+        }
+        wall_limit = Config.EXECUTION_WALL_SECONDS
+        deadline = time.monotonic() + wall_limit
+        proc = self.pool.acquire()
+        outcome = None
+        try:
+            reader = proc.channel.makefile('rb')
+            proc.channel.sendall(json.dumps(job).encode('utf-8') + b'\n')
+            reply = self._receive(proc, reader, deadline)
+            if reply.get('status') == 'sandbox_error':
+                print(f"❌ {reply.get('error')}")
+                outcome = {'status': 'sandbox_error', 'error': 'The code sandbox is unavailable on this server',
+                           'test_results': []}
+            elif reply.get('status') != 'ok':
+                outcome = {'status': 'compile_error' if reply.get('status') == 'compile_error' else 'crashed',
+                           'error': str(reply.get('error', ''))[:2000], 'test_results': []}
+            else:
+                outcome = {'status': 'ok', 'test_results': self.grade(reply.get('test_results'), cases)}
+                if isinstance(reply.get('max_rss_kb'), int):
+                    outcome['max_rss_kb'] = reply['max_rss_kb']
+                if Config.PROFILE_ENABLED and cases and all(result['passed'] for result in outcome['test_results']):
+                    proc.channel.sendall(json.dumps({'profile': {
+                        'budget_seconds': Config.PROFILE_BUDGET_SECONDS,
+                        'max_size': Config.PROFILE_MAX_SIZE
+                    }}).encode('utf-8') + b'\n')
+                    try:
+                        profile = self._receive(proc, reader, deadline).get('profile')
+                        if isinstance(profile, dict):
+                            outcome['profile'] = profile
+                    except (TimeoutError, EOFError, ValueError):
+                        # The verdict stands without a complexity estimate
+                        pass
+        except TimeoutError:
+            outcome = {'status': 'timeout', 'error': f'Submission exceeded {wall_limit}s wall-clock limit',
+                       'test_results': []}
+        except (EOFError, ValueError, OSError) as e:
+            # Killed by a resource limit (e.g. SIGXCPU) before it could report
+            try:
+                proc.wait(timeout=1)
+            except subprocess.TimeoutExpired:
+                pass
+            reason = 'CPU time limit exceeded' if proc.returncode in (-signal.SIGXCPU, -signal.SIGKILL) \
+                else str(e) or f'exit code {proc.returncode}'
+            outcome = {'status': 'crashed', 'error': reason, 'test_results': []}
+        finally:
+            printed = self.pool.release(proc)
+        if outcome['status'] == 'crashed' and printed and not outcome['error'].startswith('CPU'):
+            outcome['error'] = f"{outcome['error']}\n{printed[-500:]}"
+        outcome['stdout'] = printed
+        return outcome
+
+
+def sandbox_command(command: List[str], report_fd: int, limits: Dict[str, Any] = None, hide: List[str] = (),
+                    binds: List[tuple] = ()) -> List[str]:
+    """The sandbox_runner.py --exec command line that runs command isolated and rlimited"""
+    return [sys.executable, '-I', '-S', SANDBOX_SCRIPT, '--exec', str(report_fd),
+            '--limits', json.dumps(limits or {}), '--sandbox', json.dumps(sandbox_options(hide, binds)),
+            '--', *command]
+
+
+def run_limited(command: List[str], stdin_data: str, timeout: float, cwd: str, limits: Dict[str, Any] = None,
+                env: Dict[str, str] = None, hide: List[str] = (), binds: List[tuple] = ()) -> Dict[str, Any]:
+    """Run a process isolated and rlimited (via sandbox_runner.py --exec) with a wall-clock timeout
+
+    Reports the program's own exit status, CPU time and peak RSS. If the sandbox could not be set
+    up nothing runs and 'sandbox_error' says why.
+    """
+    report_read, report_write = os.pipe()
+    wrapper = sandbox_command(command, report_write, limits, hide, binds)
+    with tempfile.TemporaryFile() as stdin, tempfile.TemporaryFile() as stdout, tempfile.TemporaryFile() as stderr, \
+            os.fdopen(report_read, 'rb') as report:
+        stdin.write((stdin_data or '').encode('utf-8'))
+        stdin.seek(0)
+        started = time.perf_counter()
+        try:
+            proc = subprocess.Popen(wrapper, stdin=stdin, stdout=stdout, stderr=stderr, cwd=cwd,
+                                    pass_fds=(report_write,), env=env or sandbox_env(), start_new_session=True)
+        finally:
+            os.close(report_write)
+        timed_out = threading.Event()
+
+        def kill():
+            timed_out.set()
+            try:
+                # Takes the sandbox's init with it, and with that everything in its PID namespace
+                os.killpg(proc.pid, signal.SIGKILL)
+            except OSError:
+                pass
+
+        timer = threading.Timer(timeout, kill)
+        timer.start()
+        proc.wait()
+        timer.cancel()
+        elapsed = time.perf_counter() - started
+        try:
+            usage = json.loads(report.read(64 * 1024) or b'{}')
+        except ValueError:
+            usage = {}
+        stdout.seek(0)
+        stderr.seek(0)
+        return {
+            'stdout': stdout.read(1024 * 1024).decode('utf-8', errors='replace'),
+            'stderr': stderr.read(64 * 1024).decode('utf-8', errors='replace'),
+            'returncode': usage.get('returncode', proc.returncode),
+            'timed_out': timed_out.is_set(),
+            'runtime_ms': usage.get('runtime_ms', round(elapsed * 1000, 3)),
+            'cpu_ms': usage.get('cpu_ms', 0.0),
+            'peak_memory_kb': usage.get('peak_memory_kb', 0),
+            'sandbox_error': usage.get('error')
+        }
+
+
+class CompileCache:
+    """Content-addressed store of build outputs keyed by language, toolchain, flags and source"""
+
+    def __init__(self, root: str = None, max_entries: int = None):
+        self.root = root or Config.COMPILE_CACHE_DIR
+        self.max_entries = max_entries if max_entries is not None else Config.COMPILE_CACHE_MAX_ENTRIES
+        os.makedirs(self.root, exist_ok=True)
+        self.locks = [threading.Lock() for _ in range(64)]
+        self.stats = {'hits': 0, 'misses': 0, 'compile_errors': 0}
+
+    @staticmethod
+    def key(language: str, toolchain: str, flags: List[str], source: str) -> str:
+        digest = hashlib.sha256()
+        for part in (language, toolchain, '\0'.join(flags), source):
+            digest.update(part.encode('utf-8'))
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def get_or_build(self, key: str, build) -> Dict[str, Any]:
+        """Return the cached build for key, running build(out_dir) -> (ok, log) on a miss
+
+        Builds happen in a private directory that is renamed into place, so concurrent workers
+        never observe a half-written artifact. Compile errors are cached too.
+        """
+        final = os.path.join(self.root, key)
+        with self.locks[int(key[:8], 16) % len(self.locks)]:
+            if os.path.isdir(final):
+                os.utime(final)
+                self.stats['hits'] += 1
+                return self._read(final, hit=True)
+
+            self.stats['misses'] += 1
+            building = tempfile.mkdtemp(dir=self.root, prefix='.build-')
+            try:
+                ok, log = build(building)
+            except Exception as e:
+                shutil.rmtree(building, ignore_errors=True)
+                return {'dir': None, 'ok': False, 'log': f'Build failed: {e}', 'hit': False}
+            if not ok:
+                self.stats['compile_errors'] += 1
+            with open(os.path.join(building, 'build.json'), 'w') as f:
+                json.dump({'ok': ok, 'log': log[-8000:]}, f)
+            try:
+                os.rename(building, final)
+            except OSError:
+                # Another worker finished the same build first
+                shutil.rmtree(building, ignore_errors=True)
+            self._prune()
+            return self._read(final, hit=False)
+
+    @staticmethod
+    def _read(path: str, hit: bool) -> Dict[str, Any]:
+        with open(os.path.join(path, 'build.json')) as f:
+            status = json.load(f)
+        return {'dir': path, 'ok': status['ok'], 'log': status['log'], 'hit': hit}
+
+    def _prune(self):
+        entries = [entry for entry in os.scandir(self.root) if entry.is_dir() and len(entry.name) == 64]
+        if len(entries) <= self.max_entries:
+            return
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in entries[:len(entries) - self.max_entries]:
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.stats['hits'] + self.stats['misses']
+        return {**self.stats, 'hit_ratio': round(self.stats['hits'] / lookups, 4) if lookups else 0.0}
+
+
+class CompiledLanguageRunner(ABC):
+    """Compiles a full program once (through the compile cache) and runs it per test case
+
+    Submissions for compiled languages are complete programs: each test case's input is written
+    to stdin and the program's stdout is compared with the expected output. There is no harness
+    that calls a function written to the question's signature yet, so code without a program
+    entry point is reported as not graded rather than failing every case.
+    """
+
+    language = None
+    source_file = None
+    flags = []
+    # Matches the program entry point (e.g. int main) in a complete submission
+    ENTRY_POINT = None
+
+    def __init__(self, compile_cache: CompileCache):
+        self.compile_cache = compile_cache
+        self._toolchain = None
+        self.stats = {'runs': 0, 'compile_ms': 0.0}
+
+    @classmethod
+    def create(cls, compile_cache: CompileCache):
+        """Return a runner if the toolchain is installed on this machine, else None"""
+        return cls(compile_cache) if cls.available() else None
+
+    @classmethod
+    @abstractmethod
+    def available(cls) -> bool:
+        """Whether the toolchain is installed"""
+
+    @abstractmethod
+    def toolchain_version(self) -> str:
+        """Version string of the compiler, part of every compile cache key"""
+
+    def toolchain(self) -> str:
+        if self._toolchain is None:
+            self._toolchain = self.toolchain_version()
+        return self._toolchain
+
+    @abstractmethod
+    def compile(self, source_path: str, out_dir: str) -> tuple:
+        """Build source_path into out_dir, returning (ok, compiler log)"""
+
+    @abstractmethod
+    def run_command(self, build_dir: str) -> List[str]:
+        """Command line that runs a build from build_dir"""
+
+    def run_env(self) -> Dict[str, str]:
+        return {'PATH': os.environ.get('PATH', '/usr/bin:/bin')}
+
+    def limits(self, cpu_seconds: int, memory_mb: int = None, file_size_mb: int = 1) -> Dict[str, Any]:
+        limits = {'cpu_seconds': cpu_seconds, 'memory_mb': memory_mb, 'file_size_mb': file_size_mb,
+                  'open_files': Config.EXECUTION_MAX_OPEN_FILES}
+        if sandbox_isolated():
+            limits['processes'] = Config.EXECUTION_MAX_PROCESSES
+        return limits
+
+    def run_compiler(self, command: List[str], cwd: str = None) -> Dict[str, Any]:
+        """Compilers see submitted source too, so they run sandboxed like the programs they build"""
+        return run_limited(command, '', Config.COMPILE_TIMEOUT, cwd or tempfile.gettempdir(),
+                           limits=self.limits(Config.COMPILE_TIMEOUT, file_size_mb=256), env=self.run_env())
+
+    @staticmethod
+    def compiler_log(result: Dict[str, Any], log: str) -> str:
+        if result['sandbox_error']:
+            return result['sandbox_error']
+        return 'Compilation timed out' if result['timed_out'] else log
+
+    def memory_limit_mb(self):
+        """Address-space limit for test runs; managed runtimes limit their heap instead"""
+        return Config.EXECUTION_MEMORY_MB
+
+    def source_name(self, code: str) -> str:
+        return self.source_file
+
+    def warm(self):
+        """Prepare the toolchain ahead of the first submission (no-op unless overridden)"""
+
+    def build(self, code: str) -> Dict[str, Any]:
+        def build_into(out_dir):
+            source_dir = os.path.join(out_dir, 'src')
+            os.makedirs(source_dir)
+            source_path = os.path.join(source_dir, self.source_name(code))
+            with open(source_path, 'w', encoding='utf-8') as f:
+                f.write(code)
+            as_root = os.geteuid() == 0
+            if as_root:
+                chown_tree(out_dir, Config.SANDBOX_UID)
+            try:
+                ok, log = self.compile(source_path, out_dir)
+            finally:
+                if as_root:
+                    # Builds go back to the server; sandboxes may read their own but never change it
+                    chown_tree(out_dir, 0)
+                    os.chmod(out_dir, 0o755)
+            # Report diagnostics against the bare file name, not the build directory
+            return ok, log.replace(source_dir + os.sep, '')
+
+        started = time.perf_counter()
+        key = CompileCache.key(self.language, self.toolchain(), self.flags, code)
+        build = self.compile_cache.get_or_build(key, build_into)
+        if not build['hit']:
+            self.stats['compile_ms'] += (time.perf_counter() - started) * 1000
+        return build
+
+    @staticmethod
+    def outputs_match(actual: str, expected: Any) -> bool:
+        expected = expected if isinstance(expected, str) else json.dumps(expected)
+        if actual.split() == expected.split():
+            return True
+        try:
+            return ast.literal_eval(actual.strip()) == ast.literal_eval(expected.strip())
+        except (SyntaxError, ValueError):
+            return False
+
+    def run(self, code: str, question: Dict) -> Dict[str, Any]:
+        if not self.ENTRY_POINT.search(code):
+            return {'supported': False, 'status': 'unsupported', 'test_results': [],
+                    'error': f"Only complete {self.language} programs that read the test input from stdin "
+                             f"are graded automatically for now; add a main method that calls your function."}
+        build = self.build(code)
+        if not build['ok']:
+            return {'status': 'compile_error', 'error': build['log'], 'test_results': [],
+                    'compile_cached': build['hit']}
+
+        self.stats['runs'] += 1
+        results = []
+        deadline = time.monotonic() + Config.EXECUTION_WALL_SECONDS
+        for index, case in enumerate(question.get('test_cases', [])):
+            result = {'index': index, 'input': case.get('input'), 'expected': case.get('expected_output')}
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                result.update(passed=False, status='skipped', error='Wall-clock limit exhausted')
+                results.append(result)
+                continue
+            outcome = self.run_case(build['dir'], str(case.get('input', '')),
+                                    min(Config.EXECUTION_TEST_SECONDS, remaining))
+            if outcome['sandbox_error']:
+                print(f"❌ {outcome['sandbox_error']}")
+                return {'status': 'sandbox_error', 'error': 'The code sandbox is unavailable on this server',
+                        'test_results': [], 'compile_cached': build['hit']}
+            result['actual'] = outcome['stdout'][:500]
+            result['runtime_ms'] = outcome['runtime_ms']
+            result['cpu_ms'] = outcome['cpu_ms']
+            result['peak_memory_kb'] = outcome['peak_memory_kb']
+            if outcome['timed_out']:
+                result.update(passed=False, status='timeout',
+                              error=f"Exceeded {Config.EXECUTION_TEST_SECONDS}s time limit")
+            elif outcome['returncode'] != 0:
+                result.update(passed=False, status='error',
+                              error=outcome['stderr'][-500:] or f"exit code {outcome['returncode']}")
+            else:
+                result['passed'] = self.outputs_match(outcome['stdout'], case.get('expected_output', ''))
+                result['status'] = 'passed' if result['passed'] else 'failed'
+            results.append(result)
+        return {'status': 'ok', 'test_results': results, 'compile_cached': build['hit']}
+
+    def run_case(self, build_dir: str, stdin_data: str, timeout: float) -> Dict[str, Any]:
+        """Run the program on one input in a fresh workdir; with namespaces it sees only its own build"""
+        workdir = sandbox_workdir()
+        try:
+            command = self.run_command(build_dir)
+            hide, binds = [], []
+            if Config.SANDBOX_NAMESPACES:
+                # Mounted read-only in the workdir, with the rest of the compile cache hidden
+                visible = os.path.join(workdir, 'build')
+                os.mkdir(visible)
+                command = [visible + arg[len(build_dir):] if arg.startswith(build_dir) else arg for arg in command]
+                hide, binds = [self.compile_cache.root], [(build_dir, visible)]
+            return run_limited(command, stdin_data, timeout, workdir,
+                               limits=self.limits(Config.EXECUTION_CPU_SECONDS, self.memory_limit_mb()),
+                               env=self.run_env(), hide=hide, binds=binds)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, 'toolchain': self._toolchain}
+
+
+class CppRunner(CompiledLanguageRunner):
+    """g++ with <bits/stdc++.h> force-included and precompiled once per toolchain
+
+    The header is always included so a submission compiles the same way whether or not the
+    precompiled copy is ready yet; the .gch only makes it faster.
+    """
+
+    language = 'cpp'
+    source_file = 'main.cpp'
+    flags = ['-O2', '-std=c++17']
+    ENTRY_POINT = re.compile(r'\bint\s+main\s*\(')
+    PCH_HEADER = 'algolearn_pch.h'
+
+    def __init__(self, compile_cache: CompileCache):
+        super().__init__(compile_cache)
+        self.pch_dir = os.path.join(compile_cache.root, 'pch-' + CompileCache.key(
+            'cpp-pch', self.toolchain(), self.flags, '')[:16])
+        os.makedirs(self.pch_dir, exist_ok=True)
+        with open(os.path.join(self.pch_dir, self.PCH_HEADER), 'w') as f:
+            f.write('#include <bits/stdc++.h>\n')
+
+    @classmethod
+    def available(cls) -> bool:
+        return shutil.which('g++') is not None
+
+    def toolchain_version(self) -> str:
+        return subprocess.run(['g++', '--version'], capture_output=True, text=True).stdout.split('\n')[0]
+
+    def warm(self):
+        header = os.path.join(self.pch_dir, self.PCH_HEADER)
+        if not os.path.exists(header + '.gch'):
+            building = header + f'.gch.{os.getpid()}'
+            result = subprocess.run(['g++', *self.flags, '-x', 'c++-header', header, '-o', building],
+                                    capture_output=True, text=True, timeout=120)
+            if result.returncode != 0:
+                print(f"❌ Could not build C++ precompiled header: {result.stderr[-300:]}")
+                return
+            os.replace(building, header + '.gch')
+        print("✅ C++ precompiled header ready")
+
+    def compile(self, source_path: str, out_dir: str) -> tuple:
+        command = ['g++', *self.flags, '-I', self.pch_dir, '-include', self.PCH_HEADER,
+                   source_path, '-o', os.path.join(out_dir, 'program')]
+        result = self.run_compiler(command)
+        return result['returncode'] == 0, self.compiler_log(result, result['stderr'])
+
+    def run_command(self, build_dir: str) -> List[str]:
+        return [os.path.join(build_dir, 'program')]
+
+
+class JavaRunner(CompiledLanguageRunner):
+    """javac + a JVM tuned for fast startup; the class file is reused from the compile cache"""
+
+    language = 'java'
+    flags = ['-encoding', 'UTF-8']
+    ENTRY_POINT = re.compile(r'\bstatic\s+(?:final\s+)?void\s+main\s*\(')
+    JVM_FLAGS = ['-XX:+UseSerialGC', '-XX:TieredStopAtLevel=1', '-Xshare:auto', '-Xss64m']
+
+    @classmethod
+    def available(cls) -> bool:
+        return shutil.which('javac') is not None and shutil.which('java') is not None
+
+    def toolchain_version(self) -> str:
+        return subprocess.run(['javac', '-version'], capture_output=True, text=True).stdout.strip()
+
+    @staticmethod
+    def main_class(code: str) -> str:
+        match = re.search(r'public\s+(?:final\s+)?class\s+(\w+)', code)
+        return match.group(1) if match else 'Main'
+
+    def source_name(self, code: str) -> str:
+        return f"{self.main_class(code)}.java"
+
+    def compile(self, source_path: str, out_dir: str) -> tuple:
+        result = self.run_compiler(['javac', *self.flags, '-J-XX:TieredStopAtLevel=1', '-d',
+                                    os.path.join(out_dir, 'classes'), source_path])
+        return result['returncode'] == 0, self.compiler_log(result, result['stderr'])
+
+    def memory_limit_mb(self):
+        return None
+
+    def run_command(self, build_dir: str) -> List[str]:
+        source = os.listdir(os.path.join(build_dir, 'src'))[0]
+        return ['java', *self.JVM_FLAGS, f'-Xmx{Config.EXECUTION_MEMORY_MB}m',
+                '-cp', os.path.join(build_dir, 'classes'), source[:-len('.java')]]
+
+
+class CSharpRunner(CompiledLanguageRunner):
+    """Roslyn csc against the reference pack, using a shared (warm) VBCSCompiler server
+
+    The server runs in a sandbox of its own; compiles reach it through its pipe in the temp
+    directory, which every sandbox shares.
+    """
+
+    language = 'csharp'
+    source_file = 'Program.cs'
+    flags = ['-optimize+', '-target:exe', '-nologo', '-noconfig']
+    ENTRY_POINT = re.compile(r'\bstatic\s+(?:async\s+)?(?:void|int|Task(?:<int>)?)\s+Main\s*\(')
+
+    def __init__(self, compile_cache: CompileCache):
+        super().__init__(compile_cache)
+        self.csc, self.references, self.framework_version = self.locate()
+        self.pipe_name = f"algolearn-csc-{os.getpid()}"
+        self.server = None
+        self.server_lock = threading.Lock()
+
+    @staticmethod
+    def locate():
+        """Find csc.dll and the reference assemblies of the newest installed SDK and runtime"""
+        dotnet = shutil.which('dotnet')
+        if not dotnet:
+            return None, [], None
+        root = os.path.dirname(os.path.realpath(dotnet))
+        csc = sorted(glob.glob(os.path.join(root, 'sdk', '*', 'Roslyn', 'bincore', 'csc.dll')), key=version_key)
+        packs = sorted(glob.glob(os.path.join(root, 'packs', 'Microsoft.NETCore.App.Ref', '*')), key=version_key)
+        if not csc or not packs:
+            return None, [], None
+        version = os.path.basename(packs[-1])
+        references = glob.glob(os.path.join(packs[-1], 'ref', '*', '*.dll'))
+        return csc[-1], references, version
+
+    @classmethod
+    def available(cls) -> bool:
+        return cls.locate()[0] is not None
+
+    def toolchain_version(self) -> str:
+        return f"{self.csc}|{self.framework_version}"
+
+    def compile(self, source_path: str, out_dir: str) -> tuple:
+        self.ensure_server()
+        command = ['dotnet', self.csc, f'-shared:{self.pipe_name}', *self.flags, f"-out:{os.path.join(out_dir, 'program.dll')}",
+                   *[f'-r:{reference}' for reference in self.references], os.path.basename(source_path)]
+        result = self.run_compiler(command, cwd=os.path.dirname(source_path))
+        major_minor = '.'.join(self.framework_version.split('.')[:2])
+        with open(os.path.join(out_dir, 'program.runtimeconfig.json'), 'w') as f:
+            json.dump({'runtimeOptions': {'tfm': f'net{major_minor}', 'framework': {
+                'name': 'Microsoft.NETCore.App', 'version': self.framework_version}}}, f)
+        return result['returncode'] == 0, self.compiler_log(result, result['stdout'] + result['stderr'])
+
+    def ensure_server(self):
+        """Start the compiler server, or restart it after it exited on its idle timeout"""
+        with self.server_lock:
+            if self.server is not None and self.server.poll() is None:
+                return
+            server = os.path.join(os.path.dirname(self.csc), 'VBCSCompiler.dll')
+            with open(os.devnull, 'wb') as report:
+                self.server = subprocess.Popen(
+                    sandbox_command(['dotnet', 'exec', server, f'-pipename:{self.pipe_name}'], report.fileno()),
+                    stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                    pass_fds=(report.fileno(),), cwd=tempfile.gettempdir(), env=self.run_env(),
+                    start_new_session=True)
+
+    def warm(self):
+        # Starts the VBCSCompiler server so later compiles skip JIT-ing the compiler
+        self.build('class Warmup { static void Main() {} }')
+        print("✅ C# compiler server ready")
+
+    def memory_limit_mb(self):
+        return None
+
+    def run_env(self) -> Dict[str, str]:
+        return {
+            **super().run_env(),
+            'DOTNET_CLI_TELEMETRY_OPTOUT': '1',
+            # No debugger/diagnostics sockets in the shared temp directory for other sandboxes to attach to
+            'DOTNET_EnableDiagnostics': '0',
+            # W^X double-mapping sizes a memfd past the sandbox's file-size limit
+            'DOTNET_EnableWriteXorExecute': '0',
+            'DOTNET_GCHeapHardLimit': hex(Config.EXECUTION_MEMORY_MB * 1024 * 1024),
+            'DOTNET_ROOT': os.path.dirname(os.path.realpath(shutil.which('dotnet')))
+        }
+
+    def run_command(self, build_dir: str) -> List[str]:
+        return ['dotnet', os.path.join(build_dir, 'program.dll')]
+
+
+def version_key(path: str) -> List[int]:
+    """Sort key for paths containing a dotted version number"""
+    match = re.search(r'(\d+(?:\.\d+)*)', os.path.basename(os.path.dirname(path)) if path.endswith('.dll')
+                      else os.path.basename(path))
+    return [int(part) for part in match.group(1).split('.')] if match else []
+
+
+class ComplexityProfiler:
+    """Fits measured growth samples to standard complexity classes and compares them with the stated ones"""
+
+    # Ordered from cheapest to most expensive
+    CLASSES = [
+        ('O(1)', lambda n: 1.0),
+        ('O(log n)', lambda n: math.log2(n)),
+        ('O(n)', lambda n: float(n)),
+        ('O(n log n)', lambda n: n * math.log2(n)),
+        ('O(n^2)', lambda n: float(n) ** 2),
+        ('O(n^3)', lambda n: float(n) ** 3),
+        ('O(2^n)', lambda n: 2.0 ** n)
+    ]
+    # Calls faster than this are mostly call overhead, and smaller peaks mostly interpreter noise
+    TIME_FLOOR_SECONDS = 2e-5
+    SPACE_FLOOR_KB = 1.0
+    # A fit only counts if every other class explains the samples clearly worse than it does
+    MARGIN_RATIO = 2.0
+    MARGIN_ABSOLUTE = 0.01
+    # Cache misses on growing data alone can make wall-clock time look a log factor worse
+    CACHE_LOOKALIKES = {('O(log n)', 'O(1)'), ('O(n log n)', 'O(n)')}
+    ALIASES = {
+        '1': 'O(1)', 'logn': 'O(log n)', 'n': 'O(n)', 'nlogn': 'O(n log n)',
+        'n^2': 'O(n^2)', 'n²': 'O(n^2)', 'n*n': 'O(n^2)', 'n^3': 'O(n^3)', 'n³': 'O(n^3)', '2^n': 'O(2^n)'
+    }
+
+    @classmethod
+    def fit(cls, samples: List[Dict], metric: str, floor: float, larger_half: bool = False) -> Dict[str, Any]:
+        """Find the classes whose a + b*growth(n) explain the samples, in relative error
+
+        Only sizes measured above floor are used. Cache effects make neighbouring classes such as
+        O(n) and O(n log n) fit almost equally well, so unless the best fit beats every other class
+        by the margin, the result is inconclusive and lists the candidates that were too close.
+        With larger_half, only the larger half of those sizes is fitted.
+        """
+        points = [(sample['n'], sample[metric]) for sample in samples if sample[metric] >= floor]
+        if larger_half and len(points) >= 8:
+            points = points[len(points) // 2:]
+        if len(samples) >= 4 and not points:
+            return {'class': None, 'candidates': ['O(1)', 'O(log n)'],
+                    'reason': f"every size up to n={samples[-1]['n']} stayed too small to measure growth"}
+        if len(points) < 4:
+            return {'class': None, 'candidates': [], 'reason': f'only {len(points)} sizes measurable'}
+        ns = [n for n, _ in points]
+        if max(ns) < 2 * min(ns):
+            return {'class': None, 'candidates': [], 'reason': 'input size did not grow enough'}
+
+        fits = cls._errors(points)
+        best_error = min(error for _, error in fits)
+        cutoff = max(best_error * cls.MARGIN_RATIO, best_error + cls.MARGIN_ABSOLUTE)
+        order = [label for label, _ in cls.CLASSES]
+        candidates = sorted((label for label, error in fits if error < cutoff), key=order.index)
+        if len(candidates) > 1:
+            return {'class': None, 'candidates': candidates, 'relative_error': round(best_error, 4),
+                    'reason': f"{' and '.join(candidates)} fit about equally well"}
+        # The alternate sizes on their own must agree, so one bumpy stretch cannot decide the class
+        halves = [points[0::2], points[1::2]]
+        if len(halves[1]) >= 3:
+            picks = {min(cls._errors(half), key=lambda fit: fit[1])[0] for half in halves}
+            if picks != set(candidates):
+                candidates = sorted(picks | set(candidates), key=order.index)
+                return {'class': None, 'candidates': candidates, 'relative_error': round(best_error, 4),
+                        'reason': f"{' and '.join(candidates)} each fit part of the sizes best"}
+        return {'class': candidates[0], 'relative_error': round(best_error, 4)}
+
+    @classmethod
+    def _errors(cls, points: List[tuple]) -> List[tuple]:
+        """Relative RMS error of the best a + b*growth(n) for each class that fits at all"""
+        ns = [n for n, _ in points]
+        fits = []
+        for label, growth in cls.CLASSES:
+            if label == 'O(2^n)':
+                if max(ns) <= 60:
+                    fits.extend(cls._fit_exponential(points))
+                continue
+            weights = [1 / (t * t) for _, t in points]
+            xs = [growth(n) for n in ns]
+            ts = [t for _, t in points]
+            # Weighted least squares for t = a + b*x with weights 1/t^2 (relative residuals)
+            sw = sum(weights)
+            sx = sum(w * x for w, x in zip(weights, xs))
+            st = sum(w * t for w, t in zip(weights, ts))
+            sxx = sum(w * x * x for w, x in zip(weights, xs))
+            sxt = sum(w * x * t for w, x, t in zip(weights, xs, ts))
+            determinant = sw * sxx - sx * sx
+            if label == 'O(1)' or abs(determinant) < 1e-12 * max(sw * sxx, 1e-300):
+                a, b = st / sw, 0.0
+            else:
+                b = (sw * sxt - sx * st) / determinant
+                a = (st - b * sx) / sw
+                # A growth term that explains next to nothing is the O(1) fit in disguise
+                if b <= 0 or b * (max(xs) - min(xs)) < 0.1 * max(ts):
+                    continue
+            error = math.sqrt(sum(((a + b * x - t) / t) ** 2 for x, t in zip(xs, ts)) / len(ts))
+            fits.append((label, error))
+        return fits
+
+    @staticmethod
+    def _fit_exponential(points: List[tuple]) -> List[tuple]:
+        """Fit t = a*c^n for any base c > 1 by least squares on log t"""
+        ns = [n for n, _ in points]
+        logs = [math.log(t) for _, t in points]
+        mean_n, mean_log = sum(ns) / len(ns), sum(logs) / len(logs)
+        slope = sum((n - mean_n) * (y - mean_log) for n, y in zip(ns, logs)) / \
+            sum((n - mean_n) ** 2 for n in ns)
+        if slope <= 0:
+            return []
+        intercept = mean_log - slope * mean_n
+        error = math.sqrt(sum((math.exp(intercept + slope * n) / t - 1) ** 2 for n, t in points) / len(points))
+        return [('O(2^n)', error)]
+
+    @classmethod
+    def parse(cls, stated: str):
+        """Map a stated complexity such as 'O(n log n)' to one of CLASSES, or None if it is not single-variable"""
+        if not isinstance(stated, str):
+            return None
+        match = re.search(r'O\((.+?)\)\s*$', stated.strip().split(',')[0].split(' - ')[0], re.IGNORECASE)
+        if not match:
+            return None
+        return cls.ALIASES.get(re.sub(r'[\s·×]', '', match.group(1).lower()).replace('**', '^'))
+
+    @classmethod
+    def compare(cls, measured: str, stated: str) -> str:
+        expected = cls.parse(stated)
+        if measured is None or expected is None:
+            return 'unknown'
+        order = [label for label, _ in cls.CLASSES]
+        difference = order.index(measured) - order.index(expected)
+        return 'matches' if difference == 0 else 'worse' if difference > 0 else 'better'
+
+    @classmethod
+    def verdict(cls, fit: Dict[str, Any], stated: str, timed: bool = False) -> str:
+        """Compare a fit with the stated complexity; 'inconclusive' unless every candidate agrees"""
+        candidates = [fit['class']] if fit['class'] else fit['candidates']
+        expected = cls.parse(stated)
+        if expected is None:
+            return 'unknown'
+        if timed and candidates and all((label, expected) in cls.CACHE_LOOKALIKES for label in candidates):
+            return 'inconclusive'
+        verdicts = {cls.compare(label, stated) for label in candidates}
+        return verdicts.pop() if len(verdicts) == 1 else 'inconclusive'
+
+    @classmethod
+    def analyze(cls, profile: Dict[str, Any], question: Dict) -> Dict[str, Any]:
+        samples = profile.get('samples', [])
+        time_fit = cls.fit(samples, 'seconds', cls.TIME_FLOOR_SECONDS)
+        # Peak memory is exact but steps at small sizes (timsort only allocates a merge buffer
+        # past ~512 items), which would pass for a log factor over the whole range
+        space_fit = cls.fit(samples, 'peak_kb', cls.SPACE_FLOOR_KB, larger_half=True)
+        return {
+            'time': {**time_fit, 'expected': question.get('time_complexity'),
+                     'verdict': cls.verdict(time_fit, question.get('time_complexity'), timed=True)},
+            'space': {**space_fit, 'expected': question.get('space_complexity'),
+                      'verdict': cls.verdict(space_fit, question.get('space_complexity'))},
+            'samples': [{'n': sample['n'], 'runtime_ms': round(sample['seconds'] * 1000, 4),
+                         'peak_memory_kb': sample['peak_kb']} for sample in samples],
+            'scaled': profile.get('scaled'),
+            'error': profile.get('error')
+        }
+
+
+class CodeExecutionEngine:
+    """Grades submissions by running them against the question's test cases, one runner per language"""
+
+    def __init__(self):
+        self.runners = {'python': PythonRunner()}
+        self.slots = threading.BoundedSemaphore(Config.EXECUTION_MAX_CONCURRENCY)
+        self.compile_cache = CompileCache()
+        for runner_class in (CppRunner, JavaRunner, CSharpRunner):
+            runner = runner_class.create(self.compile_cache)
+            if runner is not None:
+                self.runners[runner.language] = runner
+        threading.Thread(target=self._warm, name='toolchain-warmup', daemon=True).start()
+
+    def _warm(self):
+        for runner in self.runners.values():
+            if isinstance(runner, CompiledLanguageRunner):
+                try:
+                    runner.warm()
+                except Exception as e:
+                    print(f"❌ Could not warm {runner.language} toolchain: {e}")
+
+    def supports(self, language: str) -> bool:
+        return language in self.runners
+
+    def run(self, code: str, question: Dict, language: str) -> Dict[str, Any]:
+        total = len(question.get('test_cases', []))
+        if not self.supports(language):
+            return {'supported': False, 'status': 'unsupported', 'test_results': [], 'passed': 0, 'total': total}
+
+        started = time.perf_counter()
+        with self.slots:
+            outcome = self.runners[language].run(code, question)
+        results = outcome.get('test_results', [])
+        if outcome.get('profile'):
+            outcome['complexity'] = ComplexityProfiler.analyze(outcome.pop('profile'), question)
+        return {
+            'supported': True,
+            **outcome,
+            'passed': sum(1 for result in results if result.get('passed')),
+            'total': total,
+            'runtime_ms': round(sum(result.get('runtime_ms', 0) for result in results), 3),
+            'peak_memory_kb': max((result.get('peak_memory_kb', 0) for result in results), default=0),
+            'wall_time_ms': round((time.perf_counter() - started) * 1000, 1)
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'runners': {language: runner.get_stats() for language, runner in self.runners.items()},
+            'compile_cache': self.compile_cache.get_stats()
+        }
+
+
+class SubmissionCache:
+    """Remembers graded analyses so re-running identical (or reformatted) code skips the sandbox"""
+
+    # Outcomes that depend on machine load rather than the code are not remembered
+    CACHEABLE_STATUSES = ('ok', 'compile_error', 'unsupported')
+    C_LIKE_TOKENS = re.compile(r'"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'|//[^\n]*|/\*.*?\*/|\s+', re.DOTALL)
+
+    def __init__(self, l2: RedisContentStore = None):
+        self.results = ContentCache(max_entries=Config.SUBMISSION_CACHE_MAX_ENTRIES,
+                                    max_bytes=Config.SUBMISSION_CACHE_MAX_BYTES,
+                                    default_ttl=Config.SUBMISSION_CACHE_TTL, l2=l2, max_stale=0)
+
+    @staticmethod
+    def question_version(question: Dict) -> str:
+        """Fingerprint of everything grading depends on, so regenerated questions never reuse old results"""
+        graded = {field: question.get(field) for field in
+                  ('function_signature', 'test_cases', 'time_complexity', 'space_complexity')}
+        return hashlib.sha256(json.dumps(graded, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+    @classmethod
+    def normalize(cls, code: str, language: str) -> str:
+        """Canonical form of a submission that ignores comments and formatting"""
+        if language == 'python':
+            try:
+                return ast.dump(ast.parse(code))
+            except (SyntaxError, ValueError):
+                return '\n'.join(line.rstrip() for line in code.strip().splitlines())
+
+        # Comments become whitespace first; string literals are matched (and kept) in both passes
+        code = cls.C_LIKE_TOKENS.sub(
+            lambda match: ' ' if match.group(0).startswith(('//', '/*')) else match.group(0), code)
+
+        def collapse(match):
+            text = match.group(0)
+            if not text.isspace():
+                return text
+            # Whitespace matters between two word characters or two operator characters ("a - -b")
+            before, after = code[match.start() - 1:match.start()], code[match.end():match.end() + 1]
+            if not before or not after or before in '(){}[];,' or after in '(){}[];,':
+                return ''
+            return ' ' if bool(re.match(r'\w', before)) == bool(re.match(r'\w', after)) else ''
+
+        return cls.C_LIKE_TOKENS.sub(collapse, code).strip()
+
+    def key(self, chapter_id: int, language: str, level: int, question: Dict, code: str) -> str:
+        code_hash = hashlib.sha256(self.normalize(code, language).encode('utf-8')).hexdigest()
+        return f"submission:{chapter_id}:{language}:{level}:{self.question_version(question)}:{code_hash}"
+
+    def get(self, key: str):
+        return self.results.get(key)
+
+    def set(self, key: str, analysis: Dict[str, Any], execution: Dict[str, Any]):
+        if execution.get('status') in self.CACHEABLE_STATUSES:
+            ttl = Config.SUBMISSION_CACHE_TTL
+            if analysis.get('complexity'):
+                ttl = min(ttl, Config.SUBMISSION_PROFILED_CACHE_TTL)
+            self.results.set(key, analysis, ttl=ttl)
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = self.results.get_stats()
+        return {field: stats[field] for field in ('hits', 'misses', 'hit_ratio', 'entries', 'bytes', 'evictions')}
+
+
+class BulkGrader:
+    """Grades a stream of NDJSON submissions on a bounded pool, yielding each result as soon as it is ready
+
+    At most max_in_flight submissions are read ahead, so memory stays flat however long the upload is.
+    """
+
+    def __init__(self, workers: int = None, max_in_flight: int = None, max_line_bytes: int = None):
+        self.workers = workers or Config.BULK_GRADE_WORKERS
+        self.max_in_flight = max_in_flight or Config.BULK_GRADE_MAX_IN_FLIGHT or self.workers * 2
+        self.max_line_bytes = max_line_bytes or Config.BULK_GRADE_MAX_LINE_BYTES
+        self.lock = threading.Lock()
+        self.stats = {'batches': 0, 'submissions': 0, 'errors': 0, 'in_flight': 0}
+
+    def read_lines(self, stream) -> Iterator[bytes]:
+        """Yield raw lines from a file-like stream, or None for a line over max_line_bytes"""
+        while True:
+            line = stream.readline(self.max_line_bytes + 1)
+            if not line:
+                return
+            if len(line) > self.max_line_bytes and not line.endswith(b'\n'):
+                while line and not line.endswith(b'\n'):
+                    line = stream.readline(64 * 1024)
+                yield None
+            elif line.strip():
+                yield line
+
+    def grade_line(self, number: int, line: bytes, detail: bool) -> Dict[str, Any]:
+        result = {'line': number, 'id': None}
+        try:
+            if line is None:
+                raise ValueError(f'Submission exceeds {self.max_line_bytes} bytes')
+            submission = json.loads(line)
+            if not isinstance(submission, dict):
+                raise ValueError('Each line must be a JSON object')
+            result['id'] = submission.get('id')
+            language = submission.get('language', Config.DEFAULT_LANGUAGE)
+            level = submission.get('level', 1)
+            if not submission.get('code'):
+                raise ValueError('Code is required')
+            if language not in Config.SUPPORTED_LANGUAGES:
+                raise ValueError(f'Unsupported language: {language}')
+            if not chapter_manager.get_chapter(submission.get('chapter_id')):
+                raise ValueError('Chapter not found')
+            if not is_valid_level(level):
+                raise ValueError(f'Level must be between 1 and {Config.MAX_QUESTION_LEVEL}')
+            question = find_question(submission.get('chapter_id'), language, level, submission.get('problem_id'))
+            if not question:
+                raise ValueError('Question data not found')
+
+            analysis, cached = grade_submission(submission['chapter_id'], language, level, question, submission['code'])
+            result.update(status='graded', cached=cached, score=analysis.get('correctness_score'),
+                          is_correct=analysis.get('is_correct'), passed=analysis.get('passed_test_cases'),
+                          total=analysis.get('total_test_cases'))
+            if detail:
+                result['analysis'] = analysis
+        except ValueError as e:
+            result.update(status='error', error=str(e))
+        except Exception as e:
+            print(f"❌ Bulk grading error on line {number}: {e}")
+            result.update(status='error', error='Grading failed')
+        return result
+
+    def run(self, lines: Iterable[bytes], detail: bool = False) -> Iterator[Dict[str, Any]]:
+        """Grade lines concurrently, yielding results in completion order followed by a summary"""
+        started = time.perf_counter()
+        summary = {'total': 0, 'graded': 0, 'errors': 0, 'cached': 0}
+        executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='bulk-grade')
+        pending = set()
+        with self.lock:
+            self.stats['batches'] += 1
+
+        def finished(done):
+            for future in done:
+                result = future.result()
+                summary['total'] += 1
+                summary['graded' if result['status'] == 'graded' else 'errors'] += 1
+                summary['cached'] += 1 if result.get('cached') else 0
+                with self.lock:
+                    self.stats['submissions'] += 1
+                    self.stats['in_flight'] -= 1
+                    self.stats['errors'] += result['status'] != 'graded'
+                yield result
+
+        try:
+            for number, line in enumerate(lines, start=1):
+                with self.lock:
+                    self.stats['in_flight'] += 1
+                pending.add(executor.submit(self.grade_line, number, line, detail))
+                # Stop reading ahead once the window is full; otherwise just drain what is ready
+                if len(pending) >= self.max_in_flight:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                else:
+                    done = {future for future in pending if future.done()}
+                    pending -= done
+                yield from finished(done)
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                yield from finished(done)
+            yield {'summary': {**summary, 'elapsed_ms': round((time.perf_counter() - started) * 1000, 1)}}
+        finally:
+            # Client disconnects close the generator early: drop work that has not started
+            for future in pending:
+                if future.cancel():
+                    with self.lock:
+                        self.stats['in_flight'] -= 1
+            executor.shutdown(wait=False)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {**self.stats, 'workers': self.workers, 'max_in_flight': self.max_in_flight}
+
+
+def read_bundle(path: str) -> Dict[str, Any]:
+    """Read a content snapshot bundle (gzip-compressed JSON)"""
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def write_bundle(path: str, bundle: Dict[str, Any]):
+    with gzip.open(path, 'wt', encoding='utf-8') as f:
+        json.dump(bundle, f, separators=(',', ':'))
+
+
 # Initialize services
+metrics = Metrics()
 openai_service = OpenAIService()
 chapter_manager = ChapterManager()
-cache = ContentCache()
+cache = ContentCache(l2=RedisContentStore.from_url(Config.REDIS_URL),
+                     store=PersistentContentStore.from_path(Config.CONTENT_STORE_PATH),
+                     refresh_prefixes=('concept_',))
+if cache.store is not None:
+    if Config.CONTENT_SNAPSHOT_PATH and cache.store.count() == 0 and os.path.exists(Config.CONTENT_SNAPSHOT_PATH):
+        imported = cache.store.import_bundle(read_bundle(Config.CONTENT_SNAPSHOT_PATH))
+        print(f"📦 Imported {imported} items from snapshot {Config.CONTENT_SNAPSHOT_PATH}")
+    if Config.CONTENT_STORE_WARM_START:
+        print(f"🔥 Warmed cache with {cache.warm_from_store()} stored items")
+single_flight = SingleFlight(cache, scheduler=openai_service.scheduler)
+stale_refresher = StaleRefresher(single_flight, openai_service.is_available)
+prefetcher = Prefetcher() if Config.PREFETCH_ENABLED else None
+response_cache = ResponseCache()
+question_pools = QuestionVariantPools()
+execution_engine = CodeExecutionEngine()
+submission_cache = SubmissionCache(
+    l2=RedisContentStore(cache.l2.client, default_ttl=Config.SUBMISSION_CACHE_TTL) if cache.l2 is not None else None)
+preload_manager = PreloadManager()
+bulk_grader = BulkGrader()
+
+
+def serve_cached(key: str, generate, refresh: bool = True):
+    """Serve a cached value (refreshing it in the background when stale, if refresh is set) or generate it on a miss"""
+    entry = cache.get_entry(key)
+    if entry:
+        value, generated_at = entry
+        if refresh and cache.is_stale(generated_at):
+            stale_refresher.schedule(key, generate)
+        if prefetcher is not None:
+            prefetcher.record_hit(key)
+        return value
+    return single_flight.do(key, generate)
+
+
+def serialized_response(key: str, source: Any, build) -> Response:
+    """Send build()'s JSON from the response cache, answering 304 for a matching If-None-Match
+
+    source is the cached content the payload wraps; while it is unchanged build is not called at all.
+    """
+    entry = response_cache.get(key, source, build)
+    encoding = ResponseCache.choose_encoding(request.headers.get('Accept-Encoding', ''),
+                                             len(entry['bodies']['identity']))
+    headers = {'ETag': ResponseCache.etag(entry, encoding), 'Vary': 'Accept-Encoding', 'Cache-Control': 'no-cache'}
+    if ResponseCache.matches(request.headers.get('If-None-Match'), entry):
+        response_cache.record_not_modified()
+        return Response(status=304, headers=headers)
+    if encoding != 'identity':
+        headers['Content-Encoding'] = encoding
+    return Response(response_cache.body(entry, encoding), mimetype='application/json', headers=headers)
+
+
+# Fields sent when a request has no fields= parameter; None sends the whole object
+DEFAULT_FIELDS = {
+    'concept': None,
+    # The page fetches solutions on demand through /solution
+    'question': tuple(field for field in OpenAIService.QUESTION_SCHEMA.fields
+                      if field not in ('solution', 'solution_explanation'))
+}
+
+
+def requested_fields(kind: str, schema: JSONSchema):
+    """Parse fields= into a tuple in schema order (None for the whole object); raises ValueError on unknown names"""
+    raw = request.args.get('fields')
+    if raw is None:
+        return DEFAULT_FIELDS[kind]
+    if raw.strip() in ('*', 'all'):
+        return None
+    names = {name.strip() for name in raw.split(',') if name.strip()}
+    unknown = sorted(names - set(schema.fields))
+    if unknown:
+        raise ValueError(f"Unknown {kind} fields: {', '.join(unknown)}")
+    return tuple(field for field in schema.fields if field in names)
+
+
+def project(value: Dict[str, Any], fields) -> Dict[str, Any]:
+    if value is None or fields is None:
+        return value
+    return {field: value[field] for field in fields if field in value}
+
+
+def fields_tag(fields) -> str:
+    return '*' if fields is None else ','.join(fields)
+
+
+def is_valid_level(level: Any) -> bool:
+    return isinstance(level, int) and not isinstance(level, bool) and 1 <= level <= Config.MAX_QUESTION_LEVEL
+
+
+def find_question(chapter_id: int, language: str, level: int, problem_id: str = None):
+    """Return the question a learner was served: the one with problem_id when given, else the cached one
+
+    Clients that send no problem_id are graded against whatever is cached now, which may differ from
+    what they were shown if the entry has since been evicted and regenerated.
+    """
+    question = cache.get_question(chapter_id, language, level)
+    if problem_id is None or (question is not None and str(question.get('problem_id')) == str(problem_id)):
+        return question
+    return question_pools.find(chapter_id, language, level, problem_id)
+
+
+def grade_submission(chapter_id: int, language: str, level: int, question: Dict, code: str) -> tuple:
+    """Return (analysis, cached), reusing the stored analysis for an identical submission"""
+    if FallbackCatalog.is_fallback(question):
+        # Template test cases are placeholders, so every submission would fail them; nothing is cached
+        execution = {'supported': False, 'status': 'unsupported', 'test_results': [], 'passed': 0,
+                     'total': len(question.get('test_cases', [])),
+                     'error': 'This is a practice template question, so it is not graded automatically.'}
+        return openai_service.analyze_user_code(code, question, language, execution), False
+    key = submission_cache.key(chapter_id, language, level, question, code)
+    analysis = submission_cache.get(key)
+    if analysis is not None:
+        return analysis, True
+    print(f"🧪 Grading {language} submission for chapter {chapter_id}, level {level}...")
+    execution = execution_engine.run(code, question, language)
+    analysis = openai_service.analyze_user_code(code, question, language, execution)
+    submission_cache.set(key, analysis, execution)
+    return analysis, False
+
+
+def load_concept(chapter: Dict, language: str) -> Dict[str, Any]:
+    """Return the cached concept, generating it once for all concurrent callers on a miss"""
+    key = ContentCache.concept_key(chapter['id'], language)
+
+    def generate():
+        concept = openai_service.generate_concept_content(
+            chapter["name"],
+            chapter["topics"],
+            language
+        )
+        cache.set(key, concept)
+        return concept
+
+    return serve_cached(key, generate)
+
+
+def load_question(chapter: Dict, language: str, level: int) -> Dict[str, Any]:
+    """Return the cached question, generating it once for all concurrent callers on a miss
+
+    Questions are not refreshed when stale: learners are graded against the question they were shown,
+    and fresh problems come from the variant pools instead.
+    """
+    key = ContentCache.question_key(chapter['id'], language, level)
+
+    def generate():
+        question = openai_service.generate_single_question(
+            chapter["name"],
+            chapter["topics"],
+            language,
+            level
+        )
+        cache.set(key, question)
+        return question
+
+    return serve_cached(key, generate, refresh=False)
+
+
+def load_questions(chapter: Dict, language: str, levels: List[int]) -> Dict[int, Dict[str, Any]]:
+    """Return cached questions for several levels, generating the missing ones in batched requests"""
+    keys = {ContentCache.question_key(chapter['id'], language, level): level for level in levels}
+    found = cache.get_many(list(keys))
+    missing = [key for key in keys if key not in found]
+
+    def generate_many(todo: List[str]) -> Dict[str, Any]:
+        questions = openai_service.generate_question_batch(
+            chapter["name"],
+            chapter["topics"],
+            language,
+            [keys[key] for key in todo]
+        )
+        for key in todo:
+            cache.set(key, questions[keys[key]])
+        return {key: questions[keys[key]] for key in todo}
+
+    for i in range(0, len(missing), Config.QUESTION_BATCH_SIZE):
+        found.update(single_flight.do_many(missing[i:i + Config.QUESTION_BATCH_SIZE], generate_many))
+
+    return {keys[key]: value for key, value in found.items()}
+
+
+def collect_component_metrics():
+    """Export the counters the caches and the LLM client already keep, read at scrape time"""
+    content = cache.get_stats()
+    for name, stats in (('content', content), ('submission', submission_cache.get_stats())):
+        yield 'cache_lookups_total', 'counter', (('cache', name), ('result', 'hit')), stats['hits']
+        yield 'cache_lookups_total', 'counter', (('cache', name), ('result', 'miss')), stats['misses']
+        yield 'cache_evictions_total', 'counter', (('cache', name),), stats['evictions']
+        yield 'cache_entries', 'gauge', (('cache', name),), stats['entries']
+        yield 'cache_bytes', 'gauge', (('cache', name),), stats['bytes']
+    yield 'cache_stale_hits_total', 'counter', (('cache', 'content'),), content['stale_hits']
+
+    responses = response_cache.get_stats()
+    yield 'cache_lookups_total', 'counter', (('cache', 'response'), ('result', 'hit')), responses['hits']
+    yield 'cache_lookups_total', 'counter', (('cache', 'response'), ('result', 'miss')), responses['builds']
+    yield 'cache_evictions_total', 'counter', (('cache', 'response'),), responses['evictions']
+    yield 'cache_entries', 'gauge', (('cache', 'response'),), responses['entries']
+    yield 'cache_bytes', 'gauge', (('cache', 'response'),), responses['bytes']
+    yield 'http_not_modified_total', 'counter', (), responses['not_modified']
+    for encoding in ('identity', 'gzip', 'br'):
+        yield 'http_encoded_responses_total', 'counter', (('encoding', encoding),), responses[encoding]
+
+    compile_stats = execution_engine.compile_cache.get_stats()
+    yield 'cache_lookups_total', 'counter', (('cache', 'compile'), ('result', 'hit')), compile_stats['hits']
+    yield 'cache_lookups_total', 'counter', (('cache', 'compile'), ('result', 'miss')), compile_stats['misses']
+
+    for outcome, count in openai_service.json_extractor.get_stats().items():
+        if outcome not in ('recovery_rate', 'retry_success_rate'):
+            yield 'llm_json_outcomes_total', 'counter', (('outcome', outcome),), count
+
+    breaker = openai_service.breaker.get_status()
+    for state in (CircuitBreaker.CLOSED, CircuitBreaker.OPEN, CircuitBreaker.HALF_OPEN):
+        yield 'llm_circuit_state', 'gauge', (('state', state),), int(breaker['state'] == state)
+    yield 'llm_available', 'gauge', (), int(openai_service.is_available())
+
+    scheduler = openai_service.scheduler.get_stats()
+    for priority, running in scheduler['running'].items():
+        yield 'llm_scheduler_running', 'gauge', (('priority', priority),), running
+        yield 'llm_scheduler_admitted_total', 'counter', (('priority', priority),), scheduler[priority]['admitted']
+        yield 'llm_scheduler_timeouts_total', 'counter', (('priority', priority),), scheduler[priority]['timed_out']
+    yield 'llm_scheduler_queued', 'gauge', (), scheduler['queued']
+    yield 'llm_scheduler_tokens_last_minute', 'gauge', (), scheduler['tokens_last_minute']
+
+    fallbacks = openai_service.fallbacks.get_stats()
+    yield 'fallbacks_served_total', 'counter', (), fallbacks['hits'] + fallbacks['rendered']
+
+
+metrics.add_collector(collect_component_metrics)
+
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def record_request_metrics(response):
+    """Record latency per route pattern (not raw path), so the number of series stays bounded
+
+    Streamed (SSE/NDJSON) bodies are produced after this hook returns, so those are recorded
+    when the server closes the response, once the last chunk has gone out.
+    """
+    started = getattr(g, 'request_started', None)
+    if started is not None:
+        endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        labels = (('endpoint', endpoint), ('method', request.method), ('status', str(response.status_code)))
+
+        def record():
+            metrics.observe('http_request_duration_seconds', time.perf_counter() - started, labels)
+
+        if response.is_streamed:
+            response.call_on_close(record)
+        else:
+            record()
+    return response
+
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics_endpoint():
+    """This worker's metrics in the Prometheus text format; reads counters only, never calls the LLM"""
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
     return jsonify({
         'status': 'healthy',
-        'openai_connected': openai_service.check_connection(),
+        'openai_connected': openai_service.is_available(),
+        'openai_status': openai_service.monitor.get_status(),
+        'openai_breaker': openai_service.breaker.get_status(),
         'supported_languages': Config.SUPPORTED_LANGUAGES,
         'total_chapters': len(chapter_manager.get_all_chapters())
     })
@@ -767,7 +4900,7 @@ def health_check():
 def get_languages():
     return jsonify({
         'languages': Config.SUPPORTED_LANGUAGES,
-        'default': 'python'
+        'default': Config.DEFAULT_LANGUAGE
     })
 
 
@@ -780,67 +4913,166 @@ def get_chapters():
     })
 
 
-@app.route('/api/chapters/<int:chapter_id>/concept', methods=['GET'])
-def get_concept(chapter_id):
-    language = request.args.get('language', 'python')
+@app.route('/api/bootstrap', methods=['GET'])
+def bootstrap():
+    """Everything the practice page needs on load: languages, chapters, service status and first content
 
-    # Try to get from cache first
-    concept = cache.get_concept(chapter_id, language)
+    The concept and level 1 question of chapter_id (the first chapter by default) are included unless
+    content=false, so a fresh page needs one round trip instead of four.
+    """
+    language = request.args.get('language', Config.DEFAULT_LANGUAGE)
+    if language not in Config.SUPPORTED_LANGUAGES:
+        return jsonify({'error': f'Unsupported language: {language}'}), 400
 
-    if not concept:
+    chapters = chapter_manager.get_all_chapters()
+    chapter = None
+    if request.args.get('content') != 'false':
+        chapter_id = request.args.get('chapter_id', type=int, default=chapters[0]['id'])
         chapter = chapter_manager.get_chapter(chapter_id)
         if not chapter:
             return jsonify({'error': 'Chapter not found'}), 404
 
-        print(f"🚀 Generating concept content for {chapter['name']} in {language}...")
+    concept = question = None
+    if chapter is not None:
+        concept = load_concept(chapter, language)
+        user = request.args.get('user_id') or request.headers.get('X-User-Id')
+        question = question_pools.serve(chapter, language, 1, user) if user else load_question(chapter, language, 1)
+        if prefetcher is not None:
+            prefetcher.after_question(chapter, language, 1)
+
+    # Status comes from the background monitor, so no provider probe runs on this path
+    connected = openai_service.is_available()
+    breaker_state = openai_service.breaker.get_status()['state']
+    key = f"bootstrap:{language}:{chapter['id'] if chapter else None}:{question.get('problem_id') if question else None}"
+    return serialized_response(key, (chapters, concept, question, connected, breaker_state), lambda: {
+        'status': {
+            'status': 'healthy',
+            'openai_connected': connected,
+            'openai_breaker': breaker_state
+        },
+        'languages': Config.SUPPORTED_LANGUAGES,
+        'default_language': Config.DEFAULT_LANGUAGE,
+        'chapters': chapters,
+        'language': language,
+        'chapter_id': chapter['id'] if chapter else None,
+        'concept': project(concept, DEFAULT_FIELDS['concept']),
+        'question': project(question, DEFAULT_FIELDS['question']),
+        'level': 1
+    })
 
-        # Generate concept content
-        concept = openai_service.generate_concept_content(
-            chapter["name"],
-            chapter["topics"],
-            language
-        )
 
-        # Cache the concept
-        cache.set_concept(chapter_id, language, concept)
+@app.route('/api/chapters/<int:chapter_id>/concept', methods=['GET'])
+def get_concept(chapter_id):
+    language = request.args.get('language', Config.DEFAULT_LANGUAGE)
+    if language not in Config.SUPPORTED_LANGUAGES:
+        return jsonify({'error': f'Unsupported language: {language}'}), 400
+
+    try:
+        fields = requested_fields('concept', OpenAIService.CONCEPT_SCHEMA)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
-    return jsonify({
-        'concept': concept,
+    chapter = chapter_manager.get_chapter(chapter_id)
+    if not chapter:
+        return jsonify({'error': 'Chapter not found'}), 404
+
+    concept = load_concept(chapter, language)
+
+    return serialized_response(f"concept:{chapter_id}:{language}|{fields_tag(fields)}", concept, lambda: {
+        'concept': project(concept, fields),
         'language': language,
         'chapter_id': chapter_id
     })
 
 
-@app.route('/api/chapters/<int:chapter_id>/questions/<int:level>', methods=['GET'])
-def get_question(chapter_id, level):
-    language = request.args.get('language', 'python')
+def sse_event(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
 
-    if level < 1 or level > 10:
-        return jsonify({'error': 'Level must be between 1 and 10'}), 400
 
-    # Try to get from cache first
-    question = cache.get_question(chapter_id, language, level)
+@app.route('/api/chapters/<int:chapter_id>/concept/stream', methods=['GET'])
+def stream_concept(chapter_id):
+    """Concept content as Server-Sent Events: token deltas, early fields, then the full concept"""
+    language = request.args.get('language', Config.DEFAULT_LANGUAGE)
+    if language not in Config.SUPPORTED_LANGUAGES:
+        return jsonify({'error': f'Unsupported language: {language}'}), 400
 
-    if not question:
-        chapter = chapter_manager.get_chapter(chapter_id)
-        if not chapter:
-            return jsonify({'error': 'Chapter not found'}), 404
+    chapter = chapter_manager.get_chapter(chapter_id)
+    if not chapter:
+        return jsonify({'error': 'Chapter not found'}), 404
 
-        print(f"🚀 Generating question for {chapter['name']} - Level {level} in {language}...")
+    key = ContentCache.concept_key(chapter_id, language)
 
-        # Generate single question
-        question = openai_service.generate_single_question(
-            chapter["name"],
-            chapter["topics"],
-            language,
-            level
-        )
+    def complete(concept):
+        return sse_event('concept', {'concept': concept, 'language': language, 'chapter_id': chapter_id})
 
-        # Cache the question
-        cache.set_question(chapter_id, language, level, question)
+    def events():
+        if cache.get_entry(key) is not None:
+            yield complete(load_concept(chapter, language))
+            return
 
-    return jsonify({
-        'question': question,
+        call = single_flight.begin(key)
+        if call is None:
+            # Someone else is generating this concept; wait for their result
+            yield complete(load_concept(chapter, language))
+            return
+
+        concept, error = None, None
+        try:
+            for event, data in openai_service.stream_concept_content(chapter["name"], chapter["topics"], language):
+                if event == 'delta':
+                    yield sse_event('delta', {'text': data})
+                elif event == 'field':
+                    yield sse_event('field', {'field': data[0], 'value': data[1]})
+                else:
+                    concept = data
+            cache.set(key, concept)
+            yield complete(concept)
+        except GeneratorExit:
+            # Client went away; the finally block still lets waiting callers move on
+            raise
+        except Exception as e:
+            print(f"❌ Concept stream error: {e}")
+            error = e
+            yield sse_event('error', {'error': 'Concept generation failed'})
+        finally:
+            single_flight.finish(key, call, concept, error)
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+
+@app.route('/api/chapters/<int:chapter_id>/questions/<int:level>', methods=['GET'])
+def get_question(chapter_id, level):
+    language = request.args.get('language', Config.DEFAULT_LANGUAGE)
+    if language not in Config.SUPPORTED_LANGUAGES:
+        return jsonify({'error': f'Unsupported language: {language}'}), 400
+
+    if level < 1 or level > 10:
+        return jsonify({'error': 'Level must be between 1 and 10'}), 400
+
+    try:
+        fields = requested_fields('question', OpenAIService.QUESTION_SCHEMA)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    chapter = chapter_manager.get_chapter(chapter_id)
+    if not chapter:
+        return jsonify({'error': 'Chapter not found'}), 404
+
+    # Learners who identify themselves get their own variant; next=true moves them to one they have not seen
+    user = request.args.get('user_id') or request.headers.get('X-User-Id')
+    if user:
+        question = question_pools.serve(chapter, language, level, user, advance=request.args.get('next') == 'true')
+    else:
+        question = load_question(chapter, language, level)
+    if prefetcher is not None:
+        prefetcher.after_question(chapter, language, level)
+
+    key = f"question:{chapter_id}:{language}:{level}:{question.get('problem_id')}|{fields_tag(fields)}"
+    return serialized_response(key, question, lambda: {
+        'question': project(question, fields),
         'level': level,
         'language': language,
         'chapter_id': chapter_id
@@ -849,9 +5081,16 @@ def get_question(chapter_id, level):
 
 @app.route('/api/chapters/<int:chapter_id>/questions/<int:level>/solution', methods=['GET'])
 def get_solution(chapter_id, level):
-    language = request.args.get('language', 'python')
-
-    solution = cache.get_solution(chapter_id, language, level)
+    language = request.args.get('language', Config.DEFAULT_LANGUAGE)
+    if language not in Config.SUPPORTED_LANGUAGES:
+        return jsonify({'error': f'Unsupported language: {language}'}), 400
+    if not is_valid_level(level):
+        return jsonify({'error': f'Level must be between 1 and {Config.MAX_QUESTION_LEVEL}'}), 400
+    if not chapter_manager.get_chapter(chapter_id):
+        return jsonify({'error': 'Chapter not found'}), 404
+
+    question = find_question(chapter_id, language, level, request.args.get('problem_id'))
+    solution = question.get('solution') if question else None
     if not solution:
         return jsonify({'error': 'Solution not found'}), 404
 
@@ -870,134 +5109,190 @@ def validate_code(chapter_id):
     if not data or not data.get('code'):
         return jsonify({'error': 'Code is required'}), 400
 
-    language = data.get('language', 'python')
+    language = data.get('language', Config.DEFAULT_LANGUAGE)
+    if language not in Config.SUPPORTED_LANGUAGES:
+        return jsonify({'error': f'Unsupported language: {language}'}), 400
     user_code = data['code']
     level = data.get('level', 1)
+    if not is_valid_level(level):
+        return jsonify({'error': f'Level must be between 1 and {Config.MAX_QUESTION_LEVEL}'}), 400
+    if not chapter_manager.get_chapter(chapter_id):
+        return jsonify({'error': 'Chapter not found'}), 404
 
-    question = cache.get_question(chapter_id, language, level)
+    question = find_question(chapter_id, language, level, data.get('problem_id'))
     if not question:
         return jsonify({'error': 'Question data not found'}), 404
 
-    print(f"Analyzing code for chapter {chapter_id}, level {level} in {language}...")
-    analysis = openai_service.analyze_user_code(user_code, question, language)
+    analysis, cached = grade_submission(chapter_id, language, level, question, user_code)
 
     return jsonify({
         'analysis': analysis,
         'level': level,
         'language': language,
-        'chapter_id': chapter_id
+        'chapter_id': chapter_id,
+        'cached': cached
+    })
+
+
+@app.route('/api/grade/bulk', methods=['POST'])
+def bulk_grade():
+    """Grade an NDJSON upload of submissions, streaming one NDJSON result line per submission"""
+    if not Config.ADMIN_TOKEN or request.headers.get('X-Admin-Token') != Config.ADMIN_TOKEN:
+        return jsonify({'error': 'Admin token required'}), 403
+
+    detail = request.args.get('detail') == 'full'
+
+    def results():
+        for result in bulk_grader.run(bulk_grader.read_lines(request.stream), detail):
+            yield json.dumps(result, separators=(',', ':')) + '\n'
+
+    return Response(stream_with_context(results()), mimetype='application/x-ndjson', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
     })
 
 
 @app.route('/api/preload', methods=['POST'])
 def preload_content():
-    """Preload concepts and questions"""
+    """Start a background job that preloads concepts and questions"""
+    if not Config.ADMIN_TOKEN or request.headers.get('X-Admin-Token') != Config.ADMIN_TOKEN:
+        return jsonify({'error': 'Admin token required'}), 403
+
     data = request.get_json() or {}
-    languages = data.get('languages', Config.SUPPORTED_LANGUAGES)
-    levels = data.get('levels', list(range(1, 11)))
+    languages = [lang for lang in data.get('languages', Config.SUPPORTED_LANGUAGES)
+                 if lang in Config.SUPPORTED_LANGUAGES]
+    levels = [level for level in data.get('levels', list(range(1, 11)))
+              if isinstance(level, int) and 1 <= level <= 10]
+
+    job, started = preload_manager.submit(languages, levels)
+    if not started:
+        return jsonify({
+            'error': 'A preload job is already running',
+            'job_id': job.job_id,
+            'status_url': f'/api/preload/{job.job_id}'
+        }), 409
+
+    return jsonify({
+        'message': f'Preload job started for {job.total} items',
+        'job_id': job.job_id,
+        'status_url': f'/api/preload/{job.job_id}'
+    }), 202
+
+
+@app.route('/api/preload/<job_id>', methods=['GET'])
+def preload_status(job_id):
+    """Report progress of a preload job"""
+    status = preload_manager.get_status(job_id)
+    if not status:
+        return jsonify({'error': 'Preload job not found'}), 404
+
+    return jsonify(status)
+
+
+@app.route('/api/content/export', methods=['GET'])
+def export_content():
+    """Download every stored concept and question as a gzip snapshot bundle"""
+    if cache.store is None:
+        return jsonify({'error': 'Content store is not enabled'}), 404
+    # The bundle holds every solution and test case
+    if not Config.ADMIN_TOKEN or request.headers.get('X-Admin-Token') != Config.ADMIN_TOKEN:
+        return jsonify({'error': 'Admin token required'}), 403
+
+    body = gzip.compress(json.dumps(cache.store.export_bundle(), separators=(',', ':')).encode('utf-8'))
+    return Response(body, mimetype='application/gzip', headers={
+        'Content-Disposition': 'attachment; filename=content-snapshot.json.gz'
+    })
 
-    results = []
 
-    for language in languages:
-        for chapter in chapter_manager.get_all_chapters():
-            # Preload concept
-            concept_key = f"concept_{chapter['id']}_{language}"
-            if not cache.get(concept_key):
-                print(f"🚀 Preloading concept for {chapter['name']} in {language}...")
-                try:
-                    concept = openai_service.generate_concept_content(
-                        chapter["name"],
-                        chapter["topics"],
-                        language
-                    )
-                    cache.set_concept(chapter['id'], language, concept)
-                    results.append({
-                        'type': 'concept',
-                        'chapter': chapter['name'],
-                        'language': language,
-                        'status': 'loaded'
-                    })
-                except Exception as e:
-                    results.append({
-                        'type': 'concept',
-                        'chapter': chapter['name'],
-                        'language': language,
-                        'status': 'error',
-                        'error': str(e)
-                    })
-
-            # Preload questions
-            for level in levels:
-                question_key = f"question_{chapter['id']}_{language}_{level}"
-                if not cache.get(question_key):
-                    print(f"🚀 Preloading {chapter['name']} - Level {level} in {language}...")
-                    try:
-                        question = openai_service.generate_single_question(
-                            chapter["name"],
-                            chapter["topics"],
-                            language,
-                            level
-                        )
-                        cache.set_question(chapter['id'], language, level, question)
-                        results.append({
-                            'type': 'question',
-                            'chapter': chapter['name'],
-                            'language': language,
-                            'level': level,
-                            'status': 'loaded'
-                        })
-                        # Small delay to avoid rate limiting
-                        time.sleep(1)
-                    except Exception as e:
-                        results.append({
-                            'type': 'question',
-                            'chapter': chapter['name'],
-                            'language': language,
-                            'level': level,
-                            'status': 'error',
-                            'error': str(e)
-                        })
+@app.route('/api/content/import', methods=['POST'])
+def import_content():
+    """Load a snapshot bundle (gzip or plain JSON body) into the content store"""
+    if cache.store is None:
+        return jsonify({'error': 'Content store is not enabled'}), 404
+    if not Config.ADMIN_TOKEN or request.headers.get('X-Admin-Token') != Config.ADMIN_TOKEN:
+        return jsonify({'error': 'Admin token required'}), 403
+
+    raw = request.get_data()
+    try:
+        if raw[:2] == b'\x1f\x8b':
+            raw = gzip.decompress(raw)
+        imported = cache.store.import_bundle(json.loads(raw), overwrite=request.args.get('overwrite') == 'true')
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        return jsonify({'error': f'Invalid bundle: {e}'}), 400
 
     return jsonify({
-        'message': f'Preloaded {len(results)} items',
-        'results': results
+        'message': f'Imported {imported} items',
+        'imported': imported
     })
 
 
 @app.route('/api/debug/cache', methods=['GET'])
 def debug_cache():
     """Debug endpoint to check cache status"""
-    cache_keys = list(cache.cache.keys())
+    cache_keys = cache.keys()
     concept_keys = [k for k in cache_keys if k.startswith('concept_')]
-    question_keys = [k for k in cache_keys if k.startswith('question_')]
+    question_keys = [k for k in cache_keys if k.startswith('question_') and not k.startswith('question_variants_')]
 
     status = {
         'concepts': len(concept_keys),
         'questions': len(question_keys),
-        'total': len(cache_keys)
+        'total': len(cache_keys),
+        'engine': cache.get_stats(),
+        'single_flight': single_flight.get_stats(),
+        # Stale-while-revalidate covers concepts only; questions are never refreshed in place
+        'refresh': {**stale_refresher.get_stats(), 'applies_to': 'concepts'},
+        'prefetch': prefetcher.get_stats() if prefetcher is not None else None,
+        'execution': execution_engine.get_stats(),
+        'submissions': submission_cache.get_stats(),
+        'bulk_grading': bulk_grader.get_stats(),
+        'question_pools': question_pools.get_stats(),
+        'fallback_catalog': openai_service.fallbacks.get_stats(),
+        'responses': response_cache.get_stats()
     }
 
     return jsonify({
         'cache_status': status,
-        'openai_connected': openai_service.check_connection()
+        'openai_connected': openai_service.is_available(),
+        'openai_status': openai_service.monitor.get_status(),
+        'openai_breaker': openai_service.breaker.get_status(),
+        'generation_scheduler': openai_service.scheduler.get_stats(),
+        'openai_async': openai_service.async_client.get_stats() if openai_service.async_client is not None else None,
+        'json_recovery': openai_service.json_extractor.get_stats()
     })
 
 
 if __name__ == '__main__':
+    if len(sys.argv) == 3 and sys.argv[1] in ('export', 'import'):
+        if cache.store is None:
+            sys.exit("Content store is not enabled (set CONTENT_STORE_PATH)")
+        if sys.argv[1] == 'export':
+            write_bundle(sys.argv[2], cache.store.export_bundle())
+            print(f"📦 Exported {cache.store.count()} items to {sys.argv[2]}")
+        else:
+            print(f"📦 Imported {cache.store.import_bundle(read_bundle(sys.argv[2]))} items from {sys.argv[2]}")
+        sys.exit(0)
+
     print("🚀 DSA Learning Platform API Starting...")
     print(f"📚 Chapters: {len(chapter_manager.get_all_chapters())}")
     print(f"🌐 Languages: {Config.SUPPORTED_LANGUAGES}")
-    print(f"🔌 OpenAI: {'Connected' if openai_service.check_connection() else 'Disconnected'}")
+    print(f"🔌 OpenAI: {'Connected' if openai_service.monitor.refresh() else 'Disconnected'}")
     print(f"🎯 Questions: Generated individually per level (1=easiest, 10=hardest)")
     print("\n📋 API Endpoints:")
     print("   GET  /api/health")
+    print("   GET  /api/bootstrap?language=python&chapter_id=1 (languages, chapters, status and first content)")
     print("   GET  /api/chapters?language=python")
-    print("   GET  /api/chapters/1/concept?language=python (get concept content)")
-    print("   GET  /api/chapters/1/questions/5?language=python (get level 5 question)")
+    print("   GET  /api/chapters/1/concept?language=python (get concept content; fields=title,overview for a preview)")
+    print("   GET  /api/chapters/1/concept/stream?language=python (stream concept content as SSE)")
+    print("   GET  /api/chapters/1/questions/5?language=python (get level 5 question; fields=all adds the solution)")
     print("   GET  /api/chapters/1/questions/5/solution")
     print("   POST /api/chapters/1/validate")
-    print("   POST /api/preload (preload content)")
+    print("   POST /api/grade/bulk (NDJSON submissions in, NDJSON results out)")
+    print("   POST /api/preload (start background preload job)")
+    print("   GET  /api/preload/<job_id> (preload job progress)")
+    print("   GET  /api/content/export (download content snapshot)")
+    print("   POST /api/content/import (load content snapshot)")
     print("   GET  /api/debug/cache (check cache status)")
+    print("   GET  /api/metrics (Prometheus metrics for this worker)")
     print("\n⚡ Both concepts and questions are now available!")
 
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -0,0 +1,551 @@
+# sandbox_runner.py
+"""Runs one Python submission on its test inputs inside a resource-limited child process.
+
+The parent starts this script ahead of time with --channel FD, a socket only the parent holds the
+other end of, and leaves it blocked there. It then sends a single JSON job line:
+{"code", "entry", "inputs", "limits"}. The runner applies the limits, calls the submission on every
+input and sends back one line with what each call returned. It never sees the expected outputs and
+never decides whether a test passed: the parent grades the reported values with grade_output, so
+nothing the submission prints or sends can pose as a verdict.
+
+If the parent then asks for a profile, the runner times the solution on generated inputs of growing
+size so the parent can estimate its complexity. Whatever the submission prints goes to the stdout and
+stderr files the parent opened for it, never to the channel.
+
+Before reading the job the runner isolates itself (see isolate): when it is started as root it first
+switches to an unprivileged uid, then it moves into new user, mount, network, PID and IPC namespaces,
+so the server's processes, environment, network and source tree are out of reach.
+
+With --exec FD the runner instead wraps one program (a compiler or a compiled submission): it
+isolates itself the same way, starts the program under rlimits and writes the program's exit status
+and resource usage to FD as one JSON line.
+"""
+import argparse
+import ast
+import copy
+import ctypes
+import gc
+import inspect
+import json
+import os
+import random
+import resource
+import signal
+import socket
+import statistics
+import sys
+import time
+import tracemalloc
+
+# Returned values are reported as repr() and str() text up to this many characters each
+VALUE_LIMIT = 64 * 1024
+# Timed calls per profiled input size; the median is reported
+MIN_RUNS, MAX_RUNS = 5, 51
+
+CLONE_NEWNS = 0x00020000
+CLONE_NEWIPC = 0x08000000
+CLONE_NEWUSER = 0x10000000
+CLONE_NEWPID = 0x20000000
+CLONE_NEWNET = 0x40000000
+MS_RDONLY, MS_NOSUID, MS_NODEV, MS_NOEXEC = 0x1, 0x2, 0x4, 0x8
+MS_REMOUNT, MS_BIND, MS_REC, MS_PRIVATE = 0x20, 0x1000, 0x4000, 0x40000
+# Mount flags a bind mount inherits and, inside a user namespace, must keep when remounted
+LOCKED_FLAGS = [(os.ST_NOSUID, MS_NOSUID), (os.ST_NODEV, MS_NODEV), (os.ST_NOEXEC, MS_NOEXEC),
+                (os.ST_NOATIME, 0x400), (os.ST_NODIRATIME, 0x800), (os.ST_RELATIME, 0x200000)]
+PR_SET_DUMPABLE, PR_SET_NO_NEW_PRIVS = 4, 38
+LINUX_CAPABILITY_VERSION_3 = 0x20080522
+# The uid and gid sandboxed code sees inside its user namespace
+SANDBOX_ID = 1000
+
+
+class TestTimeout(Exception):
+    pass
+
+
+class CPULimitExceeded(Exception):
+    pass
+
+
+class IsolationError(Exception):
+    pass
+
+
+class CapHeader(ctypes.Structure):
+    _fields_ = [('version', ctypes.c_uint32), ('pid', ctypes.c_int)]
+
+
+class CapData(ctypes.Structure):
+    _fields_ = [('effective', ctypes.c_uint32), ('permitted', ctypes.c_uint32), ('inheritable', ctypes.c_uint32)]
+
+
+def _on_alarm(signum, frame):
+    raise TestTimeout()
+
+
+def _on_cpu_limit(signum, frame):
+    raise CPULimitExceeded()
+
+
+def _check(libc, result, action):
+    if result != 0:
+        raise IsolationError(f"{action} failed: {os.strerror(ctypes.get_errno())}")
+
+
+def _write(path, text):
+    with open(path, 'w') as f:
+        f.write(text)
+
+
+def _wait_and_mirror(pid):
+    """Outside the new PID namespace: wait for its init, then end the way the sandboxed process did
+
+    init reports a process killed by signal N as exit code 128 + N, since it cannot signal itself.
+    """
+    os.closerange(3, resource.getrlimit(resource.RLIMIT_NOFILE)[0])
+    _, status = os.waitpid(pid, 0)
+    code = os.waitstatus_to_exitcode(status)
+    if code > 128:
+        code = -(code - 128)
+    if code < 0:
+        resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+        signal.signal(-code, signal.SIG_DFL)
+        os.kill(os.getpid(), -code)
+    os._exit(code)
+
+
+def _reap_until(pid):
+    """init of the sandbox's PID namespace: reap orphans until pid ends, then exit like it did
+
+    When init exits the kernel kills everything left in the namespace.
+    """
+    os.closerange(3, resource.getrlimit(resource.RLIMIT_NOFILE)[0])
+    while True:
+        child, status = os.wait()
+        if child == pid:
+            code = os.waitstatus_to_exitcode(status)
+            os._exit(128 - code if code < 0 else code)
+
+
+def isolate(options):
+    """Switch to the sandbox uid and fresh namespaces; returns as pid 2 of a new PID namespace
+
+    options: {'uid': uid to run as when started as root, 'namespaces': bool, 'hide': [directories],
+    'binds': [[source, target]] directories to show read-only at target, bound before hiding}.
+    The original process stays outside as a waiter that exits like the sandbox does, and pid 1 is a
+    bare init that only reaps; neither returns. Inside, /proc only lists the sandbox's own processes, the network has nothing but a downed
+    loopback, the hidden directories are empty, and every capability is dropped so none of it can be
+    undone.
+    """
+    libc = ctypes.CDLL(None, use_errno=True)
+    uid = options.get('uid')
+    if uid is not None and os.geteuid() == 0:
+        os.setgroups([])
+        os.setgid(uid)
+        os.setuid(uid)
+        # Changing uid makes the process non-dumpable, which would lock its own uid_map
+        libc.prctl(PR_SET_DUMPABLE, 1, 0, 0, 0)
+    if not options.get('namespaces'):
+        return
+    outer_uid, outer_gid = os.getuid(), os.getgid()
+    _check(libc, libc.unshare(CLONE_NEWUSER | CLONE_NEWNS | CLONE_NEWNET | CLONE_NEWPID | CLONE_NEWIPC),
+           'unshare')
+    _write('/proc/self/setgroups', 'deny')
+    _write('/proc/self/uid_map', f'{SANDBOX_ID} {outer_uid} 1')
+    _write('/proc/self/gid_map', f'{SANDBOX_ID} {outer_gid} 1')
+    pid = os.fork()
+    if pid:
+        _wait_and_mirror(pid)
+    _check(libc, libc.mount(b'none', b'/', None, MS_REC | MS_PRIVATE, None), 'making mounts private')
+    for source, target in options.get('binds', []):
+        _check(libc, libc.mount(os.fsencode(source), os.fsencode(target), None, MS_BIND | MS_REC, None),
+               f'binding {source}')
+        flags = MS_REMOUNT | MS_BIND | MS_RDONLY
+        for st_flag, ms_flag in LOCKED_FLAGS:
+            if os.statvfs(target).f_flag & st_flag:
+                flags |= ms_flag
+        _check(libc, libc.mount(None, os.fsencode(target), None, flags, None), f'making {target} read-only')
+    hidden = MS_RDONLY | MS_NOSUID | MS_NODEV | MS_NOEXEC
+    if libc.mount(b'proc', b'/proc', b'proc', MS_NOSUID | MS_NODEV | MS_NOEXEC, None) != 0:
+        # Some container runtimes refuse a fresh proc mount; then /proc is hidden altogether
+        _check(libc, libc.mount(b'none', b'/proc', b'tmpfs', hidden, b'size=4k,mode=555'), 'hiding /proc')
+    for path in options.get('hide', []):
+        # A directory this uid cannot enter is already out of reach
+        if os.path.isdir(path) and os.access(path, os.X_OK):
+            _check(libc, libc.mount(b'none', os.fsencode(path), b'tmpfs', hidden, b'size=4k,mode=555'),
+                   f'hiding {path}')
+    _check(libc, libc.prctl(PR_SET_NO_NEW_PRIVS, 1, 0, 0, 0), 'setting no_new_privs')
+    _check(libc, libc.capset(ctypes.byref(CapHeader(LINUX_CAPABILITY_VERSION_3, 0)), (CapData * 2)()),
+           'dropping capabilities')
+    # init ignores signals it has no handler for, so the sandboxed code must not run as pid 1
+    pid = os.fork()
+    if pid:
+        _reap_until(pid)
+
+
+def apply_limits(limits):
+    """Restrict CPU time, address space, file writes and process creation for this process"""
+    cpu = int(limits.get('cpu_seconds', 5))
+    memory = int(limits.get('memory_mb', 256)) * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu + 1))
+    resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+    resource.setrlimit(resource.RLIMIT_FSIZE, (1024 * 1024, 1024 * 1024))
+    resource.setrlimit(resource.RLIMIT_NOFILE, (64, 64))
+    resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+    try:
+        resource.setrlimit(resource.RLIMIT_NPROC, (0, 0))
+    except (ValueError, OSError):
+        pass
+    # Printing past the file-size limit fails the write instead of killing the process
+    signal.signal(signal.SIGXFSZ, signal.SIG_IGN)
+
+
+def apply_program_limits(limits):
+    """Limits for an --exec program; cpu_seconds, memory_mb, file_size_mb, open_files and processes are optional"""
+    cpu = limits.get('cpu_seconds')
+    if cpu:
+        resource.setrlimit(resource.RLIMIT_CPU, (int(cpu), int(cpu) + 1))
+    for limit, key, scale in ((resource.RLIMIT_AS, 'memory_mb', 1024 * 1024),
+                              (resource.RLIMIT_FSIZE, 'file_size_mb', 1024 * 1024),
+                              (resource.RLIMIT_NOFILE, 'open_files', 1),
+                              (resource.RLIMIT_NPROC, 'processes', 1)):
+        if limits.get(key):
+            value = int(limits[key] * scale)
+            resource.setrlimit(limit, (value, value))
+    resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+
+
+def execute(command, limits, report):
+    """--exec mode: run command under limits and write its exit status and own usage to report"""
+    started = time.perf_counter()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.close(report)
+            apply_program_limits(limits)
+            os.execvp(command[0], command)
+        except OSError as e:
+            os.write(2, f"{command[0]}: {e.strerror}\n".encode('utf-8'))
+        os._exit(127)
+    _, status, usage = os.wait4(pid, 0)
+    os.write(report, json.dumps({
+        'returncode': os.waitstatus_to_exitcode(status),
+        'runtime_ms': round((time.perf_counter() - started) * 1000, 3),
+        'cpu_ms': round((usage.ru_utime + usage.ru_stime) * 1000, 3),
+        'peak_memory_kb': usage.ru_maxrss
+    }).encode('utf-8') + b'\n')
+
+
+def parse_arguments(raw):
+    """Turn a test input such as '[1, 2], 3' or 'nums = [1, 2], target = 3' into call arguments"""
+    if not isinstance(raw, str):
+        return [raw], {}
+    try:
+        call = ast.parse(f"f({raw})", mode='eval').body
+        args = [ast.literal_eval(arg) for arg in call.args]
+        kwargs = {kw.arg: ast.literal_eval(kw.value) for kw in call.keywords if kw.arg}
+        return args, kwargs
+    except (SyntaxError, ValueError, TypeError):
+        return [raw], {}
+
+
+def parse_expected(raw):
+    if not isinstance(raw, str):
+        return raw
+    try:
+        return ast.literal_eval(raw.strip())
+    except (SyntaxError, ValueError):
+        return raw.strip()
+
+
+def bind_arguments(function, args, kwargs):
+    """Pass named test inputs positionally when the submission uses different parameter names"""
+    if not kwargs:
+        return args, kwargs
+    try:
+        parameters = inspect.signature(function).parameters
+    except (TypeError, ValueError):
+        return args, kwargs
+    accepts_any = any(p.kind == p.VAR_KEYWORD for p in parameters.values())
+    if accepts_any or all(name in parameters for name in kwargs):
+        return args, kwargs
+    return args + list(kwargs.values()), {}
+
+
+def normalize(value):
+    if isinstance(value, (list, tuple)):
+        return [normalize(item) for item in value]
+    if isinstance(value, dict):
+        return {key: normalize(item) for key, item in value.items()}
+    return value
+
+
+def describe(value):
+    """The repr() and str() text of a returned value, which is all the parent gets to see of it"""
+    text, shown = repr(value), str(value)
+    return {'value': text if len(text) <= VALUE_LIMIT else None, 'text': shown[:VALUE_LIMIT]}
+
+
+def grade_output(reported, expected_raw) -> bool:
+    """Parent side: compare a value the sandbox reported (see describe) with a test's expected output
+
+    Only literals are rebuilt from their repr, so a submission cannot smuggle in an object whose
+    __eq__ always agrees.
+    """
+    expected = parse_expected(expected_raw)
+    value = reported.get('value')
+    if isinstance(value, str):
+        try:
+            if normalize(ast.literal_eval(value)) == normalize(expected):
+                return True
+        except (SyntaxError, ValueError, TypeError, MemoryError, RecursionError):
+            pass
+    if isinstance(expected, str):
+        return str(reported.get('text', '')).strip() == expected or value == expected
+    return False
+
+
+def resolve_entry(namespace, entry):
+    """Find the function to call: the signature's name, a Solution method, or the last function defined"""
+    if entry and callable(namespace.get(entry)):
+        return namespace[entry]
+    solution_class = namespace.get('Solution')
+    if isinstance(solution_class, type):
+        instance = solution_class()
+        methods = [name for name, member in vars(solution_class).items()
+                   if callable(member) and not name.startswith('_')]
+        if entry and hasattr(instance, entry):
+            return getattr(instance, entry)
+        if methods:
+            return getattr(instance, methods[0])
+    functions = [value for value in namespace.values()
+                 if callable(value) and getattr(value, '__module__', None) == '__submission__'
+                 and not isinstance(value, type)]
+    return functions[-1] if functions else None
+
+
+def input_size(args, kwargs):
+    return sum(len(value) for value in list(args) + list(kwargs.values())
+               if isinstance(value, (list, tuple, str, dict)))
+
+
+def scale_value(value, n, rng, scale_ints):
+    """Build a value shaped like the test input but with n elements"""
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, int):
+        return n if scale_ints else value
+    if isinstance(value, str):
+        alphabet = sorted(set(value)) or ['a']
+        return ''.join(rng.choice(alphabet) for _ in range(n))
+    if isinstance(value, (list, tuple)):
+        if not value:
+            return type(value)()
+        if all(isinstance(item, int) and not isinstance(item, bool) for item in value):
+            low, high = min(value), max(value)
+            # A wide value range keeps accidental early exits (e.g. a pair found at once) rare, but
+            # staying within one 30-bit digit keeps every size on CPython's same int fast paths
+            spread = max(high - low, min(n * n, 2 ** 30 - 1 - max(low, 0)))
+            items = [rng.randint(low, low + spread) for _ in range(n)]
+            # Keep sorted inputs sorted so binary-search style solutions stay valid
+            if list(value) == sorted(value):
+                items.sort()
+        else:
+            items = [copy.deepcopy(rng.choice(value)) for _ in range(n)]
+        return type(value)(items)
+    return value
+
+
+def fresh_copy(value):
+    """Cheap copy of a generated input so in-place mutation in one run cannot affect the next"""
+    if isinstance(value, list):
+        return [fresh_copy(item) for item in value] if value and isinstance(value[0], (list, dict)) \
+            else list(value)
+    if isinstance(value, dict):
+        return {key: fresh_copy(item) for key, item in value.items()}
+    return value
+
+
+def profile_growth(function, raw_input, profile):
+    """Time and trace allocations of function on inputs of growing size derived from a test input"""
+    args, kwargs = bind_arguments(function, *parse_arguments(raw_input))
+    # With no sequence to grow, the integer arguments are the problem size (e.g. fib(n))
+    scale_ints = input_size(args, kwargs) == 0
+    if scale_ints and not any(isinstance(value, int) for value in list(args) + list(kwargs.values())):
+        return {'error': 'Test input has nothing to scale'}
+
+    budget = float(profile.get('budget_seconds', 3))
+    max_size = int(profile.get('max_size', 100000))
+    deadline = time.perf_counter() + budget
+    samples, n = [], 8
+    while n <= max_size:
+        rng = random.Random(n)
+        scaled_args = [scale_value(value, n, rng, scale_ints) for value in args]
+        scaled_kwargs = {key: scale_value(value, n, rng, scale_ints) for key, value in kwargs.items()}
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            break
+        timings = []
+        signal.setitimer(signal.ITIMER_REAL, remaining)
+        gc.disable()
+        try:
+            # Repeat each size so one preempted or cache-cold call does not decide the fit
+            while len(timings) < MAX_RUNS and (len(timings) < MIN_RUNS or sum(timings) < 0.02):
+                call_args = [fresh_copy(value) for value in scaled_args]
+                call_kwargs = {key: fresh_copy(value) for key, value in scaled_kwargs.items()}
+                started = time.perf_counter()
+                function(*call_args, **call_kwargs)
+                timings.append(time.perf_counter() - started)
+            gc.enable()
+            call_args = [fresh_copy(value) for value in scaled_args]
+            call_kwargs = {key: fresh_copy(value) for key, value in scaled_kwargs.items()}
+            tracemalloc.start()
+            function(*call_args, **call_kwargs)
+            peak_kb = tracemalloc.get_traced_memory()[1] / 1024
+            tracemalloc.stop()
+            signal.setitimer(signal.ITIMER_REAL, 0)
+        except TestTimeout:
+            gc.enable()
+            tracemalloc.stop()
+            break
+        except BaseException as e:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            gc.enable()
+            tracemalloc.stop()
+            return {'samples': samples, 'error': f"{type(e).__name__} at n={n}: {e}"}
+        median = statistics.median(timings)
+        samples.append({'n': n, 'seconds': median, 'runs': len(timings), 'peak_kb': round(peak_kb, 3)})
+        # Stop once the next (1.5x larger) size would likely overrun the budget
+        if median * MIN_RUNS * 1.5 > deadline - time.perf_counter():
+            break
+        # Exponential growth would exhaust the budget within a step or two of 1.5x, so once a
+        # step more than triples the time, step finely to get enough sizes for a fit
+        steep = len(samples) > 1 and median > 3 * samples[-2]['seconds']
+        n = n + max(1, n // 8) if steep else int(n * 1.5)
+    return {'samples': samples, 'scaled': 'integers' if scale_ints else 'sequences'}
+
+
+def run_tests(job):
+    """Call the submission on every input; returns (outcome, function)"""
+    limits = job.get('limits', {})
+    per_test = float(limits.get('test_seconds', 2))
+    namespace = {'__name__': '__submission__'}
+
+    try:
+        exec(compile(job['code'], '<submission>', 'exec'), namespace)
+    except BaseException as e:
+        return {'status': 'compile_error', 'error': f"{type(e).__name__}: {e}", 'test_results': []}, None
+
+    function = resolve_entry(namespace, job.get('entry'))
+    if function is None:
+        return {'status': 'compile_error', 'error': 'No function found to call', 'test_results': []}, None
+
+    results = []
+    signal.signal(signal.SIGALRM, _on_alarm)
+    signal.signal(signal.SIGXCPU, _on_cpu_limit)
+    cpu_exhausted = False
+    for index, raw_input in enumerate(job.get('inputs', [])):
+        if cpu_exhausted:
+            results.append({'index': index, 'status': 'skipped', 'error': 'CPU time limit already exhausted'})
+            continue
+        args, kwargs = bind_arguments(function, *parse_arguments(raw_input))
+        result = {'index': index}
+        tracemalloc.start()
+        started = time.perf_counter()
+        signal.setitimer(signal.ITIMER_REAL, per_test)
+        try:
+            actual = function(*args, **kwargs)
+            # repr() and str() run submission code too, so they stay under the per-test timer
+            result.update(describe(actual), status='returned')
+            signal.setitimer(signal.ITIMER_REAL, 0)
+        except TestTimeout:
+            result.update(status='timeout', error=f'Exceeded {per_test}s time limit')
+        except CPULimitExceeded:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            cpu_exhausted = True
+            result.update(status='cpu_limit', error='CPU time limit exceeded')
+        except MemoryError:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            result.update(status='memory_limit', error='Memory limit exceeded')
+        except BaseException as e:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            result.update(status='error', error=f"{type(e).__name__}: {e}")
+        result['runtime_ms'] = round((time.perf_counter() - started) * 1000, 3)
+        result['peak_memory_kb'] = round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+        tracemalloc.stop()
+        results.append(result)
+
+    return {'status': 'ok', 'test_results': results}, function
+
+
+def profile_job(function, job, profile):
+    """Profile on the largest test input; only called once the parent has seen every test pass"""
+    inputs = job.get('inputs', [])
+    largest = max(inputs, key=lambda raw: input_size(*parse_arguments(raw)))
+    try:
+        return profile_growth(function, largest, profile)
+    except CPULimitExceeded:
+        return {'error': 'CPU time limit exceeded while profiling'}
+
+
+def send(channel, message):
+    channel.sendall(json.dumps(message).encode('utf-8') + b'\n')
+
+
+def flush_output():
+    for stream in (sys.stdout, sys.stderr):
+        try:
+            stream.flush()
+        except Exception:
+            pass
+
+
+def serve(channel):
+    reader = channel.makefile('rb')
+    job = json.loads(reader.readline())
+    apply_limits(job.get('limits', {}))
+    outcome, function = run_tests(job)
+    flush_output()
+    outcome['max_rss_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    send(channel, outcome)
+    request = json.loads(reader.readline() or b'{}')
+    if function is not None and request.get('profile') and job.get('inputs'):
+        signal.signal(signal.SIGALRM, _on_alarm)
+        send(channel, {'profile': profile_job(function, job, request['profile'])})
+        flush_output()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--channel', type=int, help='socket shared with the parent')
+    parser.add_argument('--exec', dest='report', type=int, help='run the command after -- and report on this fd')
+    parser.add_argument('--limits', type=json.loads, default={}, help='rlimits for --exec (JSON)')
+    parser.add_argument('--sandbox', type=json.loads, default={}, help='isolation options (JSON)')
+    parser.add_argument('command', nargs=argparse.REMAINDER)
+    options = parser.parse_args()
+    if options.report is not None:
+        try:
+            try:
+                isolate(options.sandbox)
+            except (IsolationError, OSError) as e:
+                os.write(options.report, json.dumps({'error': f"Sandbox isolation unavailable: {e}"}).encode('utf-8'))
+                return
+            execute(options.command[1:] if options.command[:1] == ['--'] else options.command,
+                    options.limits, options.report)
+        finally:
+            os._exit(0)
+    channel = socket.socket(fileno=options.channel)
+    try:
+        try:
+            isolate(options.sandbox)
+        except (IsolationError, OSError) as e:
+            # Refuse to run anything rather than run it unisolated; answer once the job arrives
+            channel.makefile('rb').readline()
+            send(channel, {'status': 'sandbox_error', 'error': f"Sandbox isolation unavailable: {e}"})
+            return
+        serve(channel)
+    finally:
+        os._exit(0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,11 @@
+import os
+import sys
+
+# Import the app without an API key, Redis, an on-disk content store or prefetch workers
+os.environ.pop('OPENAI_API_KEY', None)
+os.environ.pop('OPENAI_API_BASE', None)
+os.environ.pop('REDIS_URL', None)
+os.environ['CONTENT_STORE_PATH'] = ''
+os.environ['PREFETCH_ENABLED'] = 'false'
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,102 @@
+import io
+import json
+import time
+
+import pytest
+
+import main
+from main import BulkGrader, Config
+
+ADMIN = {'X-Admin-Token': 'secret'}
+
+
+@pytest.fixture(autouse=True)
+def grading(monkeypatch):
+    """Grade every submission instantly: score 100 when the code is 'right', 0 otherwise"""
+    monkeypatch.setattr(Config, 'ADMIN_TOKEN', 'secret')
+    monkeypatch.setattr(main, 'find_question', lambda chapter_id, language, level, problem_id: {'problem_id': 'p'})
+
+    def grade(chapter_id, language, level, question, code):
+        score = 100 if code == 'right' else 0
+        return {'correctness_score': score, 'is_correct': score == 100, 'passed_test_cases': score // 100,
+                'total_test_cases': 1}, False
+
+    monkeypatch.setattr(main, 'grade_submission', grade)
+
+
+def ndjson(*items):
+    return b''.join(json.dumps(item).encode() + b'\n' for item in items)
+
+
+def post(body, **kwargs):
+    response = main.app.test_client().post('/api/grade/bulk', data=body, headers=ADMIN, **kwargs)
+    return response, [json.loads(line) for line in response.data.splitlines()]
+
+
+def test_bulk_grading_requires_the_admin_token():
+    client = main.app.test_client()
+    assert client.post('/api/grade/bulk', data=ndjson({'code': 'right'})).status_code == 403
+    assert client.post('/api/grade/bulk', data=b'', headers={'X-Admin-Token': 'wrong'}).status_code == 403
+
+
+def test_each_submission_gets_a_result_line_and_a_summary_closes_the_stream():
+    response, lines = post(ndjson(
+        {'id': 'a', 'chapter_id': 1, 'level': 1, 'code': 'right'},
+        {'id': 'b', 'chapter_id': 1, 'level': 2, 'code': 'wrong'},
+        {'id': 'c', 'chapter_id': 1, 'level': 1},
+    ) + b'\nnot json\n')
+
+    assert response.mimetype == 'application/x-ndjson'
+    results = {line['line']: line for line in lines[:-1]}
+    assert (results[1]['id'], results[1]['status'], results[1]['score']) == ('a', 'graded', 100)
+    assert (results[2]['status'], results[2]['score']) == ('graded', 0)
+    assert (results[3]['id'], results[3]['error']) == ('c', 'Code is required')
+    assert results[4]['status'] == 'error'
+    assert 'analysis' not in results[1]
+    assert {key: lines[-1]['summary'][key] for key in ('total', 'graded', 'errors')} == {
+        'total': 4, 'graded': 2, 'errors': 2}
+
+
+def test_full_detail_includes_the_analysis():
+    _, lines = post(ndjson({'chapter_id': 1, 'level': 1, 'code': 'right'}), query_string={'detail': 'full'})
+    assert lines[0]['analysis']['correctness_score'] == 100
+
+
+@pytest.mark.parametrize('submission, error', [
+    ({'chapter_id': 42, 'level': 1, 'code': 'right'}, 'Chapter not found'),
+    ({'chapter_id': 1, 'level': 11, 'code': 'right'}, 'Level must be between 1 and 10'),
+    ({'chapter_id': 1, 'level': 1, 'code': 'right', 'language': 'cobol'}, 'Unsupported language: cobol'),
+])
+def test_invalid_submissions_are_reported_per_line(submission, error):
+    _, lines = post(ndjson(submission))
+    assert lines[0]['error'] == error
+
+
+def test_oversized_lines_are_skipped_without_losing_the_next_one():
+    grader = BulkGrader(workers=1, max_line_bytes=64)
+    stream = io.BytesIO(ndjson({'code': 'x' * 500}, {'chapter_id': 1, 'level': 1, 'code': 'right'}))
+
+    lines = list(grader.read_lines(stream))
+
+    assert lines[0] is None
+    assert json.loads(lines[1])['code'] == 'right'
+    assert grader.grade_line(1, None, False)['error'] == 'Submission exceeds 64 bytes'
+
+
+def test_read_ahead_is_bounded(monkeypatch):
+    def slow_grade(*args):
+        time.sleep(0.01)
+        return {}, False
+
+    monkeypatch.setattr(main, 'grade_submission', slow_grade)
+    grader = BulkGrader(workers=2, max_in_flight=3)
+
+    def lines():
+        for _ in range(10):
+            assert grader.get_stats()['in_flight'] <= 3
+            yield ndjson({'chapter_id': 1, 'level': 1, 'code': 'right'})
+
+    results = list(grader.run(lines()))
+
+    assert results[-1]['summary']['graded'] == 10
+    assert grader.get_stats()['in_flight'] == 0
@@ -0,0 +1,51 @@
+from main import CircuitBreaker
+
+
+def test_opens_after_consecutive_failures():
+    breaker = CircuitBreaker('test', failure_threshold=3, reset_timeout=60, half_open_calls=1)
+    for _ in range(2):
+        breaker.record_failure('boom')
+    assert breaker.allow()
+
+    breaker.record_failure('boom')
+    assert breaker.is_open()
+    assert not breaker.allow()
+    status = breaker.get_status()
+    assert status['state'] == CircuitBreaker.OPEN
+    assert status['rejected'] == 1
+    assert 0 < status['retry_in'] <= 60
+
+
+def test_success_resets_the_failure_count():
+    breaker = CircuitBreaker('test', failure_threshold=2, reset_timeout=60, half_open_calls=1)
+    breaker.record_failure('boom')
+    breaker.record_success()
+    breaker.record_failure('boom')
+    assert not breaker.is_open()
+
+
+def test_half_open_admits_limited_trials_and_closes_on_success():
+    breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=0, half_open_calls=2)
+    breaker.record_failure('boom')
+
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow()
+
+
+def test_failed_trial_reopens():
+    breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=0.5, half_open_calls=1)
+    breaker.record_failure('boom')
+    breaker.reset_timeout = 0
+    assert breaker.allow()
+
+    breaker.reset_timeout = 60
+    breaker.record_failure('still down')
+    assert breaker.is_open()
+    assert breaker.stats['opened'] == 2
+    assert [t['to'] for t in breaker.get_status()['transitions']] == ['open', 'half_open', 'open']
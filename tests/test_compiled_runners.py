@@ -0,0 +1,46 @@
+import pytest
+
+import main
+from main import CompiledLanguageRunner, Config
+
+QUESTION = {
+    'function_signature': 'int solve(vector<int>& nums)',
+    'test_cases': [
+        {'input': '3\n1 2 3', 'expected_output': '6'},
+        {'input': '2\n5 -5', 'expected_output': '0'},
+    ]
+}
+
+
+@pytest.fixture
+def run(monkeypatch):
+    if not main.execution_engine.supports('cpp'):
+        pytest.skip('g++ is not installed')
+    monkeypatch.setattr(Config, 'EXECUTION_TEST_SECONDS', 5)
+
+    def run(code):
+        execution = main.execution_engine.run(code, QUESTION, 'cpp')
+        if execution.get('status') == 'sandbox_error':
+            pytest.skip('the code sandbox cannot isolate processes on this host')
+        return execution
+    return run
+
+
+def test_runner_hooks_are_abstract():
+    with pytest.raises(TypeError):
+        CompiledLanguageRunner(main.execution_engine.compile_cache)
+
+
+def test_complete_programs_are_graded(run):
+    execution = run('int main() { int n, x; long s = 0; std::cin >> n; while (n-- && std::cin >> x) s += x;'
+                    ' std::cout << s << std::endl; }')
+    assert execution['supported'] and execution['status'] == 'ok'
+    assert execution['passed'] == 2
+
+
+def test_function_only_submissions_are_not_graded(run):
+    execution = run('int solve(vector<int>& nums) { return accumulate(nums.begin(), nums.end(), 0); }')
+    assert not execution['supported']
+    analysis = main.openai_service.analyze_user_code('', QUESTION, 'cpp', execution)
+    assert (analysis['graded'], analysis['correctness_score']) == (False, None)
+    assert 'main' in analysis['feedback']
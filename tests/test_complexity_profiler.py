@@ -0,0 +1,67 @@
+import math
+
+import pytest
+
+from main import ComplexityProfiler
+
+SIZES = [1000 * 2 ** step for step in range(8)]
+
+
+def samples(cost, sizes=SIZES, peak=lambda n: 64.0):
+    return [{'n': n, 'seconds': cost(n), 'peak_kb': peak(n)} for n in sizes]
+
+
+@pytest.mark.parametrize('cost, expected', [
+    (lambda n: 1e-3 + 2e-7 * n, 'O(n)'),
+    (lambda n: 1e-4 + 3e-10 * n * n, 'O(n^2)'),
+    (lambda n: 5e-4 + 1e-7 * n * math.log2(n) * (1 + 0.3 * (n % 3)), None),
+])
+def test_fit_time(cost, expected):
+    fit = ComplexityProfiler.fit(samples(cost), 'seconds', ComplexityProfiler.TIME_FLOOR_SECONDS)
+    assert fit['class'] == expected
+    if expected is None:
+        assert fit['candidates']
+
+
+def test_exponential_growth_is_recognised():
+    fit = ComplexityProfiler.fit(samples(lambda n: 1e-6 * 1.618 ** n, sizes=list(range(10, 26, 2))), 'seconds',
+                                 ComplexityProfiler.TIME_FLOOR_SECONDS)
+    assert fit['class'] == 'O(2^n)'
+
+
+def test_sizes_below_the_floor_are_not_fitted():
+    fit = ComplexityProfiler.fit(samples(lambda n: 1e-6), 'seconds', ComplexityProfiler.TIME_FLOOR_SECONDS)
+    assert fit['class'] is None
+    assert fit['candidates'] == ['O(1)', 'O(log n)']
+    assert 'too small' in fit['reason']
+
+
+def test_space_is_fitted_on_the_larger_half():
+    # Flat until a buffer kicks in, then linear: the small sizes alone would look like a log factor
+    peak = lambda n: 8.0 if n < 8000 else 0.5 + n / 256
+    fit = ComplexityProfiler.fit(samples(lambda n: 1e-3, peak=peak), 'peak_kb', ComplexityProfiler.SPACE_FLOOR_KB,
+                                 larger_half=True)
+    assert fit['class'] == 'O(n)'
+
+
+@pytest.mark.parametrize('stated, expected', [
+    ('O(n log n)', 'O(n log n)'),
+    ('O(N^2) - nested loops', 'O(n^2)'),
+    ('O(n²)', 'O(n^2)'),
+    ('O(1)', 'O(1)'),
+    ('O(n + m)', None),
+    (None, None),
+])
+def test_parse(stated, expected):
+    assert ComplexityProfiler.parse(stated) == expected
+
+
+def test_verdicts():
+    assert ComplexityProfiler.verdict({'class': 'O(n)'}, 'O(n)') == 'matches'
+    assert ComplexityProfiler.verdict({'class': 'O(n^2)'}, 'O(n)') == 'worse'
+    assert ComplexityProfiler.verdict({'class': 'O(log n)'}, 'O(n)') == 'better'
+    assert ComplexityProfiler.verdict({'class': None, 'candidates': ['O(n)', 'O(n log n)']}, 'O(n)') == 'inconclusive'
+    # A log factor of cache misses alone is not evidence against the stated time
+    assert ComplexityProfiler.verdict({'class': 'O(n log n)'}, 'O(n)', timed=True) == 'inconclusive'
+    assert ComplexityProfiler.verdict({'class': 'O(n log n)'}, 'O(n)') == 'worse'
+    assert ComplexityProfiler.verdict({'class': 'O(n)'}, 'depends on input') == 'unknown'
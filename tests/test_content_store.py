@@ -0,0 +1,120 @@
+import gzip
+import json
+
+import pytest
+
+import main
+from main import Config, ContentCache, PersistentContentStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return PersistentContentStore(str(tmp_path / 'content.db'))
+
+
+def test_queued_writes_are_readable_after_flush(store):
+    store.enqueue('concept_1_python', {'title': 'Arrays'}, generated_at=100.0)
+    store.enqueue('concept_1_python', {'title': 'Arrays, revised'}, generated_at=200.0)
+    store.flush()
+
+    assert store.get_entries(['concept_1_python', 'concept_2_python']) == {
+        'concept_1_python': ({'title': 'Arrays, revised'}, 200.0)
+    }
+    assert store.count() == 1
+
+
+def test_content_survives_a_restart(tmp_path):
+    path = str(tmp_path / 'nested' / 'content.db')
+    first = PersistentContentStore(path)
+    first.enqueue('question_1_java_3', {'level': 3}, generated_at=50.0)
+    first.flush()
+
+    assert PersistentContentStore(path).get_entries(['question_1_java_3']) == {'question_1_java_3': ({'level': 3}, 50.0)}
+
+
+def test_load_recent_returns_the_newest_items_oldest_first(store):
+    for index in range(5):
+        store.enqueue(f'concept_{index}_python', {'index': index}, generated_at=1000.0 + index)
+    store.flush()
+
+    assert [key for key, _, _ in store.load_recent(3)] == ['concept_2_python', 'concept_3_python', 'concept_4_python']
+
+
+def test_export_leaves_out_fallback_content(store):
+    store.enqueue('concept_1_python', {'title': 'Arrays'})
+    store.enqueue('concept_2_python', {'title': 'Template', 'is_fallback': True})
+    store.enqueue('question_1_python_1', {'problem_id': 'arrays_1_fallback'})
+
+    bundle = store.export_bundle()
+
+    assert bundle['version'] == 1
+    assert [item['key'] for item in bundle['items']] == ['concept_1_python']
+
+
+def test_import_keeps_existing_items_unless_overwriting(store):
+    store.enqueue('concept_1_python', {'title': 'Local'}, generated_at=10.0)
+    store.flush()
+    bundle = {'version': 1, 'items': [
+        {'key': 'concept_1_python', 'value': {'title': 'Shipped'}, 'updated_at': 20.0},
+        {'key': 'concept_2_python', 'value': {'title': 'Linked lists'}, 'updated_at': 20.0},
+        {'key': 'admin_token', 'value': 'not content'},
+        {'key': 'concept_3_python', 'value': {'title': 'Template', 'is_fallback': True}},
+    ]}
+
+    assert store.import_bundle(bundle) == 1
+    assert store.get_entries(['concept_1_python'])['concept_1_python'][0] == {'title': 'Local'}
+    assert store.import_bundle(bundle, overwrite=True) == 2
+    assert store.get_entries(['concept_1_python'])['concept_1_python'][0] == {'title': 'Shipped'}
+    assert store.count() == 2
+
+
+def test_import_rejects_unknown_bundle_versions(store):
+    with pytest.raises(ValueError):
+        store.import_bundle({'version': 2, 'items': []})
+
+
+def test_cache_reads_through_to_the_store(store):
+    cache = ContentCache(store=store, default_ttl=300, max_stale=3600)
+    store.enqueue('concept_1_python', {'title': 'Arrays'})
+    store.flush()
+
+    assert cache.get('concept_1_python') == {'title': 'Arrays'}
+    assert 'concept_1_python' in cache.keys()
+
+
+def test_cache_does_not_persist_fallbacks(store):
+    cache = ContentCache(store=store)
+    cache.set('concept_1_python', {'title': 'Template', 'is_fallback': True})
+    cache.set('concept_2_python', {'title': 'Arrays'})
+    store.flush()
+
+    assert list(store.get_entries(['concept_1_python', 'concept_2_python'])) == ['concept_2_python']
+
+
+def test_export_and_import_require_the_admin_token(store, monkeypatch):
+    monkeypatch.setattr(Config, 'ADMIN_TOKEN', 'secret')
+    monkeypatch.setattr(main.cache, 'store', store)
+    store.enqueue('question_1_python_1', {'solution': 'def solve(): ...'})
+    client = main.app.test_client()
+
+    assert client.get('/api/content/export').status_code == 403
+    assert client.get('/api/content/export', headers={'X-Admin-Token': 'wrong'}).status_code == 403
+    assert client.post('/api/content/import', data=b'{}').status_code == 403
+
+    exported = client.get('/api/content/export', headers={'X-Admin-Token': 'secret'})
+    assert exported.status_code == 200
+    bundle = json.loads(gzip.decompress(exported.data))
+    assert [item['key'] for item in bundle['items']] == ['question_1_python_1']
+
+
+def test_stale_counters_only_cover_refreshed_keys(monkeypatch):
+    cache = ContentCache(default_ttl=10, max_stale=3600, refresh_prefixes=('concept_',))
+    monkeypatch.setattr(main.time, 'time', lambda: 1000.0)
+    cache.set('concept_1_python', {'title': 'Arrays'})
+    cache.set('question_1_python_1', {'problem_id': 'p1'})
+    monkeypatch.setattr(main.time, 'time', lambda: 1100.0)
+
+    assert cache.get('question_1_python_1') == {'problem_id': 'p1'}
+    assert cache.get('concept_1_python') == {'title': 'Arrays'}
+    stats = cache.get_stats()
+    assert (stats['stale_hits'], stats['stale_entries']) == (1, 1)
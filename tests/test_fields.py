@@ -0,0 +1,52 @@
+import pytest
+
+import main
+from main import ResponseCache
+
+CONCEPT = {'title': 'Arrays', 'overview': 'Contiguous storage', 'theory_content': 'Indexing is O(1).',
+           'learning_objectives': ['Index'], 'code_examples': [{'code': 'a[0]'}], 'key_takeaways': ['Fast reads']}
+QUESTION = {'level': 1, 'problem_id': 'p1', 'title': 'Sum', 'description': 'Add the numbers',
+            'examples': [{'input': '[1, 2]', 'output': '3'}], 'hints': ['Loop'],
+            'function_signature': 'def solve(nums):', 'test_cases': [{'input': '[1, 2]', 'expected_output': '3'}],
+            'solution': 'def solve(nums):\n    return sum(nums)', 'solution_explanation': 'Built-in sum',
+            'time_complexity': 'O(n)', 'space_complexity': 'O(1)'}
+
+
+@pytest.fixture(autouse=True)
+def content(monkeypatch):
+    monkeypatch.setattr(main, 'response_cache', ResponseCache(max_entries=10, max_bytes=1 << 20))
+    monkeypatch.setattr(main, 'load_concept', lambda chapter, language: CONCEPT)
+    monkeypatch.setattr(main, 'load_question', lambda chapter, language, level: QUESTION)
+
+
+def get(path):
+    return main.app.test_client().get(path)
+
+
+def test_questions_leave_out_the_solution_by_default():
+    question = get('/api/chapters/1/questions/1').get_json()['question']
+    assert 'solution' not in question and 'solution_explanation' not in question
+    assert question['test_cases'] == QUESTION['test_cases']
+
+
+def test_fields_all_sends_the_whole_object():
+    assert get('/api/chapters/1/questions/1?fields=all').get_json()['question'] == QUESTION
+    assert get('/api/chapters/1/concept?fields=*').get_json()['concept'] == CONCEPT
+
+
+def test_fields_selects_a_subset_in_schema_order():
+    concept = get('/api/chapters/1/concept?fields=overview,%20title').get_json()['concept']
+    assert list(concept) == ['title', 'overview']
+
+
+def test_unknown_fields_are_rejected():
+    response = get('/api/chapters/1/concept?fields=title,secret')
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Unknown concept fields: secret'
+
+
+def test_each_projection_has_its_own_etag():
+    preview = get('/api/chapters/1/concept?fields=title')
+    full = get('/api/chapters/1/concept')
+    assert preview.headers['ETag'] != full.headers['ETag']
+    assert get('/api/chapters/1/concept?fields=title').get_json() == preview.get_json()
@@ -0,0 +1,124 @@
+import threading
+import time
+
+import pytest
+
+from main import GenerationQueueTimeout, GenerationScheduler
+
+
+def make_scheduler(**kwargs):
+    options = {'max_concurrency': 1, 'requests_per_minute': 0, 'tokens_per_minute': 0, 'background_share': 1.0}
+    options.update(kwargs)
+    return GenerationScheduler(**options)
+
+
+def wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'condition not reached'
+        time.sleep(0.005)
+
+
+def start_waiter(scheduler, priority, admitted, name=None):
+    """Queue one call in a thread that records its name when admitted and releases straight away"""
+
+    def run():
+        with scheduler.priority(priority):
+            ticket = scheduler.acquire(10, timeout=5)
+        admitted.append(name or priority)
+        scheduler.release(ticket)
+
+    thread = threading.Thread(target=run, daemon=True)
+    queued = scheduler.get_stats()['queued']
+    thread.start()
+    wait_until(lambda: scheduler.get_stats()['queued'] == queued + 1)
+    return thread
+
+
+def test_waiters_are_served_by_priority_then_fifo():
+    scheduler = make_scheduler()
+    held = scheduler.acquire(10)
+    admitted = []
+    threads = [
+        start_waiter(scheduler, GenerationScheduler.PRELOAD, admitted),
+        start_waiter(scheduler, GenerationScheduler.PREFETCH, admitted, 'prefetch-1'),
+        start_waiter(scheduler, GenerationScheduler.INTERACTIVE, admitted),
+        start_waiter(scheduler, GenerationScheduler.PREFETCH, admitted, 'prefetch-2'),
+    ]
+
+    scheduler.release(held)
+    for thread in threads:
+        thread.join(5)
+
+    assert admitted == ['interactive', 'prefetch-1', 'prefetch-2', 'preload']
+
+
+def test_boost_moves_a_queued_call_ahead():
+    scheduler = make_scheduler()
+    held = scheduler.acquire(10)
+    admitted = []
+    first = start_waiter(scheduler, GenerationScheduler.PREFETCH, admitted)
+    boosted = start_waiter(scheduler, GenerationScheduler.PRELOAD, admitted)
+
+    scheduler.boost(boosted.ident)
+    scheduler.release(held)
+    for thread in (first, boosted):
+        thread.join(5)
+
+    assert admitted == ['preload', 'prefetch']
+    assert scheduler.get_stats()['boosted'] == 1
+
+
+def test_acquire_times_out_and_leaves_the_queue():
+    scheduler = make_scheduler()
+    held = scheduler.acquire(10)
+
+    started = time.monotonic()
+    with pytest.raises(GenerationQueueTimeout):
+        scheduler.acquire(10, timeout=0.1)
+    assert time.monotonic() - started < 1
+
+    stats = scheduler.get_stats()
+    assert stats['queued'] == 0
+    assert stats['interactive']['timed_out'] == 1
+
+    scheduler.release(held)
+    scheduler.release(scheduler.acquire(10, timeout=0.1))
+
+
+def test_background_classes_keep_headroom_for_interactive_calls():
+    scheduler = make_scheduler(max_concurrency=4, background_share=0.5)
+    with scheduler.priority(GenerationScheduler.PRELOAD):
+        background = [scheduler.acquire(10), scheduler.acquire(10)]
+        with pytest.raises(GenerationQueueTimeout):
+            scheduler.acquire(10, timeout=0.05)
+
+    interactive = scheduler.acquire(10, timeout=0.05)
+    assert scheduler.get_stats()['running'] == {'interactive': 1, 'prefetch': 0, 'preload': 2}
+    for ticket in background + [interactive]:
+        scheduler.release(ticket)
+
+
+def test_requests_per_minute_budget():
+    scheduler = make_scheduler(max_concurrency=4, requests_per_minute=2)
+    for _ in range(2):
+        scheduler.release(scheduler.acquire(10))
+    with pytest.raises(GenerationQueueTimeout):
+        scheduler.acquire(10, timeout=0.05)
+
+
+def test_tokens_per_minute_budget_uses_actual_usage():
+    scheduler = make_scheduler(max_concurrency=4, tokens_per_minute=100)
+    ticket = scheduler.acquire(80)
+    with pytest.raises(GenerationQueueTimeout):
+        scheduler.acquire(30, timeout=0.05)
+
+    # The estimate is replaced by what the call really used
+    scheduler.release(ticket, tokens_used=20)
+    scheduler.release(scheduler.acquire(30, timeout=0.05))
+    assert scheduler.get_stats()['tokens_last_minute'] == 50
+
+
+def test_oversized_call_is_admitted_alone():
+    scheduler = make_scheduler(tokens_per_minute=100)
+    scheduler.release(scheduler.acquire(500, timeout=0.05))
@@ -0,0 +1,42 @@
+import pytest
+
+from main import JSONExtractionError, JSONExtractor
+
+
+@pytest.mark.parametrize('text, expected, method', [
+    ('{"title": "Stacks"}', {'title': 'Stacks'}, 'direct'),
+    ('```json\n{"title": "Stacks"}\n```', {'title': 'Stacks'}, 'fenced'),
+    ('Here is the concept: {"title": "Stacks"} Hope it helps {really}.', {'title': 'Stacks'}, 'embedded'),
+    ('{"title": "Stacks", "hints": ["a", "b",],}', {'title': 'Stacks', 'hints': ['a', 'b']}, 'repaired'),
+])
+def test_recovers_wrapped_responses(text, expected, method):
+    assert JSONExtractor.parse(text) == (expected, method)
+
+
+def test_fence_ending_inside_a_string_falls_back_to_the_whole_text():
+    text = '```json\n{"code": "```python\\nprint(1)\\n```", "title": "Stacks"}\n```'
+    value, _ = JSONExtractor.parse(text)
+    assert value == {'code': '```python\nprint(1)\n```', 'title': 'Stacks'}
+
+
+def test_prose_braces_before_the_object_are_skipped():
+    value, method = JSONExtractor.parse('Use {curly} braces. {"title": "Queues"}')
+    assert (value, method) == ({'title': 'Queues'}, 'embedded')
+
+
+def test_truncated_object_keeps_its_complete_members():
+    value, method = JSONExtractor.parse('{"title": "Heaps", "hints": ["first", "second"], "solution": "def so')
+    assert method == 'repaired'
+    assert value == {'title': 'Heaps', 'hints': ['first', 'second']}
+
+
+def test_unrecoverable_text_raises_and_is_counted():
+    extractor = JSONExtractor()
+    with pytest.raises(JSONExtractionError):
+        extractor.extract('Sorry, I cannot help with that.')
+    extractor.extract('{"title": "Tries"}')
+
+    stats = extractor.get_stats()
+    assert stats['unrecoverable'] == 1
+    assert stats['direct'] == 1
+    assert stats['recovery_rate'] == 0.0
@@ -0,0 +1,45 @@
+import time
+
+from flask import Response
+
+import main
+from main import Metrics
+
+STREAM_SECONDS = 0.2
+
+
+@main.app.route('/_test/stream')
+def slow_stream():
+    def chunks():
+        yield 'data: first\n\n'
+        time.sleep(STREAM_SECONDS)
+        yield 'data: last\n\n'
+    return Response(chunks(), mimetype='text/event-stream')
+
+
+def duration_series(endpoint):
+    prefix = f'algolearn_http_request_duration_seconds_sum{{endpoint="{endpoint}",method="GET",status="200"}} '
+    return [float(line[len(prefix):]) for line in main.metrics.render().splitlines() if line.startswith(prefix)]
+
+
+def test_render_uses_the_prometheus_text_format():
+    metrics = Metrics()
+    metrics.inc('llm_requests_total', (('outcome', 'success'),), 2)
+    metrics.observe('phase_duration_seconds', 0.03, (('phase', 'llm_call'),))
+    lines = metrics.render().splitlines()
+
+    assert '# TYPE algolearn_llm_requests_total counter' in lines
+    assert 'algolearn_llm_requests_total{outcome="success"} 2' in lines
+    assert 'algolearn_phase_duration_seconds_bucket{phase="llm_call",le="0.025"} 0' in lines
+    assert 'algolearn_phase_duration_seconds_bucket{phase="llm_call",le="0.05"} 1' in lines
+    assert 'algolearn_phase_duration_seconds_count{phase="llm_call"} 1' in lines
+
+
+def test_streamed_responses_are_timed_to_the_last_chunk():
+    client = main.app.test_client()
+    response = client.get('/_test/stream')
+    assert response.data.count(b'data:') == 2
+    assert duration_series('/_test/stream') == []
+
+    response.close()
+    assert duration_series('/_test/stream')[0] >= STREAM_SECONDS
@@ -0,0 +1,149 @@
+import asyncio
+import json
+import threading
+
+import openai
+import pytest
+from aiohttp import web
+
+from main import CircuitBreaker, CircuitOpenError, Config, GenerationQueueTimeout, GenerationScheduler, OpenAIService
+
+
+class FakeOpenAI:
+    """Minimal OpenAI-compatible chat server on a background event loop"""
+
+    def __init__(self):
+        self.requests = []
+        self.failures = 0
+        self.chunks = ['Hel', 'lo', ' world']
+        self.loop = asyncio.new_event_loop()
+        self.runner = None
+        self.url = None
+
+    async def chat(self, request):
+        body = await request.json()
+        self.requests.append(body)
+        if self.failures:
+            self.failures -= 1
+            return web.json_response({'error': {'message': 'overloaded', 'type': 'server_error'}}, status=503)
+        if body.get('stream'):
+            response = web.StreamResponse(headers={'Content-Type': 'text/event-stream'})
+            await response.prepare(request)
+            for text in self.chunks:
+                chunk = {'object': 'chat.completion.chunk', 'choices': [{'index': 0, 'delta': {'content': text}}]}
+                await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            await response.write(b"data: [DONE]\n\n")
+            return response
+        return web.json_response({
+            'object': 'chat.completion',
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': '  ' + ''.join(self.chunks) + '\n'},
+                         'finish_reason': 'stop'}],
+            'usage': {'prompt_tokens': 12, 'completion_tokens': 3, 'total_tokens': 15}
+        })
+
+    async def model(self, request):
+        return web.json_response({'id': request.match_info['model'], 'object': 'model'})
+
+    async def _start(self):
+        app = web.Application()
+        app.router.add_post('/v1/chat/completions', self.chat)
+        app.router.add_get('/v1/models/{model}', self.model)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        host, port = self.runner.addresses[0][:2]
+        self.url = f'http://{host}:{port}/v1'
+
+    def start(self):
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+        asyncio.run_coroutine_threadsafe(self._start(), self.loop).result(5)
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self.runner.cleanup(), self.loop).result(5)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+@pytest.fixture
+def server():
+    fake = FakeOpenAI()
+    fake.start()
+    yield fake
+    fake.stop()
+
+
+@pytest.fixture
+def service(server, monkeypatch):
+    # OpenAIService configures the module-wide client; restore it afterwards
+    monkeypatch.setattr(openai, 'api_key', openai.api_key)
+    monkeypatch.setattr(openai, 'api_base', openai.api_base)
+    monkeypatch.setattr(Config, 'OPENAI_API_KEY', 'test-key')
+    monkeypatch.setattr(Config, 'OPENAI_API_BASE', server.url)
+    monkeypatch.setattr(Config, 'OPENAI_RETRY_BASE_DELAY', 0.01)
+    monkeypatch.setattr(Config, 'OPENAI_CALL_TIMEOUT', 5)
+    service = OpenAIService()
+    yield service
+    if service.async_client is not None:
+        service.async_client.close()
+
+
+def test_chat_returns_the_stripped_message(service, server):
+    assert service.async_client is not None
+    assert service._chat('system', 'prompt', 100) == 'Hello world'
+
+    request = server.requests[0]
+    assert request['max_tokens'] == 100
+    assert [message['role'] for message in request['messages']] == ['system', 'user']
+    assert service.scheduler.get_stats()['tokens_last_minute'] == 15
+    assert service.async_client.get_stats()['calls'] == 1
+
+
+def test_chat_without_the_async_client(service, server):
+    service.async_client = None
+    assert service._chat('system', 'prompt', 100) == 'Hello world'
+    assert len(server.requests) == 1
+
+
+def test_chat_stream_yields_chunks_in_order(service, server):
+    assert list(service._chat_stream('system', 'prompt', 100)) == ['Hel', 'lo', ' world']
+    assert server.requests[0]['stream'] is True
+    assert service.scheduler.get_stats()['running']['interactive'] == 0
+
+
+def test_transient_errors_are_retried(service, server):
+    server.failures = 1
+    assert service._chat('system', 'prompt', 100) == 'Hello world'
+    assert len(server.requests) == 2
+    assert service.breaker.get_status()['failures'] == 1
+
+
+def test_breaker_stops_calls_after_repeated_failures(service, server, monkeypatch):
+    monkeypatch.setattr(Config, 'OPENAI_MAX_RETRIES', 0)
+    service.breaker.failure_threshold = 2
+    server.failures = 10
+
+    for _ in range(2):
+        with pytest.raises(openai.error.ServiceUnavailableError):
+            service._chat('system', 'prompt', 100)
+    with pytest.raises(CircuitOpenError):
+        service._chat('system', 'prompt', 100)
+
+    assert len(server.requests) == 2
+    assert not service.is_available()
+
+
+def test_queue_timeout_gives_the_half_open_trial_back(service, server, monkeypatch):
+    monkeypatch.setattr(Config, 'OPENAI_LATENCY_BUDGET', 0.1)
+    service.scheduler = GenerationScheduler(max_concurrency=1, requests_per_minute=0, tokens_per_minute=0)
+    service.breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=0, half_open_calls=1)
+    service.breaker.record_failure('boom')
+    held = service.scheduler.acquire(10)
+
+    with pytest.raises(GenerationQueueTimeout):
+        service._chat('system', 'prompt', 100)
+    assert service.breaker.get_status()['state'] == CircuitBreaker.HALF_OPEN
+    assert server.requests == []
+
+    service.scheduler.release(held)
+    assert service._chat('system', 'prompt', 100) == 'Hello world'
+    assert service.breaker.get_status()['state'] == CircuitBreaker.CLOSED
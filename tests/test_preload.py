@@ -0,0 +1,72 @@
+import threading
+import time
+
+import pytest
+
+import main
+from main import Config, PreloadManager
+
+ADMIN = {'X-Admin-Token': 'secret'}
+
+
+def wait_for(job, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while job.status != 'completed':
+        assert time.monotonic() < deadline, 'preload job did not finish'
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    """A preload manager whose groups block until the test lets them finish"""
+    monkeypatch.setattr(Config, 'ADMIN_TOKEN', 'secret')
+    manager = PreloadManager(max_workers=2, rate_per_minute=0)
+    manager.release = threading.Event()
+
+    def run_group(job, group):
+        manager.release.wait(5)
+        for item in group:
+            job.finish_item(item, 'cached', 0.0)
+
+    monkeypatch.setattr(manager, '_run_group', run_group)
+    monkeypatch.setattr(main, 'preload_manager', manager)
+    yield manager
+    manager.release.set()
+
+
+def test_preload_requires_the_admin_token(manager):
+    client = main.app.test_client()
+    assert client.post('/api/preload', json={}).status_code == 403
+    assert client.post('/api/preload', json={}, headers={'X-Admin-Token': 'wrong'}).status_code == 403
+    assert manager.queue.qsize() == 0
+
+
+def test_only_one_preload_runs_at_a_time(manager):
+    client = main.app.test_client()
+    started = client.post('/api/preload', json={'languages': ['python'], 'levels': [1, 2]}, headers=ADMIN)
+    assert started.status_code == 202
+    job_id = started.get_json()['job_id']
+
+    again = client.post('/api/preload', json={}, headers=ADMIN)
+    assert again.status_code == 409
+    assert again.get_json()['job_id'] == job_id
+
+    manager.release.set()
+    wait_for(manager.active)
+    status = client.get(f'/api/preload/{job_id}').get_json()
+    assert (status['status'], status['total'], status['cached']) == ('completed', 18, 18)
+
+
+def test_a_finished_job_lets_the_next_one_start(manager):
+    manager.release.set()
+    first, created = manager.submit(['python'], [1])
+    assert created
+    wait_for(first)
+
+    second, created = manager.submit(['python'], [1])
+    assert created and second is not first
+
+
+def test_preload_workers_do_not_block_shutdown(manager):
+    workers = [thread for thread in threading.enumerate() if thread.name.startswith('preload-')]
+    assert workers and all(thread.daemon for thread in workers)
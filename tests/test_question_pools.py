@@ -0,0 +1,87 @@
+import pytest
+
+import main
+from main import QuestionVariantPools
+
+CHAPTER = {'id': 1, 'name': 'Arrays & Strings', 'topics': ['arrays']}
+
+
+def question(problem_id, title=None):
+    return {'problem_id': problem_id, 'title': title or f'Problem {problem_id}',
+            'description': f'Solve problem {problem_id} with a distinct approach', 'solution': f'# {problem_id}'}
+
+
+@pytest.fixture
+def pools(monkeypatch):
+    pools = QuestionVariantPools(size=4, max_size=4, low_water=1, workers=0)
+    primary = question('p0')
+    monkeypatch.setattr(main, 'load_question', lambda chapter, language, level: primary)
+    monkeypatch.setattr(main.cache, 'get_question', lambda chapter_id, language, level: primary)
+    pools._merge(QuestionVariantPools.pool_key(1, 'python', 1), [primary] + [question(f'p{i}') for i in range(1, 4)])
+    return pools
+
+
+def test_a_user_walks_every_variant_before_repeating(pools):
+    seen = [pools.serve(CHAPTER, 'python', 1, 'ada')['problem_id']]
+    seen += [pools.serve(CHAPTER, 'python', 1, 'ada', advance=True)['problem_id'] for _ in range(3)]
+
+    assert sorted(seen) == ['p0', 'p1', 'p2', 'p3']
+    assert pools.serve(CHAPTER, 'python', 1, 'ada', advance=True)['problem_id'] == seen[0]
+    assert pools.get_stats()['exhausted'] == 1
+
+
+def test_a_user_keeps_their_variant_until_advancing(pools):
+    first = pools.serve(CHAPTER, 'python', 1, 'grace')
+    assert pools.serve(CHAPTER, 'python', 1, 'grace') is first
+
+
+def test_users_start_at_different_variants(pools):
+    starts = {pools.serve(CHAPTER, 'python', 1, f'user-{i}')['problem_id'] for i in range(20)}
+    assert len(starts) > 1
+
+
+def test_find_returns_served_variants(pools):
+    assert pools.find(1, 'python', 1, 'p2')['solution'] == '# p2'
+
+
+def test_find_miss_does_not_create_a_pool(pools):
+    for level in range(1, 200):
+        assert pools.find(99, 'python', level, 'unknown') is None
+    assert pools.get_stats()['pools'] == 1
+
+
+@pytest.mark.parametrize('path, body, status', [
+    ('/api/chapters/1/validate', {'code': 'x', 'level': 11}, 400),
+    ('/api/chapters/1/validate', {'code': 'x', 'level': '3'}, 400),
+    ('/api/chapters/1/validate', {'code': 'x', 'level': True}, 400),
+    ('/api/chapters/42/validate', {'code': 'x', 'level': 1, 'problem_id': 'p'}, 404),
+])
+def test_validate_checks_chapter_and_level(path, body, status):
+    assert main.app.test_client().post(path, json=body).status_code == status
+    assert main.question_pools.get_stats()['pools'] == 0
+
+
+@pytest.mark.parametrize('path, status', [
+    ('/api/chapters/1/questions/0/solution?problem_id=p', 400),
+    ('/api/chapters/1/questions/4000/solution?problem_id=p', 400),
+    ('/api/chapters/42/questions/1/solution?problem_id=p', 404),
+])
+def test_solution_checks_chapter_and_level(path, status):
+    assert main.app.test_client().get(path).status_code == status
+    assert main.question_pools.get_stats()['pools'] == 0
+
+
+def test_fallback_questions_are_served_but_not_pooled(monkeypatch):
+    pools = QuestionVariantPools(size=2, max_size=2, low_water=1, workers=0)
+    template = {**question('arrays_1_fallback'), 'is_fallback': True}
+    monkeypatch.setattr(main, 'load_question', lambda chapter, language, level: template)
+    monkeypatch.setattr(main.cache, 'get_question', lambda chapter_id, language, level: template)
+
+    assert pools.serve(CHAPTER, 'python', 1, 'ada') is template
+    assert pools.find(1, 'python', 1, 'arrays_1_fallback') is None
+
+    # Once the provider is back, the generated question replaces the template for everyone
+    generated = question('p0')
+    monkeypatch.setattr(main, 'load_question', lambda chapter, language, level: generated)
+    assert pools.serve(CHAPTER, 'python', 1, 'ada', advance=True) is generated
+    assert pools.get_stats()['variants'] == 1
@@ -0,0 +1,88 @@
+import gzip
+import json
+
+import pytest
+
+import main
+from main import Config, ResponseCache
+
+CONCEPT = {'title': 'Arrays', 'overview': 'Contiguous storage ' * 100, 'theory_content': 'Indexing is O(1).',
+           'learning_objectives': ['Index'], 'code_examples': [{'code': 'a[0]'}], 'key_takeaways': ['Fast reads']}
+
+
+@pytest.fixture
+def concept(monkeypatch):
+    """Serve a fixed concept object through a fresh response cache"""
+    served = {'concept': CONCEPT}
+    monkeypatch.setattr(main, 'response_cache', ResponseCache(max_entries=10, max_bytes=1 << 20))
+    monkeypatch.setattr(main, 'load_concept', lambda chapter, language: served['concept'])
+    return served
+
+
+def get(headers=None):
+    return main.app.test_client().get('/api/chapters/1/concept?language=python', headers=headers or {})
+
+
+def test_a_matching_etag_gets_304(concept):
+    first = get()
+    assert first.status_code == 200
+    assert first.headers['Cache-Control'] == 'no-cache'
+    etag = first.headers['ETag']
+
+    again = get({'If-None-Match': etag})
+    assert again.status_code == 304
+    assert again.data == b''
+    assert again.headers['ETag'] == etag
+    assert main.response_cache.get_stats()['not_modified'] == 1
+    assert get({'If-None-Match': '"something-else"'}).status_code == 200
+
+
+def test_the_payload_is_serialized_once_while_the_content_is_unchanged(concept):
+    etag = get().headers['ETag']
+    assert get().headers['ETag'] == etag
+    assert main.response_cache.get_stats()['builds'] == 1
+
+    # Regenerated content is a new object, so the old representation is dropped
+    concept['concept'] = {**CONCEPT, 'title': 'Arrays, revised'}
+    changed = get({'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
+    assert changed.get_json()['concept']['title'] == 'Arrays, revised'
+
+
+def test_compressed_representations_have_their_own_etag(concept, monkeypatch):
+    monkeypatch.setattr(main, 'brotli', None)
+    plain = get()
+    compressed = get({'Accept-Encoding': 'gzip'})
+
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert compressed.headers['Vary'] == 'Accept-Encoding'
+    assert compressed.headers['ETag'] == plain.headers['ETag'][:-1] + '-gzip"'
+    assert json.loads(gzip.decompress(compressed.data)) == plain.get_json()
+    # A validator for either coding revalidates the entry
+    assert get({'Accept-Encoding': 'gzip', 'If-None-Match': plain.headers['ETag']}).status_code == 304
+
+
+def test_small_bodies_are_not_compressed(concept, monkeypatch):
+    monkeypatch.setattr(Config, 'RESPONSE_COMPRESS_MIN_BYTES', 1 << 20)
+    assert 'Content-Encoding' not in get({'Accept-Encoding': 'gzip, br'}).headers
+
+
+@pytest.mark.parametrize('header, expected', [
+    ('"abc"', True),
+    ('W/"abc"', True),
+    ('"abc-gzip"', True),
+    ('"zzz", "abc-br"', True),
+    ('*', True),
+    ('"abcd"', False),
+    ('', False),
+])
+def test_if_none_match_parsing(header, expected):
+    assert ResponseCache.matches(header, {'etag': 'abc'}) is expected
+
+
+def test_encoding_negotiation(monkeypatch):
+    monkeypatch.setattr(main, 'brotli', None)
+    assert ResponseCache.choose_encoding('gzip;q=0, deflate', 4096) == 'identity'
+    assert ResponseCache.choose_encoding('br, gzip', 4096) == 'gzip'
+    assert ResponseCache.choose_encoding('gzip', 10) == 'identity'
@@ -0,0 +1,114 @@
+import socket
+
+import pytest
+
+import main
+from main import Config
+
+QUESTION = {
+    'function_signature': 'def solve(nums):',
+    'test_cases': [
+        {'input': '[3, 1, 2]', 'expected_output': '6'},
+        {'input': '[]', 'expected_output': '0'},
+    ]
+}
+
+
+def run(code, question=QUESTION):
+    outcome = main.execution_engine.run(code, question, 'python')
+    if outcome.get('status') == 'sandbox_error':
+        pytest.skip('the code sandbox cannot isolate processes on this host')
+    return outcome
+
+
+def probe(body):
+    """A submission that runs body and reports 'blocked' when it raises"""
+    return ('def solve(nums):\n    try:\n' + ''.join(f'        {line}\n' for line in body.splitlines()) +
+            '    except Exception:\n        return "blocked"\n')
+
+
+@pytest.fixture(autouse=True)
+def quick_limits(monkeypatch):
+    monkeypatch.setattr(Config, 'PROFILE_ENABLED', False)
+    monkeypatch.setattr(Config, 'EXECUTION_CPU_SECONDS', 2)
+    monkeypatch.setattr(Config, 'EXECUTION_TEST_SECONDS', 1)
+    monkeypatch.setattr(Config, 'EXECUTION_WALL_SECONDS', 10)
+
+
+def test_correct_and_wrong_submissions():
+    assert run('def solve(nums):\n    return sum(nums)\n')['passed'] == 2
+    outcome = run('def solve(nums):\n    return len(nums)\n')
+    assert outcome['passed'] == 1
+    assert [result['status'] for result in outcome['test_results']] == ['failed', 'passed']
+
+
+def test_compile_errors_and_exceptions_are_reported():
+    assert run('def solve(nums)\n    return 1\n')['status'] == 'compile_error'
+    results = run('def solve(nums):\n    return 1 // len(nums)\n')['test_results']
+    assert results[1]['status'] == 'error' and 'ZeroDivisionError' in results[1]['error']
+
+
+def test_forged_results_on_stdout_are_ignored():
+    code = ('import json, sys\n'
+            'def solve(nums):\n'
+            '    print(json.dumps({"status": "ok", "test_results": [{"status": "returned", "value": "6"}] * 2}))\n'
+            '    sys.stdout.flush()\n'
+            '    return -1\n')
+    assert run(code)['passed'] == 0
+
+
+def test_objects_that_claim_equality_do_not_pass():
+    code = ('class Always:\n'
+            '    def __eq__(self, other):\n        return True\n'
+            '    def __repr__(self):\n        return "6"\n'
+            'def solve(nums):\n    return Always()\n')
+    assert run(code)['test_results'][1]['passed'] is False
+
+
+def test_infinite_loops_hit_the_per_test_limit():
+    outcome = run('def solve(nums):\n    while True:\n        pass\n')
+    assert outcome['passed'] == 0
+    assert {result['status'] for result in outcome['test_results']} <= {'timeout', 'cpu_limit', 'skipped'}
+
+
+def test_server_processes_and_environment_are_not_visible():
+    # The test process runs pytest; inside the sandbox no process should show up with that command line
+    code = probe('import glob, os\n'
+                 'if set(os.environ) - {"PATH", "PYTHONIOENCODING", "PWD", "LC_CTYPE"}:\n    return sorted(os.environ)\n'
+                 'for path in glob.glob("/proc/*/cmdline"):\n'
+                 '    try:\n'
+                 '        if b"pytest" in open(path, "rb").read():\n            return "leaked"\n'
+                 '    except OSError:\n        pass\n'
+                 'return "blocked"')
+    outcome = run(code, {**QUESTION, 'test_cases': QUESTION['test_cases'][:1]})
+    assert outcome['test_results'][0]['actual'] == "'blocked'"
+
+
+def test_the_application_source_is_hidden():
+    code = probe(f'open({main.__file__!r}).read()\nreturn "leaked"')
+    assert run(code, {**QUESTION, 'test_cases': QUESTION['test_cases'][:1]})['test_results'][0]['actual'] == "'blocked'"
+
+
+def test_the_network_is_unreachable():
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(1)
+    port = listener.getsockname()[1]
+    try:
+        code = probe(f'import socket\nsocket.create_connection(("127.0.0.1", {port}), timeout=0.5)\nreturn "leaked"')
+        outcome = run(code, {**QUESTION, 'test_cases': QUESTION['test_cases'][:1]})
+    finally:
+        listener.close()
+    assert outcome['test_results'][0]['actual'] == "'blocked'"
+
+
+def test_template_questions_are_not_graded_or_cached(monkeypatch):
+    template = {**QUESTION, 'problem_id': 'arrays_1_fallback', 'is_fallback': True}
+    monkeypatch.setattr(main.execution_engine, 'run', lambda *args: pytest.fail('template question was executed'))
+
+    analysis, cached = main.grade_submission(1, 'python', 1, template, 'def solve(nums):\n    return sum(nums)\n')
+
+    assert (analysis['graded'], analysis['correctness_score'], analysis['improvements']) == (False, None, [])
+    assert 'template' in analysis['feedback']
+    assert not cached
+    assert main.submission_cache.get_stats()['entries'] == 0
@@ -0,0 +1,122 @@
+import threading
+import time
+
+import fakeredis
+import pytest
+
+from main import Config, ContentCache, RedisContentStore, SingleFlight
+
+
+@pytest.fixture
+def redis_server(monkeypatch):
+    monkeypatch.setattr(Config, 'GENERATION_POLL_INTERVAL', 0.01)
+    return fakeredis.FakeServer()
+
+
+def make_worker(server):
+    """One app worker: its own in-process cache and flight, sharing Redis with the others"""
+    l2 = RedisContentStore(fakeredis.FakeStrictRedis(server=server), prefix='test:', default_ttl=60)
+    return SingleFlight(ContentCache(l2=l2), lease_ttl=5, wait_timeout=5)
+
+
+def slow_generator(flight, key, calls, delay=0.2):
+    def generate():
+        calls.append(threading.get_ident())
+        time.sleep(delay)
+        value = {'key': key, 'generation': len(calls)}
+        flight.cache.set(key, value)
+        return value
+    return generate
+
+
+def test_two_workers_generate_a_key_once(redis_server):
+    first, second = make_worker(redis_server), make_worker(redis_server)
+    calls, results = [], {}
+
+    leader = threading.Thread(target=lambda: results.setdefault(
+        'first', first.do('concept_1_python', slow_generator(first, 'concept_1_python', calls))))
+    leader.start()
+    while not first.cache.l2.lease_held('concept_1_python'):
+        time.sleep(0.005)
+    results['second'] = second.do('concept_1_python', slow_generator(second, 'concept_1_python', calls))
+    leader.join(5)
+
+    assert len(calls) == 1
+    assert results['first'] == results['second'] == {'key': 'concept_1_python', 'generation': 1}
+    assert second.get_stats()['remote_hits'] == 1
+    assert not first.cache.l2.lease_held('concept_1_python')
+
+
+def test_concurrent_callers_in_one_worker_share_a_call(redis_server):
+    flight = make_worker(redis_server)
+    calls, results = [], []
+    generate = slow_generator(flight, 'question_1_python_1', calls)
+
+    threads = [threading.Thread(target=lambda: results.append(flight.do('question_1_python_1', generate)))
+               for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert len(results) == 5 and all(result == results[0] for result in results)
+    assert flight.get_stats()['followers'] + flight.get_stats()['leaders'] == 5
+
+
+def test_refresh_gives_way_to_another_workers_lease(redis_server):
+    first, second = make_worker(redis_server), make_worker(redis_server)
+    assert first.cache.l2.acquire_lease('concept_2_java', 'other-worker', 5)
+
+    assert second.do('concept_2_java', lambda: pytest.fail('generated under a held lease'), refresh=True) is None
+
+
+def test_failed_generation_releases_the_lease(redis_server):
+    flight = make_worker(redis_server)
+
+    def generate():
+        raise RuntimeError('provider down')
+
+    with pytest.raises(RuntimeError):
+        flight.do('concept_3_cpp', generate)
+    assert not flight.cache.l2.lease_held('concept_3_cpp')
+    assert flight.get_stats()['in_flight'] == 0
+
+
+def test_do_many_skips_keys_leased_by_another_worker(redis_server):
+    first, second = make_worker(redis_server), make_worker(redis_server)
+    assert first.cache.l2.acquire_lease('question_1_python_2', 'other-worker', 5)
+    requested = []
+
+    def generate_many(keys):
+        requested.extend(keys)
+        return {key: {'key': key} for key in keys}
+
+    results = second.do_many(['question_1_python_2', 'question_1_python_3'], generate_many)
+
+    assert requested == ['question_1_python_3']
+    assert results == {'question_1_python_3': {'key': 'question_1_python_3'}}
+    assert not second.cache.l2.lease_held('question_1_python_3')
+
+
+def test_release_lease_only_drops_its_own_token(redis_server):
+    store = make_worker(redis_server).cache.l2
+    assert store.acquire_lease('concept_4_python', 'mine', 5)
+    assert not store.acquire_lease('concept_4_python', 'theirs', 5)
+
+    store.release_lease('concept_4_python', 'theirs')
+    assert store.lease_held('concept_4_python')
+    store.release_lease('concept_4_python', 'mine')
+    assert not store.lease_held('concept_4_python')
+
+
+def test_redis_store_round_trips_entries_with_their_generation_time(redis_server):
+    store = make_worker(redis_server).cache.l2
+    store.set_entries({'concept_5_python': ({'title': 'Stacks'}, 1234.5)}, ttl=30)
+    store.client.set('test:concept_6_python', b'not compressed json')
+
+    assert store.get_entries(['concept_5_python', 'concept_6_python', 'concept_7_python']) == {
+        'concept_5_python': ({'title': 'Stacks'}, 1234.5)
+    }
+    assert 0 < store.client.ttl('test:concept_5_python') <= 30
+    assert store.get_stats() == {'hits': 1, 'misses': 1, 'errors': 1}
@@ -0,0 +1,65 @@
+import pytest
+
+import main
+from main import SubmissionCache
+
+QUESTION = {
+    'function_signature': 'def solve(nums):',
+    'test_cases': [{'input': '[1, 2]', 'expected_output': '3'}],
+}
+
+
+def key(code, language='python', question=QUESTION):
+    return SubmissionCache().key(1, language, 1, question, code)
+
+
+def test_python_formatting_and_comments_share_a_key():
+    assert key('def solve(nums):\n    return sum(nums)\n') == key(
+        '# add them up\ndef solve( nums ):\n\n    return sum( nums )  # done\n')
+    assert key('def solve(nums):\n    return sum(nums)\n') != key('def solve(nums):\n    return max(nums)\n')
+
+
+def test_c_like_formatting_and_comments_share_a_key():
+    compact = 'int solve(int a,int b){return a+b;}'
+    spread = '// sum\nint solve(int a, int b)\n{\n    /* add */ return a + b;\n}\n'
+    assert key(compact, 'cpp') == key(spread, 'cpp')
+
+
+@pytest.mark.parametrize('left, right', [
+    ('return "a  b";', 'return "a b";'),
+    ('return "// not a comment";', 'return "";'),
+    ('return a - -b;', 'return a --b;'),
+    ('int x = 1;', 'intx = 1;'),
+])
+def test_c_like_normalisation_keeps_meaningful_differences(left, right):
+    assert key(left, 'java') != key(right, 'java')
+
+
+def test_a_changed_question_gets_a_new_key():
+    changed = {**QUESTION, 'test_cases': [{'input': '[1, 2]', 'expected_output': '4'}]}
+    code = 'def solve(nums):\n    return sum(nums)\n'
+    assert key(code) != key(code, question=changed)
+
+
+def test_only_load_independent_outcomes_are_cached():
+    cache = SubmissionCache()
+    cache.set('ok', {'score': 1}, {'status': 'ok'})
+    cache.set('timeout', {'score': 0}, {'status': 'wall_timeout'})
+    assert cache.get('ok') == {'score': 1}
+    assert cache.get('timeout') is None
+
+
+def test_a_reformatted_resubmission_skips_the_sandbox(monkeypatch):
+    monkeypatch.setattr(main, 'submission_cache', SubmissionCache())
+    runs = []
+
+    def run(code, question, language):
+        runs.append(code)
+        return {'supported': True, 'status': 'ok', 'test_results': [], 'passed': 1, 'total': 1}
+
+    monkeypatch.setattr(main.execution_engine, 'run', run)
+    _, cached = main.grade_submission(1, 'python', 1, QUESTION, 'def solve(nums):\n    return sum(nums)\n')
+    assert not cached
+    _, cached = main.grade_submission(1, 'python', 1, QUESTION, 'def solve(nums):  # again\n    return sum(nums)\n')
+    assert cached
+    assert len(runs) == 1